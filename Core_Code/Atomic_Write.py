@@ -0,0 +1,31 @@
+'''
+@desc:      Writes files atomically. Data is written to a temporary file next to
+            the target and renamed over it, so readers, including other nodes
+            sharing the directory over NFS, only ever see the old file or the
+            new one. Every writer gets its own temporary file, so concurrent
+            writers never interleave.
+'''
+
+import os
+import json
+import uuid
+
+
+'''
+DESC:   Writes json to a file atomically
+
+INPUT:  path:str
+            - The file to write
+        data
+            - The json-serializable data
+
+OUTPUT: None
+'''
+def writeJson(path:str, data):
+    tmp = '{0}.{1}.tmp'.format(path, uuid.uuid4().hex)
+    try:
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp): os.remove(tmp)
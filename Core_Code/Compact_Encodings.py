@@ -0,0 +1,155 @@
+'''
+@desc:      Converts the image cache to compact encodings, and benchmarks how
+            much memory each precision saves and how far it moves the results.
+            The packing itself lives in `Face_Matcher`; a scan keeps new cache
+            entries packed by setting `encoding_precision` on its
+            `Main_Model.Master_Model`.
+'''
+
+import os
+import sys
+import time
+import pickle
+import numpy as np
+import Main_Model
+import Face_Matcher
+
+CACHE_FILE = '../Data/Temp/Input_Cache.dat'
+
+
+'''
+DESC:   Measures the memory an object takes, including everything it holds
+
+INPUT:  obj
+            - A dictionary, list, tuple, numpy array, or plain value
+
+OUTPUT: The size in bytes
+'''
+def measureBytes(obj):
+    if isinstance(obj, np.ndarray):
+        # Views don't own their data, so count it separately
+        return sys.getsizeof(obj) + (obj.nbytes if obj.base is not None else 0)
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(measureBytes(k) + measureBytes(v) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(measureBytes(v) for v in obj)
+    return size
+
+
+'''
+DESC:   Packs every entry of an image cache and saves it
+
+INPUT:  precision:str = "float32"
+            - One of `Face_Matcher.PRECISIONS`
+        cacheFile:str = CACHE_FILE
+            - The image cache to convert
+        outFile:str = None
+            - Where the converted cache is saved. Defaults to replacing
+            `cacheFile`
+        verbose:bool = True
+            - Whether the sizes are printed
+
+OUTPUT: A tuple of the size of the cache file before and after, in bytes
+'''
+def compactCache(precision:str = "float32", cacheFile:str = CACHE_FILE, outFile:str = None,
+    verbose:bool = True):
+    if outFile is None: outFile = cacheFile
+    before = os.path.getsize(cacheFile)
+    cache = Main_Model.loadCache(cacheFile)
+
+    # Packing from an already packed entry would only lose more precision
+    if precision == "float64":
+        cache = {name: dict(entry, encodings = list(Main_Model.readCacheEntry(entry)[0]))
+            if type(entry) == dict else entry for name, entry in cache.items()}
+    else:
+        cache = {name: Main_Model.packCacheEntry(entry, precision) for name, entry in cache.items()}
+
+    if outFile == cacheFile:
+        # Entries other writers add meanwhile are kept, just not packed
+        Main_Model.mergeCache(cacheFile, cache)
+    else:
+        with open(outFile + '.tmp', 'wb') as f:
+            pickle.dump(cache, f, protocol = pickle.HIGHEST_PROTOCOL)
+        os.replace(outFile + '.tmp', outFile)
+
+    after = os.path.getsize(outFile)
+    if verbose:
+        print("Packed {0} cache entries as {1}: {2:,} bytes -> {3:,} bytes ({4:.1f}x smaller)".format(
+            len(cache), precision, before, after, before / after if after else 0))
+    return before, after
+
+
+'''
+DESC:   Compares every precision on an image cache: the memory the encodings
+        take, how fast the whole cache is matched against the gallery, and how
+        much the distances and results move from float64
+
+INPUT:  cacheFile:str = CACHE_FILE
+            - The image cache to benchmark on
+        pickleDir:str = "../Data/Temp/Portrait_Bin"
+            - Where the astronauts' facial data is kept
+        precisions:tuple = Face_Matcher.PRECISIONS
+            - The precisions to compare
+        tolerance:float = Face_Matcher.TOLERANCE
+            - The largest distance that counts as a match
+        verbose:bool = True
+            - Whether a table of the results is printed
+
+OUTPUT: A list with a dictionary for every precision, holding the "precision",
+        the in-memory "bytes" of every encoding and "bytesPerFace", the
+        "pickled" size of the cache, the "seconds" taken to match every photo,
+        the largest "distanceError", and the fraction of photos whose results
+        are "identical" to float64
+'''
+def benchmarkPrecisions(cacheFile:str = CACHE_FILE, pickleDir:str = "../Data/Temp/Portrait_Bin",
+    precisions:tuple = Face_Matcher.PRECISIONS, tolerance:float = Face_Matcher.TOLERANCE,
+    verbose:bool = True):
+    if pickleDir[-1] != "/": pickleDir += "/"
+    cache = Main_Model.loadCache(cacheFile)
+    # The float64 entries as a scan writes them, a list of arrays per photo
+    exact = {name: [np.array(e, dtype = np.float64) for e in Main_Model.readCacheEntry(entry)[0]]
+        for name, entry in cache.items()}
+    faces = sum(len(encodings) for encodings in exact.values())
+
+    exactGallery = Face_Matcher.loadGallery(pickleDir)
+    exactDistances = {name: Face_Matcher.faceDistances(exactGallery, encodings)
+        for name, encodings in exact.items()}
+    exactResults = {name: Face_Matcher.resolveMatches(exactGallery, distances, tolerance)
+        for name, distances in exactDistances.items()}
+
+    rows = []
+    for precision in precisions:
+        if precision == "float64": packed = exact
+        else: packed = {name: Face_Matcher.packEncodings(e, precision) for name, e in exact.items()}
+        gallery = Face_Matcher.loadGallery(pickleDir, precision)
+
+        start = time.time()
+        if precision == "float64":
+            distances = {name: Face_Matcher.faceDistances(gallery, e) for name, e in packed.items()}
+        else:
+            distances = {name: Face_Matcher.packedDistances(gallery["encodings"], e)
+                for name, e in packed.items()}
+        results = {name: Face_Matcher.resolveMatches(gallery, d, tolerance) for name, d in distances.items()}
+        elapsed = time.time() - start
+
+        error = max([float(np.abs(distances[name] - exactDistances[name]).max())
+            for name in distances if exactDistances[name].size] or [0.0])
+        size = sum(measureBytes(e) for e in packed.values())
+        rows.append({"precision": precision, "bytes": size, "bytesPerFace": size / faces if faces else 0,
+            "pickled": len(pickle.dumps(packed, protocol = pickle.HIGHEST_PROTOCOL)),
+            "seconds": round(elapsed, 4), "distanceError": error,
+            "identical": sum(results[n] == exactResults[n] for n in results) / len(results) if results else 1.0})
+
+    if verbose:
+        print("{0} photos, {1} faces, {2} astronauts".format(len(exact), faces, len(exactGallery["names"])))
+        print("precision  bytes/face  smaller  pickled      match s  max error  identical")
+        for row in rows:
+            print("{precision:<9}  {bytesPerFace:<10.1f}  {0:<7.1f}  {pickled:<11,}  {seconds:<7.3f}  "
+                "{distanceError:<9.2e}  {identical:.2%}".format(rows[0]["bytes"] / row["bytes"], **row))
+    return rows
+
+
+
+if __name__ == "__main__":
+    benchmarkPrecisions()
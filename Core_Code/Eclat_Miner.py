@@ -0,0 +1,204 @@
+'''
+@desc:      Finds frequent groups of astronauts of any size using the Eclat
+            algorithm. Every astronaut's photos are stored vertically as a
+            bitset (one bit per transaction), so the support of a group is the
+            popcount of the AND of its members' bitsets. Independent prefix
+            classes are mined in parallel worker processes.
+'''
+
+import math
+import itertools
+import multiprocessing as mp
+
+# int.bit_count only exists from python 3.10 onward
+if hasattr(int, "bit_count"):
+    popcount = int.bit_count
+else:
+    def popcount(bits:int):
+        return bin(bits).count("1")
+
+# Set in every worker by `initWorker` so the bitsets are only sent once
+_items = []
+_tidLists = []
+_minCount = 1
+_maxLength = 2
+
+
+'''
+DESC:   Builds the vertical bitset representation of a list of transactions
+
+INPUT:  transactions:list
+            - A list of lists, where each inner list is a list of astronauts in
+            each photo
+
+OUTPUT: A dictionary where keys are astronaut names and values are python ints
+        whose n-th bit is set if the astronaut is in the n-th transaction
+'''
+def buildTidLists(transactions:list):
+    tidLists = {}
+    for tid, transaction in enumerate(transactions):
+        bit = 1 << tid
+        for item in set(transaction):
+            tidLists[item] = tidLists.get(item, 0) | bit
+    return tidLists
+
+
+'''
+DESC:   Stores the frequent items and their bitsets in a worker process
+
+INPUT:  items:list
+            - The frequent astronauts, in mining order
+        tidLists:list
+            - The bitset for every item in `items`
+        minCount:int
+            - The minimum number of transactions a group must appear in
+        maxLength:int
+            - The largest group size to mine
+
+OUTPUT: None
+'''
+def initWorker(items:list, tidLists:list, minCount:int, maxLength:int):
+    global _items, _tidLists, _minCount, _maxLength
+    _items = items
+    _tidLists = tidLists
+    _minCount = minCount
+    _maxLength = maxLength
+
+
+'''
+DESC:   Depth-first search through an equivalence class. Every member of the
+        class shares the same prefix, and is extended by the members after it
+
+INPUT:  prefix:tuple
+            - The indices of the items shared by the whole class
+        members:list
+            - A list of (item index, bitset) tuples that extend the prefix
+        found:list
+            - The list that frequent itemsets are appended to
+
+OUTPUT: None
+'''
+def mineClass(prefix:tuple, members:list, found:list):
+    for i, (item, bits) in enumerate(members):
+        itemset = prefix + (item,)
+        found.append((itemset, popcount(bits)))
+        if len(itemset) >= _maxLength: continue
+
+        # Intersect with every later member to build the next class
+        nextClass = []
+        for other, otherBits in members[i+1:]:
+            joined = bits & otherBits
+            if popcount(joined) >= _minCount:
+                nextClass.append((other, joined))
+
+        if nextClass: mineClass(itemset, nextClass, found)
+
+
+'''
+DESC:   Mines every itemset whose smallest item is `index`. Each of these
+        prefix classes is independent of the others, so they can be mined in
+        separate processes
+
+INPUT:  index:int
+            - The index of the item that prefixes the class
+
+OUTPUT: A list of (tuple of names, count) for every frequent itemset of two or
+        more items in the class
+'''
+def minePrefix(index:int):
+    bits = _tidLists[index]
+    members = []
+    for other in range(index + 1, len(_items)):
+        joined = bits & _tidLists[other]
+        if popcount(joined) >= _minCount:
+            members.append((other, joined))
+
+    found = []
+    if _maxLength > 1: mineClass((index,), members, found)
+    return [(tuple(_items[i] for i in itemset), count) for itemset, count in found]
+
+
+'''
+DESC:   Finds every group of astronauts that appears together in at least
+        `minSupport` of the transactions
+
+INPUT:  transactions:list
+            - A list of lists, where each inner list is a list of astronauts in
+            each photo
+        minSupport:float = 0.01
+            - The minimum fraction of transactions a group must appear in
+        maxLength:int = 6
+            - The largest group size to mine
+        numProcesses:int = None
+            - The number of worker processes. Defaults to the number of cores
+
+OUTPUT: A dictionary where keys are tuples of names (sorted) and values are the
+        number of transactions that contain the whole group. Single astronauts
+        are included so that rules can be derived from the result
+'''
+def mineItemsets(transactions:list, minSupport:float = 0.01, maxLength:int = 6,
+    numProcesses:int = None):
+    minCount = max(1, math.ceil(minSupport * len(transactions)))
+    tidLists = buildTidLists(transactions)
+
+    # Mining rarer items first keeps the prefix classes small and balanced
+    items = [i for i in tidLists if popcount(tidLists[i]) >= minCount]
+    items.sort(key = lambda i: (popcount(tidLists[i]), i))
+    bits = [tidLists[i] for i in items]
+
+    itemsets = {(item,): popcount(tidLists[item]) for item in items}
+    if numProcesses is None: numProcesses = mp.cpu_count()
+    numProcesses = max(1, min(numProcesses, len(items)))
+
+    if numProcesses == 1:
+        initWorker(items, bits, minCount, maxLength)
+        classes = [minePrefix(i) for i in range(len(items))]
+    else:
+        with mp.Pool(numProcesses, initWorker, (items, bits, minCount, maxLength)) as pool:
+            classes = list(pool.imap_unordered(minePrefix, range(len(items))))
+
+    for found in classes:
+        for itemset, count in found:
+            itemsets[tuple(sorted(itemset))] = count
+
+    return itemsets
+
+
+'''
+DESC:   Derives association rules from frequent itemsets. Every non-empty
+        proper subset of a group is tried as the antecedent
+
+INPUT:  itemsets:dict
+            - The result of `mineItemsets`
+        numTransactions:int
+            - The number of transactions that were mined
+        minConfidence:float = 0.8
+            - The minimum confidence for a rule to be kept
+        minLift:float = 1.0
+            - The minimum lift for a rule to be kept
+        minLength:int = 2
+            - The smallest group size to build rules for
+
+OUTPUT: A list of dictionaries with "antecedent", "consequent", "support",
+        "confidence", and "lift" keys, sorted by group size and then lift
+'''
+def findRules(itemsets:dict, numTransactions:int, minConfidence:float = 0.8,
+    minLift:float = 1.0, minLength:int = 2):
+    rules = []
+    for itemset, count in itemsets.items():
+        if len(itemset) < max(2, minLength): continue
+        support = count / numTransactions
+
+        for size in range(1, len(itemset)):
+            for antecedent in itertools.combinations(itemset, size):
+                consequent = tuple(i for i in itemset if i not in antecedent)
+                confidence = count / itemsets[antecedent]
+                lift = confidence / (itemsets[consequent] / numTransactions)
+                if confidence < minConfidence or lift < minLift: continue
+
+                rules.append({"antecedent": list(antecedent),
+                    "consequent": list(consequent), "support": support,
+                    "confidence": confidence, "lift": lift})
+
+    rules.sort(key = lambda r: (-len(r["antecedent"]) - len(r["consequent"]), -r["lift"]))
+    return rules
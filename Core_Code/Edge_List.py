@@ -0,0 +1,219 @@
+'''
+@desc:      Typed edge list artifacts for astronaut pairs. Astronauts are stored
+            once in a names table and pairs refer to them by integer id, with
+            their count and metrics in a numpy structured array. Edge lists are
+            saved as a memory-mappable .npy file and as CSV, and the reader
+            also understands the older json files keyed by stringified tuples.
+'''
+
+import os
+import ast
+import csv
+import json
+import numpy as np
+
+# Metrics that are missing for a pair (such as the lift of a raw pair count)
+# are stored as NaN. "weight" is the proximity weight of a weighted pair count
+EDGE_DTYPE = np.dtype([("source", "<i4"), ("target", "<i4"), ("count", "<i8"),
+    ("support", "<f8"), ("confidence", "<f8"), ("lift", "<f8"), ("weight", "<f8")])
+METRICS = ("support", "confidence", "lift", "weight")
+
+
+'''
+DESC:   Parses a pair key written by `str((a, b))`. Unlike splitting on quotes,
+        this also handles names that contain apostrophes
+
+INPUT:  key
+            - A stringified tuple such as "('first_last&country', 'first_last&country')",
+            or a tuple, which is returned unchanged
+
+OUTPUT: A tuple of both astronauts
+'''
+def parseKey(key):
+    if isinstance(key, tuple): return key
+    return tuple(ast.literal_eval(key))
+
+
+'''
+DESC:   Converts a dictionary of pairs into a names table and an edge array
+
+INPUT:  pairs:dict
+            - A dictionary where keys are pairs of astronauts (tuples or
+            stringified tuples) and values are either counts or dictionaries
+            with "count", "support", "confidence", "lift" and/or "weight"
+
+OUTPUT: A tuple of the sorted list of astronaut names, and an array of
+        EDGE_DTYPE records
+'''
+def fromDict(pairs:dict):
+    keys = [parseKey(k) for k in pairs.keys()]
+    names = sorted({name for key in keys for name in key})
+    index = {name: i for i, name in enumerate(names)}
+
+    values = list(pairs.values())
+    edges = np.zeros(len(keys), dtype = EDGE_DTYPE)
+    edges["source"] = [index[key[0]] for key in keys]
+    edges["target"] = [index[key[-1]] for key in keys]
+    edges["count"] = [v.get("count", 0) if isinstance(v, dict) else v for v in values]
+    for field in METRICS:
+        edges[field] = [v.get(field, np.nan) if isinstance(v, dict) else np.nan
+            for v in values]
+
+    return names, edges
+
+
+'''
+DESC:   Converts an edge list back into a dictionary keyed by tuples of names
+
+INPUT:  names:list
+            - The names table
+        edges:np.ndarray
+            - An array of EDGE_DTYPE records
+        field:str = "count"
+            - The field to use as the value of every pair
+
+OUTPUT: A dictionary where keys are tuples of astronaut names and values are
+        the requested field
+'''
+def toDict(names:list, edges:np.ndarray, field:str = "count"):
+    sources, targets = edgeNames(names, edges)
+    return dict(zip(zip(sources.tolist(), targets.tolist()), edges[field].tolist()))
+
+
+'''
+DESC:   Looks up the names at both ends of every edge at once
+
+INPUT:  names:list
+            - The names table
+        edges:np.ndarray
+            - An array of EDGE_DTYPE records
+
+OUTPUT: A tuple of two arrays holding the source and target name of every edge
+'''
+def edgeNames(names:list, edges:np.ndarray):
+    table = np.asarray(names, dtype = object)
+    return table[edges["source"]], table[edges["target"]]
+
+
+'''
+DESC:   Saves an edge list. The names table is always saved as json next to the
+        edges. Files are written through temporary files so readers never see
+        a half-written artifact
+
+INPUT:  names:list
+            - The names table
+        edges:np.ndarray
+            - An array of EDGE_DTYPE records
+        fileName:str = "../Data/pairs"
+            - The filepath to save to, without an extension
+        formats:tuple = ("npy", "csv")
+            - The formats to save, "npy" and/or "csv"
+
+OUTPUT: None
+'''
+def saveEdges(names:list, edges:np.ndarray, fileName:str = "../Data/pairs",
+    formats:tuple = ("npy", "csv")):
+    with open(fileName + '_names.json.tmp', 'w') as f:
+        json.dump(list(names), f)
+    os.replace(fileName + '_names.json.tmp', fileName + '_names.json')
+
+    if "npy" in formats:
+        with open(fileName + '.npy.tmp', 'wb') as f:
+            np.save(f, np.ascontiguousarray(edges, dtype = EDGE_DTYPE))
+        os.replace(fileName + '.npy.tmp', fileName + '.npy')
+
+    if "csv" in formats:
+        sources, targets = edgeNames(names, edges)
+        with open(fileName + '.csv.tmp', 'w', newline = '') as f:
+            writer = csv.writer(f)
+            writer.writerow(["source", "target", "source_name", "target_name",
+                "count"] + list(METRICS))
+            for e in range(len(edges)):
+                writer.writerow([int(edges["source"][e]), int(edges["target"][e]),
+                    sources[e], targets[e], int(edges["count"][e])] +
+                    ['' if np.isnan(edges[m][e]) else repr(float(edges[m][e])) for m in METRICS])
+        os.replace(fileName + '.csv.tmp', fileName + '.csv')
+
+
+'''
+DESC:   Finds the modification time of a file
+
+INPUT:  path:str
+            - The filepath
+
+OUTPUT: The modification time in nanoseconds, or None if the file doesn't exist
+'''
+def modifiedTime(path:str):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+'''
+DESC:   Brings edges saved before a metric was added up to EDGE_DTYPE. The
+        missing metrics are NaN
+
+INPUT:  edges:np.ndarray
+            - An array of structured records
+
+OUTPUT: The edges as EDGE_DTYPE records. Edges that already are EDGE_DTYPE are
+        returned unchanged, so a memory-mapped array stays mapped
+'''
+def upgradeEdges(edges:np.ndarray):
+    if edges.dtype == EDGE_DTYPE: return edges
+    upgraded = np.zeros(len(edges), dtype = EDGE_DTYPE)
+    for field in METRICS: upgraded[field] = np.nan
+    for field in edges.dtype.names:
+        if field in EDGE_DTYPE.names: upgraded[field] = edges[field]
+    return upgraded
+
+
+'''
+DESC:   Loads an edge list, preferring the binary format. Falls back to CSV and
+        then to a json file keyed by stringified tuples. Every `saveEdges`
+        rewrites the names table first, so a .npy or .csv older than the names
+        table was left behind by an earlier save, and a json newer than it was
+        written after the last save. Stale artifacts are skipped. Edge lists
+        saved before a metric was added load with that metric as NaN
+
+INPUT:  fileName:str = "../Data/pairs"
+            - The filepath the edge list was saved to. A trailing file extension
+            is ignored
+        mmap:bool = True
+            - Whether the .npy file should be memory-mapped instead of read
+
+OUTPUT: A tuple of the names table and an array of EDGE_DTYPE records
+'''
+def loadEdges(fileName:str = "../Data/pairs", mmap:bool = True):
+    stem, extension = os.path.splitext(fileName)
+    if extension not in ('.npy', '.csv', '.json'): stem = fileName
+
+    saved = modifiedTime(stem + '_names.json')
+    written = modifiedTime(stem + '.json')
+    # A json written after the last save supersedes the binary artifacts
+    if saved is not None and written is not None and written > saved: saved = None
+
+    if saved is not None and (modifiedTime(stem + '.npy') or -1) >= saved:
+        with open(stem + '_names.json') as f:
+            names = json.load(f)
+        return names, upgradeEdges(np.load(stem + '.npy', mmap_mode = 'r' if mmap else None))
+
+    if saved is not None and (modifiedTime(stem + '.csv') or -1) >= saved:
+        with open(stem + '_names.json') as f:
+            names = json.load(f)
+        with open(stem + '.csv', newline = '') as f:
+            rows = list(csv.DictReader(f))
+
+        edges = np.zeros(len(rows), dtype = EDGE_DTYPE)
+        for field in ("source", "target", "count"):
+            edges[field] = [int(row[field]) for row in rows]
+        for field in METRICS:
+            edges[field] = [float(row[field]) if row.get(field) else np.nan for row in rows]
+        return names, edges
+
+    if written is not None:
+        with open(stem + '.json') as f:
+            return fromDict(json.load(f))
+
+    raise OSError('No edge list found for \"{0}\"'.format(fileName))
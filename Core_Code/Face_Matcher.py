@@ -0,0 +1,288 @@
+'''
+@desc:      Matches facial encodings against the whole astronaut gallery at
+            once. The gallery is loaded into a single matrix, so matching an
+            image (or a batch of images) is one distance computation instead of
+            a pickle load and two library calls per astronaut. Matches are
+            resolved exactly the way `Main_Model.Master_Model.findFaces` always
+            has, so results are unchanged.
+
+            Encodings can also be packed as float32, or quantized to int8 with
+            one float32 scale per face, and distances are worked out straight
+            from the packed form. float64 stays the default since it is the
+            only precision that reproduces earlier results exactly.
+'''
+
+import os
+import pickle
+import numpy as np
+
+# The same default as face_recognition.compare_faces
+TOLERANCE = 0.6
+
+# The precisions encodings can be packed in, from exact to smallest
+PRECISIONS = ("float64", "float32", "int8")
+
+# An int8 packed face, its codes and the scale they were quantized with, kept
+# together so a photo's faces are a single array
+INT8_FACE = np.dtype([("codes", np.int8, 128), ("scale", np.float32)])
+
+
+'''
+DESC:   Packs facial encodings into one compact array
+
+INPUT:  encodings
+            - A list or array of 128 dimension facial encodings
+        precision:str = "float32"
+            - One of `PRECISIONS`. int8 encodings are scaled per face so each
+            face's largest value becomes 127
+
+OUTPUT: A (faces x 128) array for float64 and float32, or an array of
+        `INT8_FACE` for int8
+'''
+def packEncodings(encodings, precision:str = "float32"):
+    faces = np.asarray(encodings, dtype = np.float64).reshape(len(encodings), 128)
+    if precision == "float64": return faces
+    if precision == "float32": return faces.astype(np.float32)
+    if precision == "int8":
+        scales = (np.abs(faces).max(axis = 1) / 127).astype(np.float32)
+        scales[scales == 0] = 1
+        packed = np.zeros(len(faces), dtype = INT8_FACE)
+        packed["codes"] = np.clip(np.round(faces / scales[:, None]), -127, 127)
+        packed["scale"] = scales
+        return packed
+    raise ValueError("Unknown precision {0}, expected one of {1}".format(precision, PRECISIONS))
+
+
+'''
+DESC:   Unpacks encodings from `packEncodings`
+
+INPUT:  packed
+            - Packed encodings, or a plain list of encodings
+
+OUTPUT: A (faces x 128) float64 array
+'''
+def unpackEncodings(packed):
+    if packedPrecision(packed) == "int8":
+        return packed["codes"].astype(np.float64) * packed["scale"].astype(np.float64)[:, None]
+    return np.asarray(packed, dtype = np.float64).reshape(len(packed), 128)
+
+
+'''
+DESC:   Finds the precision encodings are packed in
+
+INPUT:  packed
+            - Packed encodings, or a plain list of encodings
+
+OUTPUT: One of `PRECISIONS`
+'''
+def packedPrecision(packed):
+    if not isinstance(packed, np.ndarray): return "float64"
+    if packed.dtype == INT8_FACE: return "int8"
+    if packed.dtype == np.float32: return "float32"
+    return "float64"
+
+
+'''
+DESC:   Splits packed encodings into the vectors and per-face scales that
+        distances are worked out from, without unpacking int8 codes to float64
+
+INPUT:  packed
+            - Packed encodings, or a plain list of encodings
+
+OUTPUT: A tuple of a (faces x 128) array and a (faces) array of scales
+'''
+def packedTerms(packed):
+    if packedPrecision(packed) == "int8":
+        # Products of int8 codes are exact in float32
+        return packed["codes"].astype(np.float32), packed["scale"]
+    vectors = np.asarray(packed)
+    if vectors.dtype != np.float32: vectors = vectors.astype(np.float64)
+    vectors = vectors.reshape(len(packed), 128)
+    return vectors, np.ones(len(vectors), dtype = vectors.dtype)
+
+
+'''
+DESC:   Stacks the packed encodings of several photos into one array without
+        unpacking them, so a whole cache can be scored with `packedDistances`.
+        Encodings packed in different precisions are stacked in the most exact
+        one among them
+
+INPUT:  packedList:list
+            - The packed encodings of every photo, or plain lists of encodings
+
+OUTPUT: The packed encodings of every face, in order
+'''
+def stackEncodings(packedList:list):
+    packedList = [packed for packed in packedList if len(packed)]
+    if not packedList: return np.zeros((0, 128))
+    precision = min({packedPrecision(packed) for packed in packedList}, key = PRECISIONS.index)
+    return np.concatenate([packed if isinstance(packed, np.ndarray) and packedPrecision(packed) == precision
+        else packEncodings(unpackEncodings(packed), precision) for packed in packedList])
+
+
+'''
+DESC:   Finds the distance between every pair of packed encodings as
+        sqrt(|a|^2 + |b|^2 - 2ab), with the per-face scales applied to the dot
+        products rather than to the codes
+
+INPUT:  a
+            - The first set of packed encodings
+        b
+            - The second set of packed encodings
+
+OUTPUT: An (a x b) array of euclidean distances
+'''
+def packedDistances(a, b):
+    vectorsA, scalesA = packedTerms(a)
+    vectorsB, scalesB = packedTerms(b)
+    if len(vectorsA) == 0 or len(vectorsB) == 0: return np.zeros((len(vectorsA), len(vectorsB)))
+
+    dots = (vectorsA @ vectorsB.T) * scalesA[:, None] * scalesB[None, :]
+    normsA = np.einsum('ij,ij->i', vectorsA, vectorsA) * scalesA ** 2
+    normsB = np.einsum('ij,ij->i', vectorsB, vectorsB) * scalesB ** 2
+    return np.sqrt(np.maximum(normsA[:, None] + normsB[None, :] - 2 * dots, 0))
+
+
+'''
+DESC:   Loads every astronaut's facial encoding into one matrix
+
+INPUT:  pickleDir:str
+            - The directory the astronauts' .dat files are kept in
+        precision:str = "float64"
+            - The precision the encodings are packed in, see `packEncodings`
+
+OUTPUT: A dictionary with the astronaut "names", in the order their files are
+        listed, and their packed "encodings"
+'''
+def loadGallery(pickleDir:str, precision:str = "float64"):
+    names = []
+    encodings = []
+    for filename in os.listdir(pickleDir):
+        if filename.split('.')[-1] != "dat": continue
+        with open(pickleDir + filename, 'rb') as f:
+            data = pickle.load(f)
+        for name, encoding in data.items():
+            if not isinstance(encoding, np.ndarray): continue
+            names.append(name)
+            encodings.append(encoding)
+
+    return {"names": names, "encodings": packEncodings(encodings, precision)}
+
+
+'''
+DESC:   Finds the distance between every astronaut and every face
+
+INPUT:  gallery:dict
+            - A gallery from `loadGallery`
+        encodings:list
+            - The facial encodings found in an image
+
+OUTPUT: An (astronauts x faces) array of euclidean distances
+'''
+def faceDistances(gallery:dict, encodings:list):
+    if len(encodings) == 0 or len(gallery["names"]) == 0:
+        return np.zeros((len(gallery["names"]), len(encodings)))
+    if packedPrecision(gallery["encodings"]) != "float64" or packedPrecision(encodings) != "float64":
+        return packedDistances(gallery["encodings"], encodings)
+    faces = np.asarray(encodings, dtype = np.float64).reshape(len(encodings), -1)
+    # Same arithmetic as face_recognition.face_distance, one row per astronaut
+    return np.linalg.norm(gallery["encodings"][:, None, :] - faces[None, :, :], axis = 2)
+
+
+'''
+DESC:   Deletes the repeated faces in a photo. Every face goes to one
+        astronaut, following the same rules as the scanner always has
+
+INPUT:  faces:dict
+            - A dictionary where keys are astronauts and values are lists of
+            (face index, distance) tuples for the faces they matched
+
+OUTPUT: A dictionary where keys are astronauts and values are lists of the face
+        indices given to them
+'''
+def deleteRepeats(faces:dict):
+    unrepeated_faces = {}
+    seen_index = []
+
+    for k_1 in faces:
+        for t_1 in faces[k_1]:
+            current_index = t_1[0]
+            current_distance = t_1[1]
+            if current_index in seen_index: continue
+            seen_index.append(current_index)
+            entry = (k_1,current_index)
+            for k_2 in faces:
+                for t_2 in faces[k_2]:
+                    if current_index == t_2[0]:
+                        if t_2[1]< current_distance:
+                            entry = (k_2,current_index)
+        if entry[0] in unrepeated_faces:
+            if not entry[1] in unrepeated_faces[entry[0]]:
+                unrepeated_faces[entry[0]].append(entry[1])
+        else:
+            unrepeated_faces[entry[0]] = [entry[1]]
+    return unrepeated_faces
+
+
+'''
+DESC:   Picks out the matches in a distance matrix and resolves them
+
+INPUT:  gallery:dict
+            - A gallery from `loadGallery`
+        distances:np.ndarray
+            - An (astronauts x faces) distance matrix
+        tolerance:float = TOLERANCE
+            - The largest distance that counts as a match
+
+OUTPUT: A dictionary where keys are astronauts and values are lists of the face
+        indices given to them
+'''
+def resolveMatches(gallery:dict, distances:np.ndarray, tolerance:float = TOLERANCE):
+    faces = {}
+    for row in np.flatnonzero((distances <= tolerance).any(axis = 1)):
+        matched = np.flatnonzero(distances[row] <= tolerance)
+        faces[gallery["names"][row]] = [(int(i), distances[row, i]) for i in matched]
+    return deleteRepeats(faces)
+
+
+'''
+DESC:   Finds the astronauts in an image
+
+INPUT:  gallery:dict
+            - A gallery from `loadGallery`
+        encodings:list
+            - The facial encodings found in the image
+        tolerance:float = TOLERANCE
+            - The largest distance that counts as a match
+
+OUTPUT: A dictionary where keys are astronauts and values are lists of the face
+        indices given to them
+'''
+def matchFaces(gallery:dict, encodings:list, tolerance:float = TOLERANCE):
+    return resolveMatches(gallery, faceDistances(gallery, encodings), tolerance)
+
+
+'''
+DESC:   Finds the astronauts in several images with a single distance
+        computation
+
+INPUT:  gallery:dict
+            - A gallery from `loadGallery`
+        batch:list
+            - A list of the facial encodings found in each image
+        tolerance:float = TOLERANCE
+            - The largest distance that counts as a match
+
+OUTPUT: A list with the result of `matchFaces` for every image
+'''
+def matchBatch(gallery:dict, batch:list, tolerance:float = TOLERANCE):
+    counts = [len(encodings) for encodings in batch]
+    stacked = [e for encodings in batch for e in encodings]
+    distances = faceDistances(gallery, stacked)
+
+    results = []
+    start = 0
+    for count in counts:
+        results.append(resolveMatches(gallery, distances[:, start:start + count], tolerance))
+        start += count
+    return results
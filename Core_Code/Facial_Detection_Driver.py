@@ -4,42 +4,40 @@
             to simplify implimentation in future code.
 '''
 
+import Scan_Tuner
 import Main_Model
+import Gallery_Rematch
 import os
 import json
-import re
 
 
 '''
-DESC:   Finds all of the directory filepaths that you want to search in
+DESC:   Applies the native thread count of the tuned profile, if there is one,
+        to every scanning process started afterwards. Only a script run calls
+        this, so importing this module leaves the environment alone
 
-INPUT:  A string filepath to a directory as `directory`, and a bool that
-        determines whether you want to recursively include every sub-directory
-        in your search as `recursive`
+INPUT:  None
 
-OUTPUT: A list of filepaths
+OUTPUT: The profile, or None if there isn't one for this machine
 '''
-def findDir(directory:str, recursive:bool):
-    if recursive:
-        folder_list = os.walk(directory)
-        return [item[0] for item in folder_list]
-    else:
-        return [directory]
+def applyTunedProfile():
+    return Scan_Tuner.applyProfile(Scan_Tuner.loadProfile())
 
 
 '''
 DESC:   Gets all of the photo data in the given directory
 
 INPUT:  A instance of Main_Model as `model`, a string directory to search in as
-        `directory`, and a bool that determines whether you want to
-        recursively include every sub-directory in your search as `recursive`
+        `directory`, a bool that determines whether you want to recursively
+        include every sub-directory in your search as `recursive`, and a bool
+        that determines whether interrupted scans are resumed as `resume`
 
 OUTPUT: A list of photo data
 '''
-def getPhotoData(model:Main_Model, directory:str, recursive:bool):
+def getPhotoData(model:Main_Model, directory:str, recursive:bool, resume:bool = False):
     photos = {}
-    for f in findDir(directory, recursive):
-        model.findFacesDir(f + "/")
+    for f in Main_Model.findDir(directory, recursive):
+        model.findFacesDir(f + "/", resume = resume)
         photos[f] = model.purgeResults()
     return photos
 
@@ -52,30 +50,43 @@ INPUT:  A string filepath to the directory that contains the photos of
         filepath to the directory that contains the new photos to be scanned
         as `dataDir`,a string filepath where all of the pickled data should be
         stored as `pickleDir`, an int for the number of threads to be used for
-        multithreading as `numThreads`, a string filepath to a directory that
-        will be used to save all of the dumped files as `dumbDir`, and a bool
-        that determines whether you want to recursively include every
-        sub-directory in your search as `recursive`
+        multithreading as `numThreads` (taken from the `Scan_Tuner` profile,
+        or 4 if there isn't one, when left as None), a string filepath to a
+        directory that will be used to save all of the dumped files as
+        `dumbDir`, a bool that determines whether you want to recursively
+        include every sub-directory in your search as `recursive`, a bool that
+        determines whether a scan that died part of the way through continues
+        from its last checkpoint as `resume`, and a bool that determines
+        whether results already in `dumpDir` are re-matched against
+        astronauts that were added or retrained since as `rematch` (the first
+        re-match only records the gallery, see `Gallery_Rematch`)
 
 OUTPUT: None
 '''
-def runModel(trainDir:str, dataDir:str, pickleDir:str, numThreads:int = 4, dumpDir:str = "../Data/Scan_Result", recursive:bool = False):
+def runModel(trainDir:str, dataDir:str, pickleDir:str, numThreads:int = None, dumpDir:str = "../Data/Scan_Result", recursive:bool = False, resume:bool = False, rematch:bool = False):
     if trainDir[-1] != "/": trainDir += "/"
     if pickleDir[-1] != "/": pickleDir += "/"
 
+    profile = Scan_Tuner.loadProfile()
+    if numThreads is None: numThreads = profile["processes"] if profile else 4
+
     model = Main_Model.Master_Model(trainDir, pickleDir, numThreads)
-    photos = getPhotoData(model, dataDir, True)
+    if profile: model.upsample = profile["upsample"]
+    # Older results pick up newly trained astronauts without detecting again
+    if rematch:
+        Gallery_Rematch.rematchResults(pickleDir, dumpDir, model.main_cache,
+            model.cache_dir + '/Gallery_State.json', groupFile = model.cache_dir + '/Duplicate_Groups.json',
+            verbose = True)
+    photos = getPhotoData(model, dataDir, True, resume)
 
     if not os.path.exists(dumpDir):
         os.makedirs(dumpDir)
 
     for key in photos.keys():
-        # Find the name of the lowest level directory
-        dir = re.compile(r"/").split(key)[-1]
-        if(dir == ""): dir = "origin"
-        with open('{0}/{1}_result.json'.format(dumpDir, dir), 'w') as fp:
+        with open('{0}/{1}_result.json'.format(dumpDir, Main_Model.resultKey(key)), 'w') as fp:
             json.dump(photos[key], fp)
 
 if __name__ == "__main__":
+    applyTunedProfile()
     runModel(trainDir = "../Data/Portraits", dataDir = "../Data/Test_Input",
-        pickleDir = "../Data/Temp/Portrait_Bin", numThreads = 8, recursive = True)
+        pickleDir = "../Data/Temp/Portrait_Bin", recursive = True)
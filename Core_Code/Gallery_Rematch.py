@@ -0,0 +1,251 @@
+'''
+@desc:      Brings `Scan_Result` up to date after the astronaut gallery changes,
+            without detecting any faces again. A signature of every astronaut's
+            encoding is kept from the last time results were matched, so the
+            astronauts that were added, retrained, or removed since can be
+            found. Every cached facial encoding is then scored against only
+            those astronauts in one vectorized pass, and just the photos that
+            could have changed are matched again against the whole gallery and
+            rewritten. Photos a scan skipped as duplicates (see `Image_Dedup`)
+            are given the new entry of the photo that represents them.
+            `Market_Basket_Driver.updateModel` picks up the rewritten result
+            files on its next run.
+'''
+
+import os
+import json
+import time
+import hashlib
+import numpy as np
+import Main_Model
+import Face_Matcher
+import Image_Dedup
+from Atomic_Write import writeJson
+
+STATE_FILE = '../Data/Temp/Gallery_State.json'
+CACHE_FILE = '../Data/Temp/Input_Cache.dat'
+
+# The number of faces scored against the changed astronauts at a time
+CHUNK_SIZE = 1 << 16
+
+
+'''
+DESC:   Fingerprints every astronaut in a gallery
+
+INPUT:  gallery:dict
+            - A gallery from `Face_Matcher.loadGallery`
+
+OUTPUT: A dictionary where keys are astronauts and values are a hash of their
+        facial encoding
+'''
+def gallerySignature(gallery:dict):
+    return {name: hashlib.sha1(np.ascontiguousarray(encoding).tobytes()).hexdigest()
+        for name, encoding in zip(gallery["names"], gallery["encodings"])}
+
+
+'''
+DESC:   Finds the astronauts that changed between two gallery signatures
+
+INPUT:  old:dict
+            - The signature results were last matched with
+        new:dict
+            - The signature of the current gallery
+
+OUTPUT: A tuple of the astronauts that were added or retrained, and the
+        astronauts that were removed
+'''
+def galleryChanges(old:dict, new:dict):
+    changed = [name for name in new if old.get(name) != new[name]]
+    removed = [name for name in old if name not in new]
+    return changed, removed
+
+
+'''
+DESC:   Finds every cached face within the tolerance of any of some astronauts.
+        Chunks of faces are scored with `Face_Matcher.packedDistances` in the
+        precision they are cached in, so the whole archive is scored in a few
+        matrix products without unpacking it. This is only a filter; the
+        photos it finds are matched again exactly
+
+INPUT:  gallery:dict
+            - A gallery from `Face_Matcher.loadGallery`
+        rows:list
+            - The gallery rows of the astronauts to score against
+        faces:np.ndarray
+            - Every cached encoding, stacked by `Face_Matcher.stackEncodings`
+        tolerance:float = Face_Matcher.TOLERANCE
+            - The largest distance that counts as a match
+
+OUTPUT: A boolean array, true for every face that matched one of the
+        astronauts
+'''
+def scoreFaces(gallery:dict, rows:list, faces:np.ndarray, tolerance:float = Face_Matcher.TOLERANCE):
+    hits = np.zeros(len(faces), dtype = bool)
+    if len(rows) == 0 or len(faces) == 0: return hits
+
+    astros = gallery["encodings"][rows]
+    # A little slack so rounding can't drop a face sitting on the tolerance
+    limit = tolerance + 1e-6
+    for start in range(0, len(faces), CHUNK_SIZE):
+        chunk = faces[start:start + CHUNK_SIZE]
+        hits[start:start + len(chunk)] = (Face_Matcher.packedDistances(chunk, astros) <= limit).any(axis = 1)
+    return hits
+
+
+'''
+DESC:   Matches a cached photo against the whole gallery, giving the same
+        entry a scan would have written to `Scan_Result`
+
+INPUT:  gallery:dict
+            - A gallery from `Face_Matcher.loadGallery`
+        entry
+            - The photo's entry in the image cache
+        tolerance:float = Face_Matcher.TOLERANCE
+            - The largest distance that counts as a match
+
+OUTPUT: A list of the unrepeated faces, followed by the distances between
+        them if there are any
+'''
+def rematchEntry(gallery:dict, entry, tolerance:float = Face_Matcher.TOLERANCE):
+    encodings, locations = Main_Model.readCacheEntry(entry)
+    unrepeated = Face_Matcher.matchFaces(gallery, encodings, tolerance)
+    identified = [i for indices in unrepeated.values() for i in indices]
+    proximity = Main_Model.condenseDistances(Main_Model.custFaceDistance(locations), identified)
+    return [unrepeated] if proximity is None else [unrepeated, proximity]
+
+
+'''
+DESC:   Re-matches every cached photo in `Scan_Result` against the astronauts
+        that changed since the last re-match, and rewrites only the entries
+        whose astronauts changed. Duplicate photos are re-matched through the
+        photo that represents them. Photos that aren't in the image cache, and
+        aren't duplicates of one that is, are left alone, since they would
+        have to be detected again
+
+INPUT:  pickleDir:str = "../Data/Temp/Portrait_Bin"
+            - Where the astronauts' facial data is kept
+        dumpDir:str = "../Data/Scan_Result"
+            - Where the result jsons are kept
+        cacheFile:str = CACHE_FILE
+            - The image cache holding every photo's encodings
+        stateFile:str = STATE_FILE
+            - Where the gallery signature is kept between runs. Without one
+            the current signature is written and nothing is re-matched, since
+            there's no telling which astronauts the results were matched with
+        identities:list = None
+            - Astronauts to re-match no matter what the signature says
+        groupFile:str = Image_Dedup.GROUP_FILE
+            - The duplicate photos found by scans, see `Image_Dedup.saveGroups`
+        tolerance:float = Face_Matcher.TOLERANCE
+            - The largest distance that counts as a match
+        verbose:bool = False
+            - Whether a summary is printed
+
+OUTPUT: A dictionary with the "changed" and "removed" astronauts, the number of
+        cached "photos" scored, how many of them are "duplicates" of another
+        photo, the number of "rematched" photos, the number of "rewritten"
+        entries, the result "files" written, the number of "uncached" photos
+        skipped, and the "seconds" it took
+'''
+def rematchResults(pickleDir:str = "../Data/Temp/Portrait_Bin", dumpDir:str = "../Data/Scan_Result",
+    cacheFile:str = CACHE_FILE, stateFile:str = STATE_FILE, identities:list = None,
+    groupFile:str = Image_Dedup.GROUP_FILE, tolerance:float = Face_Matcher.TOLERANCE,
+    verbose:bool = False):
+    start = time.time()
+    if pickleDir[-1] != "/": pickleDir += "/"
+
+    gallery = Face_Matcher.loadGallery(pickleDir)
+    signature = gallerySignature(gallery)
+    old = signature
+    if os.path.exists(stateFile):
+        with open(stateFile) as f:
+            old = json.load(f)
+
+    changed, removed = galleryChanges(old, signature)
+    if identities is not None:
+        changed = sorted(set(changed) | (set(identities) & set(signature)))
+    summary = {"changed": changed, "removed": removed, "photos": 0, "duplicates": 0,
+        "rematched": 0, "rewritten": 0, "files": [], "uncached": 0}
+
+    resultFiles = []
+    if os.path.isdir(dumpDir):
+        resultFiles = sorted(f for f in os.listdir(dumpDir) if f.endswith('_result.json'))
+
+    if (changed or removed) and resultFiles:
+        cache = Main_Model.loadCache(cacheFile)
+        duplicates = Image_Dedup.loadGroups(groupFile)
+
+        results = {}
+        for filename in resultFiles:
+            with open('{0}/{1}'.format(dumpDir, filename)) as f:
+                results[filename] = json.load(f)
+
+        # Stack the encodings of every cached photo once, remembering whose
+        # they are. A duplicate shares the encodings of its representative
+        sources = []
+        positions = {}
+        photos = []
+        stacked = []
+        owners = []
+        for filename, entries in results.items():
+            for photo in entries:
+                source = photo if photo in cache else duplicates.get(photo)
+                if source not in cache:
+                    summary["uncached"] += 1
+                    continue
+                if source not in positions:
+                    positions[source] = len(sources)
+                    sources.append(source)
+                    encodings = Main_Model.readPackedEncodings(cache[source])
+                    owners.extend([positions[source]] * len(encodings))
+                    stacked.append(encodings)
+                photos.append((filename, photo, positions[source]))
+                if source != photo: summary["duplicates"] += 1
+        summary["photos"] = len(photos)
+
+        stale = set(changed) | set(removed)
+        faces = Face_Matcher.stackEncodings(stacked)
+        rows = [i for i, name in enumerate(gallery["names"]) if name in stale]
+        hits = scoreFaces(gallery, rows, faces, tolerance)
+        hitSources = set(np.asarray(owners, dtype = np.int64)[hits].tolist())
+
+        # Photos that already hold a changed or removed astronaut may lose it
+        affected = [i for i, (filename, photo, source) in enumerate(photos)
+            if source in hitSources or stale & set(results[filename][photo][0])]
+
+        touched = set()
+        rematched = {}
+        for i in affected:
+            filename, photo, source = photos[i]
+            if source not in rematched:
+                # Round trip through json so entries compare the way they're stored
+                rematched[source] = json.loads(json.dumps(
+                    rematchEntry(gallery, cache[sources[source]], tolerance)))
+            entry = rematched[source]
+            summary["rematched"] += 1
+            if entry == results[filename][photo]: continue
+            results[filename][photo] = entry
+            summary["rewritten"] += 1
+            touched.add(filename)
+
+        for filename in sorted(touched):
+            writeJson('{0}/{1}'.format(dumpDir, filename), results[filename])
+            summary["files"].append('{0}/{1}'.format(dumpDir, filename))
+
+    Main_Model.prepDir(os.path.dirname(stateFile) + '/')
+    writeJson(stateFile, signature)
+    summary["seconds"] = round(time.time() - start, 3)
+
+    if verbose:
+        print("Re-matched {0} of {1} cached photos against {2} changed and {3} removed "
+            "astronauts, rewrote {4} entries in {5} files in {6}s".format(summary["rematched"],
+            summary["photos"], len(changed), len(removed), summary["rewritten"],
+            len(summary["files"]), summary["seconds"]))
+        if summary["uncached"]:
+            print("\t{0} photos aren't cached and were left as they were".format(summary["uncached"]))
+    return summary
+
+
+
+if __name__ == "__main__":
+    rematchResults(verbose = True)
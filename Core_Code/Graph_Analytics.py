@@ -0,0 +1,409 @@
+'''
+@desc:      Analytics over the weighted astronaut co-occurrence graph. The graph
+            is held as a SciPy sparse matrix, and weighted degree, eigenvector
+            centrality, betweenness centrality (sampled for large graphs) and
+            Louvain communities are computed on it directly. Results are saved
+            next to the pair data and reused while the pairs don't change.
+'''
+
+import os
+import csv
+import json
+import hashlib
+import numpy as np
+import multiprocessing as mp
+from scipy import sparse
+from scipy.sparse import csgraph
+import Edge_List
+
+# Graphs with more astronauts than this sample the sources used for betweenness
+EXACT_LIMIT = 2000
+
+# Set in every worker by `initWorker`
+_lengths = None
+
+
+'''
+DESC:   Builds the symmetric weighted adjacency matrix of an edge list
+
+INPUT:  names:list
+            - The names table of the edge list
+        edges:np.ndarray
+            - The edges, as `Edge_List.EDGE_DTYPE` records
+
+OUTPUT: A CSR matrix where entry (i, j) is the number of photos astronauts i and
+        j share
+'''
+def buildMatrix(names:list, edges:np.ndarray):
+    n = len(names)
+    keep = edges["source"] != edges["target"]
+    rows = np.asarray(edges["source"][keep], dtype = np.int64)
+    cols = np.asarray(edges["target"][keep], dtype = np.int64)
+    weights = np.asarray(edges["count"][keep], dtype = np.float64)
+
+    # Duplicate pairs are summed when the matrix is converted
+    matrix = sparse.coo_matrix((np.concatenate([weights, weights]),
+        (np.concatenate([rows, cols]), np.concatenate([cols, rows]))), shape = (n, n))
+    return matrix.tocsr()
+
+
+'''
+DESC:   Computes eigenvector centrality by power iteration. The matrix is
+        shifted by the identity so the iteration also converges on bipartite
+        components
+
+INPUT:  matrix:sparse.csr_matrix
+            - The weighted adjacency matrix
+        maxIter:int = 1000
+            - The largest number of iterations
+        tol:float = 1e-9
+            - The change at which the iteration stops
+
+OUTPUT: An array of centralities with unit length
+'''
+def eigenvectorCentrality(matrix:sparse.csr_matrix, maxIter:int = 1000, tol:float = 1e-9):
+    n = matrix.shape[0]
+    if n == 0: return np.zeros(0)
+
+    x = np.full(n, 1.0 / np.sqrt(n))
+    for _ in range(maxIter):
+        last = x
+        x = matrix @ x + x
+        norm = np.linalg.norm(x)
+        if norm == 0: return x
+        x /= norm
+        if np.abs(x - last).sum() < n * tol: break
+
+    return x
+
+
+'''
+DESC:   Stores the graph in a worker process
+
+INPUT:  lengths:sparse.csr_matrix
+            - The graph with every edge's length, used for shortest paths
+
+OUTPUT: None
+'''
+def initWorker(lengths:sparse.csr_matrix):
+    global _lengths
+    _lengths = lengths
+
+
+'''
+DESC:   Accumulates Brandes dependencies for a batch of source astronauts
+
+INPUT:  sources:np.ndarray
+            - The astronauts to start shortest paths from
+
+OUTPUT: An array of summed dependencies for every astronaut
+'''
+def accumulateSources(sources:np.ndarray):
+    n = _lengths.shape[0]
+    coo = _lengths.tocoo()
+    total = np.zeros(n)
+    dist = csgraph.dijkstra(_lengths, directed = False, indices = sources)
+
+    for s, d in zip(sources, np.atleast_2d(dist)):
+        # An edge u -> v is on a shortest path if it leads straight to v
+        onPath = np.isclose(d[coo.row] + coo.data, d[coo.col]) & np.isfinite(d[coo.row])
+        preds = sparse.csr_matrix((np.ones(onPath.sum()), (coo.col[onPath], coo.row[onPath])),
+            shape = (n, n))
+
+        order = np.argsort(d, kind = 'stable')
+        order = order[np.isfinite(d[order])]
+
+        sigma = np.zeros(n)
+        sigma[s] = 1
+        for v in order[1:]:
+            sigma[v] = sigma[preds.indices[preds.indptr[v]:preds.indptr[v+1]]].sum()
+
+        delta = np.zeros(n)
+        for w in order[:0:-1]:
+            before = preds.indices[preds.indptr[w]:preds.indptr[w+1]]
+            delta[before] += sigma[before] / sigma[w] * (1 + delta[w])
+        delta[s] = 0
+        total += delta
+
+    return total
+
+
+'''
+DESC:   Computes betweenness centrality with Brandes' algorithm. Edges are as
+        long as the inverse of their weight, so astronauts that are often
+        photographed together are close. Large graphs only start shortest
+        paths from a random sample of astronauts and scale the result
+
+INPUT:  matrix:sparse.csr_matrix
+            - The weighted adjacency matrix
+        samples:int = None
+            - The number of sources to sample. Defaults to every astronaut up
+            to EXACT_LIMIT, and EXACT_LIMIT sources above it
+        seed:int = 0
+            - The seed used to sample sources
+        numProcesses:int = 1
+            - The number of worker processes
+
+OUTPUT: An array of betweenness centralities, normalized the same way as
+        networkx
+'''
+def betweennessCentrality(matrix:sparse.csr_matrix, samples:int = None, seed:int = 0,
+    numProcesses:int = 1):
+    n = matrix.shape[0]
+    if n < 3: return np.zeros(n)
+
+    lengths = matrix.copy()
+    lengths.data = 1.0 / lengths.data
+
+    if samples is None: samples = min(n, EXACT_LIMIT)
+    if samples >= n:
+        sources = np.arange(n)
+    else:
+        sources = np.sort(np.random.default_rng(seed).choice(n, samples, replace = False))
+
+    batches = np.array_split(sources, max(1, min(len(sources), numProcesses * 4)))
+    if numProcesses <= 1:
+        initWorker(lengths)
+        total = sum(accumulateSources(b) for b in batches)
+    else:
+        with mp.Pool(numProcesses, initWorker, (lengths,)) as pool:
+            total = sum(pool.map(accumulateSources, batches))
+
+    return total * (n / len(sources)) / ((n - 1) * (n - 2))
+
+
+'''
+DESC:   Runs one level of Louvain: every astronaut is repeatedly moved into the
+        neighboring community that most increases modularity, until no move
+        helps
+
+INPUT:  matrix:sparse.csr_matrix
+            - The weighted adjacency matrix of this level
+        resolution:float
+            - Higher values favor smaller communities
+        rng:np.random.Generator
+            - Decides the order astronauts are visited in
+
+OUTPUT: A tuple of the community of every node (numbered from 0), and whether
+        any node moved
+'''
+def louvainLevel(matrix:sparse.csr_matrix, resolution:float, rng):
+    n = matrix.shape[0]
+    degree = np.asarray(matrix.sum(axis = 1)).ravel()
+    total = degree.sum()
+    labels = np.arange(n)
+    communityDegree = degree.copy()
+
+    movedAny = False
+    improved = True
+    while improved:
+        improved = False
+        for i in rng.permutation(n):
+            start, end = matrix.indptr[i], matrix.indptr[i+1]
+            neighbors = matrix.indices[start:end]
+            weights = matrix.data[start:end]
+            others = neighbors != i
+
+            current = labels[i]
+            communityDegree[current] -= degree[i]
+            communities, inverse = np.unique(labels[neighbors[others]], return_inverse = True)
+            links = np.bincount(inverse, weights[others], len(communities))
+
+            gains = links - resolution * communityDegree[communities] * degree[i] / total
+            stay = -resolution * communityDegree[current] * degree[i] / total
+            stay += links[communities == current].sum()
+
+            best = current
+            if len(gains) and gains.max() > stay + 1e-12:
+                best = communities[np.argmax(gains)]
+                improved = movedAny = True
+
+            labels[i] = best
+            communityDegree[best] += degree[i]
+
+    return np.unique(labels, return_inverse = True)[1], movedAny
+
+
+'''
+DESC:   Finds communities with the Louvain method. Each level's communities
+        are collapsed into single nodes with a sparse product, and the next
+        level runs on the collapsed graph
+
+INPUT:  matrix:sparse.csr_matrix
+            - The weighted adjacency matrix
+        resolution:float = 1.0
+            - Higher values favor smaller communities
+        seed:int = 0
+            - Decides the order astronauts are visited in
+
+OUTPUT: A tuple of the community of every astronaut and the modularity of the
+        partition
+'''
+def louvainCommunities(matrix:sparse.csr_matrix, resolution:float = 1.0, seed:int = 0):
+    n = matrix.shape[0]
+    membership = np.arange(n)
+    if n == 0 or matrix.nnz == 0: return membership, 0.0
+
+    rng = np.random.default_rng(seed)
+    level = matrix
+    while True:
+        labels, moved = louvainLevel(level, resolution, rng)
+        if not moved: break
+        membership = labels[membership]
+
+        collapse = sparse.csr_matrix((np.ones(len(labels)), (np.arange(len(labels)), labels)))
+        level = (collapse.T @ level @ collapse).tocsr()
+
+    return membership, modularity(matrix, membership, resolution)
+
+
+'''
+DESC:   Computes the modularity of a partition
+
+INPUT:  matrix:sparse.csr_matrix
+            - The weighted adjacency matrix
+        membership:np.ndarray
+            - The community of every astronaut
+        resolution:float = 1.0
+            - The resolution the partition was found with
+
+OUTPUT: The modularity
+'''
+def modularity(matrix:sparse.csr_matrix, membership:np.ndarray, resolution:float = 1.0):
+    total = matrix.sum()
+    if total == 0: return 0.0
+
+    coo = matrix.tocoo()
+    inside = np.bincount(membership[coo.row], coo.data * (membership[coo.row] == membership[coo.col]))
+    degree = np.bincount(membership, np.asarray(matrix.sum(axis = 1)).ravel())
+    return float(inside.sum() / total - resolution * ((degree / total)**2).sum())
+
+
+'''
+DESC:   Finds how much of every astronaut's weighted degree links them to
+        astronauts of other countries
+
+INPUT:  matrix:sparse.csr_matrix
+            - The weighted adjacency matrix
+        names:list
+            - The names table, as 'first_last&country'
+
+OUTPUT: An array of fractions between 0 and 1
+'''
+def crossCountry(matrix:sparse.csr_matrix, names:list):
+    countries = np.unique([name.split('&')[-1] for name in names], return_inverse = True)[1]
+    coo = matrix.tocoo()
+    foreign = np.bincount(coo.row, coo.data * (countries[coo.row] != countries[coo.col]), len(names))
+    degree = np.asarray(matrix.sum(axis = 1)).ravel()
+    return np.divide(foreign, degree, out = np.zeros(len(names)), where = degree > 0)
+
+
+'''
+DESC:   Computes every metric for an edge list
+
+INPUT:  names:list
+            - The names table of the edge list
+        edges:np.ndarray
+            - The edges, as `Edge_List.EDGE_DTYPE` records
+        samples:int = None
+            - The number of betweenness sources, see `betweennessCentrality`
+        resolution:float = 1.0
+            - The Louvain resolution
+        seed:int = 0
+            - The seed for sampling and community detection
+        numProcesses:int = 1
+            - The number of worker processes used for betweenness
+
+OUTPUT: A dictionary with a row per astronaut under "astronauts", the
+        "communities" as lists of names, and their "modularity"
+'''
+def analyze(names:list, edges:np.ndarray, samples:int = None, resolution:float = 1.0,
+    seed:int = 0, numProcesses:int = 1):
+    matrix = buildMatrix(names, edges)
+    membership, score = louvainCommunities(matrix, resolution, seed)
+
+    # Communities are numbered from largest to smallest
+    sizes = np.bincount(membership)
+    rank = np.empty(len(sizes), dtype = np.int64)
+    rank[np.argsort(-sizes, kind = 'stable')] = np.arange(len(sizes))
+    membership = rank[membership]
+
+    metrics = {"degree": np.diff(matrix.indptr),
+        "weightedDegree": np.asarray(matrix.sum(axis = 1)).ravel(),
+        "eigenvector": eigenvectorCentrality(matrix),
+        "betweenness": betweennessCentrality(matrix, samples, seed, numProcesses),
+        "crossCountry": crossCountry(matrix, names),
+        "community": membership}
+
+    astronauts = [{"name": name} for name in names]
+    for metric, values in metrics.items():
+        for row, value in zip(astronauts, values.tolist()):
+            row[metric] = value
+
+    communities = [[] for _ in range(int(membership.max()) + 1 if len(names) else 0)]
+    for name, community in zip(names, membership.tolist()):
+        communities[community].append(name)
+
+    return {"astronauts": astronauts, "communities": communities, "modularity": score}
+
+
+'''
+DESC:   Analyzes the saved pair data and saves the result next to it, as json
+        and CSV. The result is only recomputed when the pairs or parameters
+        change
+
+INPUT:  pairFileName:str = "../Data/pairs"
+            - The edge list saved by `Market_Basket_Driver.findPairs`
+        fileName:str = "../Data/pairAnalytics"
+            - The filepath to save to, without an extension
+        samples:int = None
+            - The number of betweenness sources, see `betweennessCentrality`
+        resolution:float = 1.0
+            - The Louvain resolution
+        seed:int = 0
+            - The seed for sampling and community detection
+        numProcesses:int = 1
+            - The number of worker processes used for betweenness
+        verbose:bool = False
+            - Whether the function will output a status of what it's doing
+
+OUTPUT: The dictionary returned by `analyze`
+'''
+def analyzePairs(pairFileName:str = "../Data/pairs", fileName:str = "../Data/pairAnalytics",
+    samples:int = None, resolution:float = 1.0, seed:int = 0, numProcesses:int = 1,
+    verbose:bool = False):
+    names, edges = Edge_List.loadEdges(pairFileName)
+
+    sha = hashlib.sha1(json.dumps([names, samples, resolution, seed]).encode())
+    sha.update(np.ascontiguousarray(edges).tobytes())
+    key = sha.hexdigest()
+
+    if os.path.exists(fileName + '.json'):
+        with open(fileName + '.json') as f:
+            cached = json.load(f)
+        if cached.get("key") == key:
+            if verbose: print('Analytics are up to date')
+            return cached
+
+    if verbose: print('Analyzing {0} astronauts and {1} pairs'.format(len(names), len(edges)))
+    result = analyze(names, edges, samples, resolution, seed, numProcesses)
+    result["key"] = key
+
+    with open(fileName + '.json.tmp', 'w') as f:
+        json.dump(result, f)
+    os.replace(fileName + '.json.tmp', fileName + '.json')
+
+    columns = ["name", "degree", "weightedDegree", "eigenvector", "betweenness",
+        "crossCountry", "community"]
+    with open(fileName + '.csv.tmp', 'w', newline = '') as f:
+        writer = csv.DictWriter(f, columns)
+        writer.writeheader()
+        writer.writerows(result["astronauts"])
+    os.replace(fileName + '.csv.tmp', fileName + '.csv')
+
+    return result
+
+
+
+if __name__ == '__main__':
+    analyzePairs(verbose = True)
@@ -0,0 +1,191 @@
+'''
+@desc:      Exports the astronaut relations graph for interactive viewers. Every
+            astronaut keeps their country and how many photos they are in, and
+            every pair keeps how many photos they share and the lift of the
+            pairing. The graph can be written as GraphML, GEXF, or a compact
+            newline-delimited json format that browsers can read as a stream.
+'''
+
+import os
+import json
+import networkx as nx
+import Edge_List
+import Market_Basket_Driver as mbd
+
+# The file extension used for each export format
+EXTENSIONS = {"graphml": ".graphml", "gexf": ".gexf", "json": ".ndjson"}
+
+
+'''
+DESC:   Splits a scan result key into the display name and country of an
+        astronaut
+
+INPUT:  key:str
+            - A key such as 'first_last&country'
+
+OUTPUT: A tuple of the name, formatted as "first last", and the country
+'''
+def splitKey(key:str):
+    name, country = key.split('&')[0:2]
+
+    # Same workaround as `Graph_Generation_Driver.namesByCountry`
+    if country == "canda":
+        country = "canada"
+
+    return name.replace('_', ' '), country
+
+
+'''
+DESC:   Builds a weighted networkx graph of every astronaut and pairing
+
+INPUT:  rawFreq:dict
+            - A dictionary where keys are astronauts and values are the number
+            of photos they are in
+        pairs:tuple
+            - The names table and edge array of the astronaut pairs, as
+            returned by `Market_Basket_Driver.loadPairs`
+        numPhotos:int
+            - The number of photos that contain at least one astronaut, used to
+            compute lift
+        fp:list = None
+            - If given, only astronauts in this list of names are kept
+
+OUTPUT: A networkx graph whose nodes are astronaut names with "country" and
+        "frequency" attributes, and whose edges have "weight" and "lift"
+        attributes
+'''
+def buildGraph(rawFreq:dict, pairs:tuple, numPhotos:int, fp:list = None):
+    graph = nx.Graph()
+
+    for key, count in rawFreq.items():
+        name, country = splitKey(key)
+        if fp is not None and name not in fp: continue
+        if name in graph:
+            graph.nodes[name]["frequency"] += count
+        else:
+            graph.add_node(name, country = country, frequency = count)
+
+    # Only the names table is split, never the pairs themselves
+    names, edges = pairs
+    display = [splitKey(key)[0] for key in names]
+    sources, targets = Edge_List.edgeNames(display, edges)
+    for name1, name2, count in zip(sources.tolist(), targets.tolist(), edges["count"].tolist()):
+        if name1 == name2 or name1 not in graph or name2 not in graph: continue
+
+        weight = count
+        if graph.has_edge(name1, name2): weight += graph.edges[name1, name2]["weight"]
+
+        # Lift is how much more often the pair appears than if the two
+        # astronauts were photographed independently
+        expected = graph.nodes[name1]["frequency"] * graph.nodes[name2]["frequency"]
+        lift = weight * numPhotos / expected if expected else 0.0
+        graph.add_edge(name1, name2, weight = weight, lift = lift)
+
+    return graph
+
+
+'''
+DESC:   Writes a graph as newline-delimited json. The first line describes the
+        graph, followed by one line per node and one line per edge. Edges
+        refer to nodes by their index, so viewers can draw nodes as soon as
+        they arrive and add edges as the rest of the file streams in
+
+INPUT:  graph:nx.Graph
+            - A graph built by `buildGraph`
+        f
+            - An open text file to write to
+
+OUTPUT: None
+'''
+def writeStream(graph:nx.Graph, f):
+    index = {}
+    f.write(json.dumps({"type": "graph", "nodes": graph.number_of_nodes(),
+        "edges": graph.number_of_edges()}) + '\n')
+
+    for i, (name, attrs) in enumerate(graph.nodes(data = True)):
+        index[name] = i
+        f.write(json.dumps({"type": "node", "id": i, "name": name,
+            "country": attrs["country"], "frequency": attrs["frequency"]}) + '\n')
+
+    for name1, name2, attrs in graph.edges(data = True):
+        f.write(json.dumps({"type": "edge", "source": index[name1],
+            "target": index[name2], "weight": attrs["weight"],
+            "lift": round(attrs["lift"], 4)}) + '\n')
+
+
+'''
+DESC:   Writes a graph in one of the export formats. The file is written to a
+        temporary file first so viewers never load a half-written graph
+
+INPUT:  graph:nx.Graph
+            - A graph built by `buildGraph`
+        fileName:str
+            - The filepath to save to, without the extension
+        fmt:str = "graphml"
+            - Either "graphml", "gexf", or "json"
+
+OUTPUT: The filepath that was written
+'''
+def writeGraph(graph:nx.Graph, fileName:str, fmt:str = "graphml"):
+    if fmt not in EXTENSIONS:
+        raise ValueError("\'fmt\' must be one of {0}".format(', '.join(EXTENSIONS)))
+
+    path = fileName + EXTENSIONS[fmt]
+    if fmt == "graphml":
+        nx.write_graphml(graph, path + '.tmp')
+    elif fmt == "gexf":
+        nx.write_gexf(graph, path + '.tmp')
+    else:
+        with open(path + '.tmp', 'w') as f:
+            writeStream(graph, f)
+
+    os.replace(path + '.tmp', path)
+    return path
+
+
+'''
+DESC:   Exports the relations graph in every requested format, from counts
+        that were already made. Nothing is reloaded or recounted here, so the
+        graph pipeline can hand over its cached results
+
+INPUT:  rawFreq:dict
+            - A dictionary where keys are astronauts and values are the number
+            of photos they are in
+        pairs:tuple
+            - The names table and edge array of the astronaut pairs, as
+            returned by `Market_Basket_Driver.loadPairs`
+        numPhotos:int
+            - The number of photos that contain at least one astronaut
+        formats:tuple = ("graphml", "gexf", "json")
+            - The formats to write
+        fileName:str = "../Data/Astronaut_Relations"
+            - The filepath to save to, without the extension
+        fp:list = None
+            - If given, only astronauts in this list of names are exported, and
+            '_min' is added to the filename
+        verbose:bool = False
+            - Whether the function will output a status of what it's doing
+
+OUTPUT: A list of the filepaths that were written
+'''
+def exportGraph(rawFreq:dict, pairs:tuple, numPhotos:int,
+    formats:tuple = ("graphml", "gexf", "json"),
+    fileName:str = "../Data/Astronaut_Relations", fp:list = None, verbose:bool = False):
+    graph = buildGraph(rawFreq, pairs, numPhotos, fp)
+
+    if fp is not None: fileName += '_min'
+    written = []
+    for fmt in formats:
+        written.append(writeGraph(graph, fileName, fmt))
+        if verbose: print('Saved {0}'.format(written[-1]))
+
+    return written
+
+
+
+if __name__ == '__main__':
+    photos = mbd.loadPhotos('../Data/Scan_Result')
+    transactions = mbd.cleanTransactions(mbd.generateTransactions(photos))
+    mbd.findPairs(transactions, True, '../Data/pairs')
+    exportGraph(mbd.findRawFrequencies(photos), mbd.loadPairs('../Data/pairs'),
+        len(transactions), verbose = True)
@@ -14,6 +14,17 @@ import networkx as nx
 import numpy as np
 import os
 import Market_Basket_Driver as mbd
+import Graph_Renderer
+import Thumbnail_Cache
+import Graph_Layout
+import Graph_Export
+import Tile_Pyramid
+import Edge_List
+import Pipeline
+
+# Each color corresponds to a specific country
+COLORS = ['#cc0000', '#cc9900', '#009900', '#990099', '#6600ff', '#339966',
+          '#663300', '#99cc00', '#727072', '#669999', '#993333']
 
 
 '''
@@ -144,7 +155,7 @@ def loadPhotos(sourceDir:str = '../Data/Scan_Result', verbose:bool = False):
         print("Loading files:")
 
     # Get all json files in the directory
-    files = [f for f in os.listdir(sourceDir) if ".json" in f]
+    files = [f for f in os.listdir(sourceDir) if f.endswith(".json")]
 
     #  If there are no json files
     if verbose and not files:
@@ -169,70 +180,63 @@ def loadPhotos(sourceDir:str = '../Data/Scan_Result', verbose:bool = False):
 
 
 '''
-DESC:   Gets frequent pairings from a json file
+DESC:   Gets frequent pairings from the edge list saved by
+        `Market_Basket_Driver.findFrequentItems`. Older json files are still
+        read if no edge list exists
 
-INPUT:  pfp:str = 'frequentpairs.json'
+INPUT:  pfp:str = '../Data/frequentPairs'
             - Filepath to the pairs file
 
 OUTPUT: A list of frequent pairings
 '''
-def getFreqPairs(pfp:str = '../Data/frequentpairs.json'):
-    # Get data from file
-    with open(pfp) as jsonfile:
-        freqdata = json.load(jsonfile)
+def getFreqPairs(pfp:str = '../Data/frequentPairs'):
+    return edgeListNames(*Edge_List.loadEdges(pfp))
+
+
+'''
+DESC:   Gets the display names of every astronaut in an edge list
+
+INPUT:  names:list
+            - The names table of the edge list
+        edges:np.ndarray
+            - The edges, as `Edge_List.EDGE_DTYPE` records
 
-    # Creates a list of frequent pairings
+OUTPUT: A list of astronaut names, formatted as "first last"
+'''
+def edgeListNames(names:list, edges:np.ndarray):
+    # Only the names table is formatted, never the edges themselves
+    used = np.unique(np.concatenate([edges["source"], edges["target"]]))
     fpairs = []
-    for nameSet in freqdata.keys():
-        name1 = nameSet.split('\'')[1].split('&')[0].replace('_', ' ')
-        name2 = nameSet.split('\'')[-2].split('&')[0].replace('_', ' ')
-        if name1 not in fpairs:
-            fpairs.append(name1)
-        if name2 not in fpairs:
-            fpairs.append(name2)
+    for i in used:
+        name = names[i].split('&')[0].replace('_', ' ')
+        if name not in fpairs:
+            fpairs.append(name)
 
     return fpairs
 
 
 '''
-DESC:   Uses the networkx phython library to produce the relations graph for all
-        astronauts
+DESC:   Places every astronaut around the centroid of their country. Countries
+        are laid out on a grid, and each country's astronauts are spread over
+        a square whose size depends on how many astronauts it has
 
 INPUT:  names:dict
             - A dictionary where keys are countries and values are lists of
             astronaut names
-        img:dict
-            - A dictionary where keys are astronaut names and values are
-            images associated with those astronauts
-        pairs:dict
-            - Pairings of astronauts
-        save:bool = True
-            - Whether the graph should be saved
         fp:dict = None
             - The set of frequent pairings to apply
-        show:bool = False
-            - Whether the graph should be displayed
-        ofp:str = "astronautrelations.png"
-            - The name the graph will be saved under
 
-OUTPUT: None
+OUTPUT: A tuple of a dictionary mapping astronaut names to their x/y position,
+        the list of placed astronauts, and the list of their colors
 '''
-def graphData(names:dict, img:dict, pairs:dict, fp:dict = None, save:bool = True,
-              show:bool = False, ofp:str = "../Data/Astronaut_Relations",):
-
-    # print(img)
-
-    astronauts = nx.Graph()
+def layoutNodes(names:dict, fp:dict = None):
     nodes = []
     node_colors = []
     offsets = []
-    labels = {}
     pos = {}
     i = 0
     j = 0
 
-    initial = (0,0)
-
     DIAMS = [(len(names[k])**(5/9))*20 for k in names.keys()]
 
     num = int(len(names.keys())**(1/2))+1
@@ -259,37 +263,158 @@ def graphData(names:dict, img:dict, pairs:dict, fp:dict = None, save:bool = True
 
         offset = max(DIAMS[x*num:])
 
-
-    NAMES = list(names.keys())
-
-    # for country in list(names.keys()):
-    #     centroi
-
-    # Each centroid, diam, and color corresponds to a specific country
-    # CENTROIDS = [(200, 500), (100, 100), (500, 500), (500, 200), (125, 400),
-                 # (550, 300), (390, 150), (400, 255), (400, 570), (400, 600),
-                 # (400, 595)]
-     # ['russia', 'usa', 'kazakhstan', 'greatbritain', 'japan', 'italy', 'netherlands', 'canada', 'brazil']
-    # DIAMS = [130, 230, 20, 20, 50, 20, 20, 20, 20, 20, 20]
-    COLORS = ['#cc0000', '#cc9900', '#009900', '#990099', '#6600ff', '#339966',
-              '#663300', '#99cc00', '#727072', '#669999', '#993333']
-
     for country in list(names.keys()):
         width = DIAMS[i]
-        col = COLORS[i]
+        col = COLORS[i % len(COLORS)]
         offsets += getRandOffset(len(names[country]), width)[0:len(names[country])]
         for n in names[country]:
             if fp is None or n in fp:
                 centroid = CENTROIDS[i]
                 (randX, randY) = offsets[j]
                 pos[n] = np.array([(centroid[0] + randX), (centroid[1] + randY)])
-                labels[n] = n
                 nodes.append(n)
                 node_colors.append(col)
 
                 j += 1
         i += 1
 
+    return pos, nodes, node_colors
+
+
+'''
+DESC:   Gets the display names at both ends of every pair in an edge list. Only
+        the names table is formatted, never the pairs themselves
+
+INPUT:  pairs:tuple
+            - The names table and edge array of an edge list, as returned by
+            `Market_Basket_Driver.loadPairs`
+
+OUTPUT: A tuple of two lists holding the first and second name of every pair,
+        formatted as "first last"
+'''
+def pairNames(pairs:tuple):
+    names, edges = pairs
+    display = [n.split('&')[0].replace('_', ' ') for n in names]
+    sources, targets = Edge_List.edgeNames(display, edges)
+    return sources.tolist(), targets.tolist()
+
+
+'''
+DESC:   Counts the pairs of astronauts and loads them back as an edge list
+
+INPUT:  transactions:list
+            - A list of lists of astronauts in each photo
+        fileName:str = "../Data/pairs"
+            - Where the pairs are saved, without an extension
+
+OUTPUT: A tuple of the names table and an array of `Edge_List.EDGE_DTYPE`
+        records
+'''
+def pairEdges(transactions:list, fileName:str = "../Data/pairs"):
+    mbd.findPairs(transactions, True, fileName)
+    # Read into memory so the pipeline can cache the result
+    return mbd.loadPairs(fileName, mmap = False)
+
+
+'''
+DESC:   Places every astronaut with the force-directed layout engine, so that
+        astronauts photographed together end up close to each other while
+        staying clustered by country
+
+INPUT:  names:dict
+            - A dictionary where keys are countries and values are lists of
+            astronaut names
+        pairs:tuple
+            - The edge list of astronaut pairings, see `pairEdges`. The count
+            of every pair is used as its weight
+        fp:dict = None
+            - The set of frequent pairings to apply
+
+OUTPUT: A tuple of a dictionary mapping astronaut names to their x/y position,
+        the list of placed astronauts, and the list of their colors
+'''
+def forceLayoutNodes(names:dict, pairs:tuple, fp:dict = None):
+    nodes = []
+    node_colors = []
+    groups = []
+
+    for i, country in enumerate(names.keys()):
+        for n in names[country]:
+            if fp is None or n in fp:
+                nodes.append(n)
+                node_colors.append(COLORS[i % len(COLORS)])
+                groups.append(i)
+
+    index = {n: i for i, n in enumerate(nodes)}
+    edges = []
+    weights = []
+    for name1, name2, count in zip(*pairNames(pairs), pairs[1]["count"].tolist()):
+        if name1 in index and name2 in index and name1 != name2:
+            edges.append((index[name1], index[name2]))
+            weights.append(count)
+
+    pos = Graph_Layout.layoutGraph(nodes, groups, edges, weights)
+    return pos, nodes, node_colors
+
+
+'''
+DESC:   Collects everything needed to draw the relations graph: node positions,
+        colors, and the edges between placed astronauts
+
+INPUT:  placed:tuple
+            - The positions, nodes and colors from `layoutNodes` or
+            `forceLayoutNodes`
+        pairs:tuple
+            - The edge list of astronaut pairings, see `pairEdges`
+
+OUTPUT: A dictionary with the "nodes" (astronaut names), their "pos" and
+        "colors" in the same order, and the "edges" as pairs of node indices
+'''
+def buildScene(placed:tuple, pairs:tuple):
+    pos, nodes, node_colors = placed
+    index = {n: i for i, n in enumerate(nodes)}
+
+    edges = []
+    for name1, name2 in zip(*pairNames(pairs)):
+        if name1 in index and name2 in index:
+            edges.append((index[name1], index[name2]))
+
+    return {"nodes": nodes, "pos": [pos[n] for n in nodes],
+        "colors": node_colors, "edges": edges}
+
+
+'''
+DESC:   Uses the networkx phython library to produce the relations graph for all
+        astronauts
+
+INPUT:  names:dict
+            - A dictionary where keys are countries and values are lists of
+            astronaut names
+        img:dict
+            - A dictionary where keys are astronaut names and values are
+            images associated with those astronauts
+        pairs:tuple
+            - The edge list of astronaut pairings, see `pairEdges`
+        save:bool = True
+            - Whether the graph should be saved
+        fp:dict = None
+            - The set of frequent pairings to apply
+        show:bool = False
+            - Whether the graph should be displayed
+        ofp:str = "astronautrelations.png"
+            - The name the graph will be saved under
+
+OUTPUT: None
+'''
+def graphData(names:dict, img:dict, pairs:tuple, fp:dict = None, save:bool = True,
+              show:bool = False, ofp:str = "../Data/Astronaut_Relations",):
+
+    # print(img)
+
+    astronauts = nx.Graph()
+    pos, nodes, node_colors = layoutNodes(names, fp)
+    labels = {n: n for n in nodes}
+
     # Initializes the graph and places each of the nodes.
     plt.figure(3,figsize=(60,60))
     astronauts.add_nodes_from(labels)
@@ -303,10 +428,8 @@ def graphData(names:dict, img:dict, pairs:dict, fp:dict = None, save:bool = True
     # Creates a connection value for each pair of astronauts that appear
     # together in a photo.
     connections = []
-    for nameSet in pairs.keys():
-        name1 = nameSet.split('\'')[1].split('&')[0].replace('_', ' ')
-        name2 = nameSet.split('\'')[-2].split('&')[0].replace('_', ' ')
-        connections.append((name1, name2, {}))
+    for name1, name2, count in zip(*pairNames(pairs), pairs[1]["count"].tolist()):
+        connections.append((name1, name2, {"weight": count}))
 
     # Draws each edge onto the graph
     astronauts.add_edges_from(connections)
@@ -351,7 +474,165 @@ def graphData(names:dict, img:dict, pairs:dict, fp:dict = None, save:bool = True
 
 
 '''
-DESC:   Generates the relations graph
+DESC:   Gets the astronauts in every photo, ignoring photos without any
+
+INPUT:  photos:dict
+            - Photo data loaded by `Market_Basket_Driver.loadPhotos`
+
+OUTPUT: A list of lists of astronauts
+'''
+def photoTransactions(photos:dict):
+    return mbd.cleanTransactions(mbd.generateTransactions(photos))
+
+
+'''
+DESC:   Gets every astronaut's name, indexed by their country
+
+INPUT:  photos:dict
+            - Photo data loaded by `Market_Basket_Driver.loadPhotos`
+
+OUTPUT: The same dictionary as `namesByCountry`
+'''
+def photoNames(photos:dict):
+    return namesByCountry({k: v[0] for k, v in photos.items()})
+
+
+'''
+DESC:   Runs apriori and gets the names of every astronaut in a frequent pair
+
+INPUT:  transactions:list
+            - A list of lists of astronauts in each photo
+
+OUTPUT: A list of astronaut names, the same as `getFreqPairs`
+'''
+def frequentPairNames(transactions:list):
+    frequentItems = mbd.findFrequentItems(mbd.runApriori(transactions))
+    if not frequentItems: return []
+    return edgeListNames(*Edge_List.fromDict(frequentItems))
+
+
+'''
+DESC:   Loads every portrait thumbnail, only resizing portraits that changed
+
+INPUT:  photoPath:str
+            - Path to the source photos
+
+OUTPUT: A dictionary where keys are astronaut names and values are PIL images
+'''
+def loadPortraits(photoPath:str):
+    return Thumbnail_Cache.loadAtlas(Thumbnail_Cache.buildAtlas(photoPath))
+
+
+'''
+DESC:   Renders a scene with the canvas or tile renderer
+
+INPUT:  scene:dict
+            - A scene built by `buildScene`
+        img:dict
+            - A dictionary where keys are astronaut names and values are images
+        ofp:str
+            - The name the graph will be saved under, without the extension
+        renderer:str
+            - Either "canvas" or "tiles"
+
+OUTPUT: The filepath that was written
+'''
+def renderScene(scene:dict, img:dict, ofp:str, renderer:str):
+    if renderer == "tiles":
+        return Tile_Pyramid.buildPyramid(scene, img, ofp)
+    Graph_Renderer.renderGraph(scene, img, ofp)
+    return ofp + ".png"
+
+
+'''
+DESC:   Exports the relations graph for interactive viewers
+
+INPUT:  rawFreq:dict, pairs:tuple, transactions:list
+            - Results of the earlier pipeline stages
+        fp:list = None
+            - The set of frequent pairings to apply
+        formats:tuple = ()
+            - The formats to write, see `Graph_Export.writeGraph`
+        fileName:str = "../Data/Astronaut_Relations"
+            - The filepath to save to, without the extension. '_min' is added
+            when `fp` is given
+
+OUTPUT: A list of the filepaths that were written
+'''
+def exportScene(rawFreq:dict, pairs:tuple, transactions:list, fp:list = None,
+                formats:tuple = (), fileName:str = "../Data/Astronaut_Relations"):
+    return Graph_Export.exportGraph(rawFreq, pairs, len(transactions), formats, fileName, fp)
+
+
+'''
+DESC:   Declares every stage needed to draw the relations graph. Each stage is
+        cached, so a refresh only recomputes the stages whose inputs changed
+
+INPUT:  photoPath:str = '../Data/Portraits_Cropped/'
+            - Path to the source photos
+        sourceDir:str = '../Data/Scan_Result'
+            - Where the jsons of photo data will be found
+        limit:bool = False
+            - Whether the graph should be limited to frequent pairs
+        renderer:str = "canvas"
+            - Either "canvas" or "tiles"
+        layout:str = "grid"
+            - How astronauts are placed, either "grid" or "force"
+        export:tuple = ()
+            - Formats to export the graph in
+        cacheDir:str = Pipeline.CACHE_DIR
+            - Where stage results are cached
+        verbose:bool = False
+            - Whether the pipeline will report which stages run
+
+OUTPUT: A pipeline with "photos", "transactions", "names", "rawFreq", "pairs",
+        "frequentPairs", "portraits", "layout", "scene", "render" and "export"
+        stages
+'''
+def graphPipeline(photoPath:str = '../Data/Portraits_Cropped/',
+                  sourceDir:str = '../Data/Scan_Result', limit:bool = False,
+                  renderer:str = "canvas", layout:str = "grid", export:tuple = (),
+                  cacheDir:str = Pipeline.CACHE_DIR, verbose:bool = False):
+    if layout not in ("grid", "force"):
+        raise ValueError("\'layout\' must be either \'grid\' or \'force\'")
+    ofp = "../Data/Astronaut_Relations"
+    if limit: ofp += '_min'
+    fp = ("frequentPairs",) if limit else ()
+
+    pipeline = Pipeline.newPipeline(cacheDir, verbose)
+    Pipeline.addStage(pipeline, "photos", mbd.loadPhotos, params = {"sourceDir": sourceDir},
+        sources = lambda: glob.glob(sourceDir + '/*.json'))
+    Pipeline.addStage(pipeline, "transactions", photoTransactions, ("photos",))
+    Pipeline.addStage(pipeline, "names", photoNames, ("photos",))
+    Pipeline.addStage(pipeline, "rawFreq", mbd.findRawFrequencies, ("photos",))
+    Pipeline.addStage(pipeline, "pairs", pairEdges, ("transactions",),
+        params = {"fileName": "../Data/pairs"}, version = 2,
+        outputs = ["../Data/pairs" + ext for ext in ("_names.json", ".json", ".npy", ".csv")])
+    Pipeline.addStage(pipeline, "frequentPairs", frequentPairNames, ("transactions",))
+    Pipeline.addStage(pipeline, "portraits", loadPortraits, params = {"photoPath": photoPath},
+        sources = lambda: grabPhotos(photoPath))
+    # The grid layout doesn't depend on the pairs, so new pairs only redraw
+    # the edges
+    if layout == "force":
+        Pipeline.addStage(pipeline, "layout", forceLayoutNodes, ("names", "pairs") + fp)
+    else:
+        Pipeline.addStage(pipeline, "layout", layoutNodes, ("names",) + fp)
+    Pipeline.addStage(pipeline, "scene", buildScene, ("layout", "pairs"), version = 2)
+    Pipeline.addStage(pipeline, "render", renderScene, ("scene", "portraits"),
+        params = {"ofp": ofp, "renderer": renderer},
+        outputs = [ofp + (".dzi" if renderer == "tiles" else ".png")])
+
+    Pipeline.addStage(pipeline, "export", exportScene, ("rawFreq", "pairs", "transactions") + fp,
+        params = {"formats": tuple(export), "fileName": "../Data/Astronaut_Relations"},
+        outputs = [ofp + Graph_Export.EXTENSIONS[fmt] for fmt in export])
+
+    return pipeline
+
+
+'''
+DESC:   Generates the relations graph. Scan results, pairs, apriori, layout and
+        rendering are stages of a cached pipeline, so only the stages affected
+        by a change are run again
 
 INPUT:  photoPath:str = '../cropped_Astronaut_photos/'
             - Path to the source photos
@@ -361,33 +642,47 @@ INPUT:  photoPath:str = '../cropped_Astronaut_photos/'
             - Whether the graph should be displayed
         limit:bool = False
             - Whether the graph should be limited to frequent pairs
+        renderer:str = "canvas"
+            - "canvas" draws the whole graph onto one PIL image, "tiles" draws
+            it as a deep zoom tile pyramid, "matplotlib" draws it with
+            `graphData`
+        layout:str = "grid"
+            - How the canvas renderer places astronauts, either "grid" or
+            "force"
+        export:tuple = ()
+            - Formats to also export the graph in for interactive viewers, any
+            of "graphml", "gexf", and "json"
+        verbose:bool = False
+            - Whether the pipeline will report which stages run
 
 OUTPUT: None
 '''
 def generateGraph(photoPath:str = '../Data/Portraits_Cropped/',
-                  save:bool = True, show:bool = True, limit:bool = False):
+                  save:bool = True, show:bool = True, limit:bool = False,
+                  renderer:str = "canvas", layout:str = "grid", export:tuple = (),
+                  verbose:bool = False):
+    if renderer not in ("canvas", "tiles", "matplotlib"):
+        raise ValueError("\'renderer\' must be \'canvas\', \'tiles\' or \'matplotlib\'")
 
-    # Find all of the stronaut names
-    data = loadPhotos()
-    names = namesByCountry(data)
+    pipeline = graphPipeline(photoPath, limit = limit, layout = layout,
+        renderer = renderer, export = export, verbose = verbose)
 
-    # Assigns photos to astronauts
-    files = grabPhotos(photoPath)
-    for f in files:
-        scalePhoto(f)
-    img = assignPhotos()
-
-    # Gets the common pairings
-    pairs = mbd.runModel(pairs = True)["pairs"]
+    targets = []
+    if renderer == "matplotlib":
+        targets += ["names", "portraits", "pairs"] + (["frequentPairs"] if limit else [])
+    elif save or (show and renderer == "canvas"):
+        targets.append("render")
+    if export:
+        targets.append("export")
 
-    if limit:
-        frequentPairs = getFreqPairs()
-    else:
-        frequentPairs = None
+    results = Pipeline.runPipeline(pipeline, targets)
 
     # Graph the result
-    graphData(names, img, pairs, frequentPairs, save, show)
-
+    if renderer == "matplotlib":
+        graphData(results["names"], results["portraits"], results["pairs"],
+            results.get("frequentPairs"), save, show)
+    elif renderer == "canvas" and show:
+        Image.open(results["render"]).show()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,264 @@
+'''
+@desc:      Weighted force-directed layout for the astronaut relations graph.
+            Astronauts repel each other, pairs that are photographed together
+            attract in proportion to how often they are, and every astronaut is
+            pulled toward the center of their country so national groups stay
+            clustered. All forces are computed with NumPy; large graphs use a
+            grid approximation for the repulsion so thousands of nodes lay out
+            in seconds. Layouts are cached by a hash of the graph.
+'''
+
+import os
+import json
+import hashlib
+import numpy as np
+
+CACHE_DIR = '../Data/Temp/Layout_Cache'
+
+# Graphs with more nodes than this use the grid approximation for repulsion
+EXACT_LIMIT = 800
+
+
+'''
+DESC:   Computes the exact repulsion between every pair of nodes
+
+INPUT:  pos:np.ndarray
+            - An (n x 2) array of node positions
+        k:float
+            - The ideal distance between nodes
+
+OUTPUT: An (n x 2) array of forces
+'''
+def exactRepulsion(pos:np.ndarray, k:float):
+    dx = pos[:, 0, None] - pos[None, :, 0]
+    dy = pos[:, 1, None] - pos[None, :, 1]
+    strength = dx*dx + dy*dy
+    np.maximum(strength, 1e-4 * k * k, out = strength)
+    np.fill_diagonal(strength, np.inf)
+    np.divide(k * k, strength, out = strength)
+    return np.stack([np.einsum('ij,ij->i', dx, strength),
+        np.einsum('ij,ij->i', dy, strength)], axis = 1)
+
+
+'''
+DESC:   Approximates the repulsion between every pair of nodes. Nodes are binned
+        into a grid; nodes in neighboring cells repel each other exactly, while
+        cells further away act as a single mass at their center and push every
+        node of a cell the same way
+
+INPUT:  pos:np.ndarray
+            - An (n x 2) array of node positions
+        k:float
+            - The ideal distance between nodes
+
+OUTPUT: An (n x 2) array of forces
+'''
+def gridRepulsion(pos:np.ndarray, k:float):
+    n = len(pos)
+    side = max(2, int(np.sqrt(n) / 3))
+    low = pos.min(axis = 0)
+    size = max(float((pos.max(axis = 0) - low).max()), 1e-9) / side * (1 + 1e-9)
+
+    cellXY = np.minimum(((pos - low) / size).astype(np.int64), side - 1)
+    cell = cellXY[:, 0] * side + cellXY[:, 1]
+    numCells = side * side
+
+    # Mass and center of every cell
+    mass = np.bincount(cell, minlength = numCells).astype(np.float64)
+    centers = np.zeros((numCells, 2))
+    centers[:, 0] = np.bincount(cell, pos[:, 0], numCells)
+    centers[:, 1] = np.bincount(cell, pos[:, 1], numCells)
+    occupied = mass > 0
+    centers[occupied] /= mass[occupied, None]
+
+    # Far field: every cell against every cell that isn't next to it. Nodes
+    # feel the force on the center of their own cell
+    cellX, cellY = np.divmod(np.arange(numCells), side)
+    far = (np.abs(cellX[:, None] - cellX[None, :]) > 1) | \
+        (np.abs(cellY[:, None] - cellY[None, :]) > 1)
+    dx = centers[:, 0, None] - centers[None, :, 0]
+    dy = centers[:, 1, None] - centers[None, :, 1]
+    strength = dx*dx + dy*dy
+    np.maximum(strength, 1e-4 * k * k, out = strength)
+    strength = np.where(far, mass[None, :] * k * k, 0.0) / strength
+    cellForce = np.stack([np.einsum('ij,ij->i', dx, strength),
+        np.einsum('ij,ij->i', dy, strength)], axis = 1)
+    force = cellForce[cell]
+
+    # Near field: enumerate every node against the nodes of its 3x3 cells
+    order = np.argsort(cell, kind = 'stable')
+    start = np.searchsorted(cell[order], np.arange(numCells))
+    end = np.searchsorted(cell[order], np.arange(numCells), side = 'right')
+
+    sources = []
+    targets = []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            nx = cellXY[:, 0] + dx
+            ny = cellXY[:, 1] + dy
+            valid = (nx >= 0) & (nx < side) & (ny >= 0) & (ny < side)
+            other = np.where(valid, nx * side + ny, 0)
+            counts = np.where(valid, end[other] - start[other], 0)
+            total = int(counts.sum())
+            if total == 0: continue
+
+            node = np.repeat(np.arange(n), counts)
+            first = np.repeat(start[other] - (np.cumsum(counts) - counts), counts)
+            sources.append(node)
+            targets.append(order[first + np.arange(total)])
+
+    # Every pair shows up twice, so only the first copy of it is kept and
+    # pushes both of its nodes
+    sources = np.concatenate(sources)
+    targets = np.concatenate(targets)
+    keep = sources < targets
+    sources = sources[keep]
+    targets = targets[keep]
+
+    dx = pos[sources, 0] - pos[targets, 0]
+    dy = pos[sources, 1] - pos[targets, 1]
+    strength = dx*dx + dy*dy
+    np.maximum(strength, 1e-4 * k * k, out = strength)
+    np.divide(k * k, strength, out = strength)
+    dx *= strength
+    dy *= strength
+    force[:, 0] += np.bincount(sources, dx, n) - np.bincount(targets, dx, n)
+    force[:, 1] += np.bincount(sources, dy, n) - np.bincount(targets, dy, n)
+
+    return force
+
+
+'''
+DESC:   Lays out a weighted graph whose nodes belong to groups (countries)
+
+INPUT:  groups:list
+            - The group index of every node
+        edges:np.ndarray
+            - An (m x 2) array of node indices
+        weights:np.ndarray
+            - The weight of every edge
+        iterations:int = 200
+            - The number of simulation steps
+        clusterStrength:float = 2.0
+            - How strongly nodes are pulled toward the center of their group
+        seed:int = 0
+            - The seed for the initial positions
+
+OUTPUT: An (n x 2) array of node positions
+'''
+def forceDirected(groups:list, edges:np.ndarray, weights:np.ndarray,
+    iterations:int = 200, clusterStrength:float = 2.0, seed:int = 0):
+    rng = np.random.default_rng(seed)
+    groups = np.asarray(groups, dtype = np.int64)
+    n = len(groups)
+    if n == 0: return np.zeros((0, 2))
+
+    numGroups = int(groups.max()) + 1
+    groupSize = np.bincount(groups, minlength = numGroups).astype(np.float64)
+    k = 1.0 / np.sqrt(n)
+
+    # Start every group around its own point on a circle
+    angle = 2 * np.pi * np.arange(numGroups) / numGroups
+    anchors = 0.35 * np.stack([np.cos(angle), np.sin(angle)], axis = 1)
+    pos = anchors[groups] + rng.normal(scale = k, size = (n, 2))
+
+    edges = np.asarray(edges, dtype = np.int64).reshape(-1, 2)
+    weights = np.asarray(weights, dtype = np.float64)
+    if len(weights): weights = np.log1p(weights) / np.log1p(weights).mean()
+
+    temperature = 0.1
+    cooling = temperature / (iterations + 1)
+    repulsion = exactRepulsion if n <= EXACT_LIMIT else gridRepulsion
+
+    for _ in range(iterations):
+        force = repulsion(pos, k)
+
+        # Edges pull their astronauts together
+        if len(edges):
+            delta = pos[edges[:, 0]] - pos[edges[:, 1]]
+            dist = np.sqrt(np.sum(delta**2, axis = 1))
+            pull = delta * (weights * dist / k)[:, None]
+            for axis in (0, 1):
+                force[:, axis] -= np.bincount(edges[:, 0], pull[:, axis], n)
+                force[:, axis] += np.bincount(edges[:, 1], pull[:, axis], n)
+
+        # Every astronaut is pulled toward the center of their country
+        centers = np.zeros((numGroups, 2))
+        for axis in (0, 1):
+            centers[:, axis] = np.bincount(groups, pos[:, axis], numGroups) / np.maximum(groupSize, 1)
+        toCenter = centers[groups] - pos
+        force += clusterStrength * toCenter * np.sqrt(np.sum(toCenter**2, axis = 1))[:, None] / k
+
+        # A weak pull toward the origin keeps disconnected countries close
+        force -= 0.05 * pos / k
+
+        # Move every node, limited by the current temperature
+        length = np.maximum(np.sqrt(np.sum(force**2, axis = 1)), 1e-12)
+        pos += force / length[:, None] * np.minimum(length, temperature)[:, None]
+        temperature -= cooling
+
+    return pos
+
+
+'''
+DESC:   Hashes everything that determines a layout
+
+INPUT:  nodes:list, groups:list, edges:list, weights:list
+            - The graph being laid out
+        params:dict
+            - The layout parameters
+
+OUTPUT: A hex digest identifying the layout
+'''
+def graphHash(nodes:list, groups:list, edges:list, weights:list, params:dict):
+    data = json.dumps([list(nodes), [int(g) for g in groups],
+        [[int(i), int(j)] for i, j in edges], [float(w) for w in weights],
+        params], sort_keys = True)
+    return hashlib.sha1(data.encode()).hexdigest()
+
+
+'''
+DESC:   Lays out the relations graph, reusing a cached layout if the same graph
+        has been laid out before
+
+INPUT:  nodes:list
+            - The astronaut names
+        groups:list
+            - The group (country) index of every astronaut
+        edges:list
+            - Pairs of node indices
+        weights:list
+            - The number of photos each pair appears in
+        iterations:int = 200
+            - The number of simulation steps
+        clusterStrength:float = 2.0
+            - How strongly astronauts are pulled toward their country
+        seed:int = 0
+            - The seed for the initial positions
+        cacheDir:str = CACHE_DIR
+            - Where layouts are cached
+
+OUTPUT: A dictionary where keys are astronaut names and values are their x/y
+        positions as numpy arrays
+'''
+def layoutGraph(nodes:list, groups:list, edges:list, weights:list,
+    iterations:int = 200, clusterStrength:float = 2.0, seed:int = 0,
+    cacheDir:str = CACHE_DIR):
+    params = {"iterations": iterations, "clusterStrength": clusterStrength, "seed": seed}
+    key = graphHash(nodes, groups, edges, weights, params)
+    cacheFile = '{0}/{1}.json'.format(cacheDir, key)
+
+    if os.path.exists(cacheFile):
+        with open(cacheFile) as f:
+            cached = json.load(f)
+        return {name: np.array(xy) for name, xy in cached.items()}
+
+    pos = forceDirected(groups, edges, weights, iterations, clusterStrength, seed)
+    layout = {name: pos[i] for i, name in enumerate(nodes)}
+
+    if not os.path.isdir(cacheDir): os.makedirs(cacheDir)
+    with open(cacheFile + '.tmp', 'w') as f:
+        json.dump({name: xy.tolist() for name, xy in layout.items()}, f)
+    os.replace(cacheFile + '.tmp', cacheFile)
+
+    return layout
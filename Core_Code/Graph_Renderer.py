@@ -0,0 +1,207 @@
+'''
+@desc:      Renders the astronaut relations graph onto a single raster canvas
+            with PIL. Node positions are computed once, and every edge, node,
+            portrait thumbnail and label is drawn onto the same image in one
+            pass instead of creating a matplotlib axes for every astronaut.
+'''
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+# Sizes of the matplotlib figure drawn by `graphData`, used to keep the same
+# proportions: a 60 inch figure at 100 dpi, 1500pt^2 nodes, 0.02 figure-wide
+# portraits and 16pt labels
+BASE_SIZE = 6000
+NODE_RADIUS = 27
+THUMB_SIZE = 120
+FONT_SIZE = 22
+MARGIN = 0.05
+
+EDGE_COLOR = '#900000'
+EDGE_ALPHA = 0.5
+NODE_ALPHA = 0.8
+LABEL_ALPHA = 0.25
+
+_fonts = {}
+
+
+'''
+DESC:   Converts a hex color string to an rgb tuple, optionally blending it over
+        a white background
+
+INPUT:  color:str
+            - A color such as '#cc0000'
+        alpha:float = 1.0
+            - The opacity of the color over white
+
+OUTPUT: An (r, g, b) tuple
+'''
+def hexColor(color:str, alpha:float = 1.0):
+    rgb = [int(color[i:i+2], 16) for i in (1, 3, 5)]
+    return tuple(int(round(c*alpha + 255*(1-alpha))) for c in rgb)
+
+
+'''
+DESC:   Loads a font of the given size, falling back to PIL's default font if
+        no truetype font is installed
+
+INPUT:  size:int
+            - The font size in pixels
+
+OUTPUT: A PIL font
+'''
+def getFont(size:int):
+    if size not in _fonts:
+        try:
+            _fonts[size] = ImageFont.truetype("DejaVuSans.ttf", size)
+        except OSError:
+            _fonts[size] = ImageFont.load_default()
+    return _fonts[size]
+
+
+'''
+DESC:   Maps every node of a scene onto the pixels of a square canvas, keeping
+        the aspect ratio and leaving a margin around the graph
+
+INPUT:  scene:dict
+            - A scene built by `Graph_Generation_Driver.buildScene`
+        size:int = BASE_SIZE
+            - The width and height of the canvas in pixels
+
+OUTPUT: An (n x 2) array of pixel coordinates, in the same order as the
+        scene's nodes
+'''
+def placeScene(scene:dict, size:int = BASE_SIZE):
+    pos = np.asarray(scene["pos"], dtype = np.float64).reshape(-1, 2)
+    if len(pos) == 0: return pos
+
+    low = pos.min(axis = 0)
+    span = max(float((pos.max(axis = 0) - low).max()), 1e-9)
+    scale = size * (1 - 2*MARGIN) / span
+
+    xy = (pos - low) * scale + size*MARGIN
+    # Image rows grow downward while graph coordinates grow upward
+    xy[:, 1] = size - xy[:, 1]
+    return xy
+
+
+'''
+DESC:   Resizes every portrait once to the thumbnail size used on the canvas
+
+INPUT:  img:dict
+            - A dictionary where keys are astronaut names and values are their
+            portraits, as numpy arrays or PIL images
+        thumbSize:int = THUMB_SIZE
+            - The largest side of a thumbnail in pixels
+
+OUTPUT: A dictionary where keys are astronaut names and values are RGB PIL
+        images
+'''
+def buildThumbnails(img:dict, thumbSize:int = THUMB_SIZE):
+    thumbs = {}
+    for name, photo in img.items():
+        if not isinstance(photo, Image.Image):
+            photo = np.asarray(photo)
+            if photo.dtype != np.uint8: photo = (photo * 255).astype(np.uint8)
+            photo = Image.fromarray(photo)
+        photo = photo.convert("RGB")
+        photo.thumbnail((thumbSize, thumbSize))
+        thumbs[name] = photo
+    return thumbs
+
+
+'''
+DESC:   Draws a scene onto a canvas. The canvas may be the whole graph or any
+        window of it, so the same code renders full images and tiles
+
+INPUT:  canvas:Image
+            - The RGB image being drawn on
+        scene:dict
+            - A scene built by `Graph_Generation_Driver.buildScene`
+        xy:np.ndarray
+            - The pixel coordinates of every node at full size, from
+            `placeScene`
+        thumbs:dict
+            - The thumbnails from `buildThumbnails`, already sized for `zoom`
+        zoom:float = 1.0
+            - How much the full size image is scaled on this canvas
+        origin:tuple = (0, 0)
+            - The (scaled) pixel coordinate of the canvas' top left corner
+
+OUTPUT: None
+'''
+def drawScene(canvas:Image.Image, scene:dict, xy:np.ndarray, thumbs:dict,
+    zoom:float = 1.0, origin:tuple = (0, 0)):
+    if len(xy) == 0: return
+    points = xy * zoom - np.asarray(origin, dtype = np.float64)
+    width, height = canvas.size
+
+    # Edges are drawn onto a mask so they can be blended in a single paste
+    if scene["edges"]:
+        mask = Image.new("L", canvas.size, 0)
+        maskDraw = ImageDraw.Draw(mask)
+        lineWidth = max(1, int(round(zoom)))
+        for i, j in scene["edges"]:
+            maskDraw.line([tuple(points[i]), tuple(points[j])],
+                fill = int(255*EDGE_ALPHA), width = lineWidth)
+        canvas.paste(hexColor(EDGE_COLOR), (0, 0, width, height), mask)
+        del maskDraw, mask
+
+    draw = ImageDraw.Draw(canvas)
+    radius = NODE_RADIUS * zoom
+    thumbSize = int(round(THUMB_SIZE * zoom))
+    font = getFont(max(1, int(round(FONT_SIZE * zoom))))
+    reach = max(radius, thumbSize) + FONT_SIZE*zoom*10
+
+    for i, name in enumerate(scene["nodes"]):
+        x, y = points[i]
+        # Skip nodes whose drawings can't reach the canvas
+        if x < -reach or y < -reach or x > width + reach or y > height + reach:
+            continue
+
+        color = scene["colors"][i]
+        draw.ellipse([x-radius, y-radius, x+radius, y+radius],
+            fill = hexColor(color, NODE_ALPHA))
+
+        if name in thumbs:
+            thumb = thumbs[name]
+            canvas.paste(thumb, (int(x - thumb.size[0]/2), int(y - thumb.size[1]/2)))
+
+        # Label the node just below its portrait
+        top = y + thumbSize/2 + 4*zoom
+        box = draw.textbbox((x, top), name, font = font, anchor = "ma")
+        pad = 4*zoom
+        draw.rectangle([box[0]-pad, box[1]-pad, box[2]+pad, box[3]+pad],
+            fill = hexColor(color, LABEL_ALPHA), outline = hexColor('#000000', LABEL_ALPHA))
+        draw.text((x, top), name, fill = (0, 0, 0), font = font, anchor = "ma")
+
+
+'''
+DESC:   Renders a scene to a png file on a single canvas
+
+INPUT:  scene:dict
+            - A scene built by `Graph_Generation_Driver.buildScene`
+        img:dict
+            - A dictionary where keys are astronaut names and values are images
+            associated with those astronauts
+        ofp:str = "../Data/Astronaut_Relations"
+            - The name the graph will be saved under, without the extension
+        size:int = BASE_SIZE
+            - The width and height of the image in pixels
+        show:bool = False
+            - Whether the image should be displayed
+
+OUTPUT: The rendered PIL image
+'''
+def renderGraph(scene:dict, img:dict, ofp:str = "../Data/Astronaut_Relations",
+    size:int = BASE_SIZE, show:bool = False):
+    zoom = size / BASE_SIZE
+    xy = placeScene(scene, BASE_SIZE)
+    thumbs = buildThumbnails(img, max(1, int(round(THUMB_SIZE * zoom))))
+
+    canvas = Image.new("RGB", (size, size), (255, 255, 255))
+    drawScene(canvas, scene, xy, thumbs, zoom)
+    canvas.save(ofp + ".png")
+
+    if show: canvas.show()
+    return canvas
@@ -0,0 +1,309 @@
+'''
+@desc:      Finds near-duplicate photos (bursts, re-uploads, resized copies of the
+            same shot) before they are scanned for faces. Every photo gets a
+            64-bit perceptual hash computed from a thumbnail that the JPEG
+            decoder produces at reduced size, hashes are indexed by bands so
+            near matches can be looked up without comparing every pair, and
+            matching photos are grouped with a union-find.
+'''
+
+import os
+import json
+import numpy as np
+import multiprocessing as mp
+from scipy.fft import dctn
+from PIL import Image
+
+HASH_FILE = '../Data/Temp/Hash_Cache.json'
+GROUP_FILE = '../Data/Temp/Duplicate_Groups.json'
+
+# int.bit_count only exists from python 3.10 onward
+if hasattr(int, "bit_count"):
+    popcount = int.bit_count
+else:
+    def popcount(bits:int):
+        return bin(bits).count("1")
+
+
+'''
+DESC:   Converts an array of bits into an integer
+
+INPUT:  bits:np.ndarray
+            - An array of booleans
+
+OUTPUT: An integer whose highest bit is the first element of `bits`
+'''
+def bitsToInt(bits:np.ndarray):
+    value = 0
+    for bit in bits.ravel():
+        value = (value << 1) | int(bit)
+    return value
+
+
+'''
+DESC:   Computes the perceptual hash of an image. JPEGs are decoded straight to
+        a small grayscale draft, so the full image is never decompressed
+
+INPUT:  path:str
+            - The image to hash
+        method:str = "phash"
+            - "phash" thresholds the low frequencies of a DCT against their
+            median, "dhash" compares neighboring pixels
+
+OUTPUT: A tuple of the 64-bit hash as an int, and the number of pixels in the
+        original image
+'''
+def imageHash(path:str, method:str = "phash"):
+    with Image.open(path) as im:
+        pixels = im.size[0] * im.size[1]
+        im.draft('L', (64, 64))
+        gray = im.convert('L')
+
+    if method == "phash":
+        small = np.asarray(gray.resize((32, 32), Image.LANCZOS), dtype = np.float64)
+        low = dctn(small, norm = 'ortho')[:8, :8].ravel()
+        # The DC term only measures brightness, so it is left out of the median
+        return bitsToInt(low > np.median(low[1:])), pixels
+    elif method == "dhash":
+        small = np.asarray(gray.resize((9, 8), Image.LANCZOS), dtype = np.float64)
+        return bitsToInt(small[:, 1:] > small[:, :-1]), pixels
+    else:
+        raise ValueError("\'method\' must be either \'phash\' or \'dhash\'")
+
+
+'''
+DESC:   Hashes one image for the worker pool
+
+INPUT:  task:tuple
+            - A (filepath, method) tuple
+
+OUTPUT: A tuple of the filepath, its hash, and its number of pixels. The hash is
+        None if the image couldn't be read
+'''
+def hashTask(task:tuple):
+    path, method = task
+    try:
+        value, pixels = imageHash(path, method)
+    except OSError:
+        return path, None, 0
+    return path, value, pixels
+
+
+'''
+DESC:   Hashes every image, reusing the hash of any file whose size and
+        modification time haven't changed since the last run
+
+INPUT:  paths:list
+            - The images to hash
+        method:str = "phash"
+            - The perceptual hash to use, see `imageHash`
+        hashFile:str = HASH_FILE
+            - Where hashes are remembered between runs
+        numProcesses:int = None
+            - The number of worker processes. Defaults to the number of cores
+
+OUTPUT: A dictionary where keys are filepaths and values are (hash, pixels)
+        tuples. Unreadable images are left out
+'''
+def hashImages(paths:list, method:str = "phash", hashFile:str = HASH_FILE,
+    numProcesses:int = None):
+    known = {}
+    if os.path.exists(hashFile):
+        with open(hashFile) as f:
+            known = json.load(f)
+
+    hashes = {}
+    tasks = []
+    for path in paths:
+        stat = os.stat(path)
+        signature = [stat.st_mtime_ns, stat.st_size, method]
+        key = os.path.abspath(path)
+        if key in known and known[key][0] == signature:
+            hashes[path] = (int(known[key][1], 16), known[key][2])
+        else:
+            tasks.append((path, method))
+
+    if tasks:
+        if numProcesses is None: numProcesses = mp.cpu_count()
+        numProcesses = max(1, min(numProcesses, len(tasks)))
+        if numProcesses == 1:
+            results = list(map(hashTask, tasks))
+        else:
+            with mp.Pool(numProcesses) as pool:
+                results = list(pool.imap_unordered(hashTask, tasks, chunksize = 16))
+
+        for path, value, pixels in results:
+            if value is None: continue
+            stat = os.stat(path)
+            known[os.path.abspath(path)] = [[stat.st_mtime_ns, stat.st_size, method],
+                '{0:016x}'.format(value), pixels]
+            hashes[path] = (value, pixels)
+
+        directory = os.path.dirname(hashFile)
+        if directory and not os.path.isdir(directory): os.makedirs(directory)
+        with open(hashFile + '.tmp', 'w') as f:
+            json.dump(known, f)
+        os.replace(hashFile + '.tmp', hashFile)
+
+    return hashes
+
+
+'''
+DESC:   Finds every pair of hashes within a Hamming distance of each other. The
+        64 bits are split into threshold + 1 bands; two hashes that differ in
+        at most `threshold` bits must agree exactly on at least one band, so
+        only hashes sharing a band bucket are compared
+
+INPUT:  hashes:list
+            - The hashes to compare
+        threshold:int = 6
+            - The largest number of differing bits for a match
+
+OUTPUT: A set of (i, j) index pairs with i < j
+'''
+def similarPairs(hashes:list, threshold:int = 6):
+    numBands = min(threshold + 1, 64)
+    bounds = [int(b) for b in np.linspace(0, 64, numBands + 1)]
+
+    pairs = set()
+    for band in range(numBands):
+        width = bounds[band + 1] - bounds[band]
+        mask = (1 << width) - 1
+
+        buckets = {}
+        for i, value in enumerate(hashes):
+            buckets.setdefault((value >> bounds[band]) & mask, []).append(i)
+
+        for members in buckets.values():
+            for a in range(len(members)):
+                for b in range(a + 1, len(members)):
+                    i, j = members[a], members[b]
+                    if (i, j) not in pairs and popcount(hashes[i] ^ hashes[j]) <= threshold:
+                        pairs.add((i, j))
+
+    return pairs
+
+
+'''
+DESC:   Finds the root of an element in a union-find forest, compressing the
+        path as it goes
+
+INPUT:  parent:list
+            - The parent of every element
+        i:int
+            - The element to look up
+
+OUTPUT: The root of the element's set
+'''
+def findRoot(parent:list, i:int):
+    root = i
+    while parent[root] != root: root = parent[root]
+    while parent[i] != root: parent[i], i = root, parent[i]
+    return root
+
+
+'''
+DESC:   Groups near-duplicate images together. Every group is represented by
+        its largest image, which is the one that gets scanned
+
+INPUT:  paths:list
+            - The images to group
+        threshold:int = 6
+            - The largest number of differing hash bits for two images to count
+            as duplicates
+        method:str = "phash"
+            - The perceptual hash to use, see `imageHash`
+        hashFile:str = HASH_FILE
+            - Where hashes are remembered between runs
+        numProcesses:int = None
+            - The number of worker processes. Defaults to the number of cores
+
+OUTPUT: A dictionary where keys are the filepaths of representatives and values
+        are lists of the other filepaths in their group. Images without
+        duplicates are left out
+'''
+def findDuplicates(paths:list, threshold:int = 6, method:str = "phash",
+    hashFile:str = HASH_FILE, numProcesses:int = None):
+    hashes = hashImages(paths, method, hashFile, numProcesses)
+    paths = sorted(hashes)
+    values = [hashes[p][0] for p in paths]
+
+    parent = list(range(len(paths)))
+    for i, j in similarPairs(values, threshold):
+        rootI, rootJ = findRoot(parent, i), findRoot(parent, j)
+        if rootI != rootJ: parent[max(rootI, rootJ)] = min(rootI, rootJ)
+
+    members = {}
+    for i in range(len(paths)):
+        members.setdefault(findRoot(parent, i), []).append(paths[i])
+
+    groups = {}
+    for group in members.values():
+        if len(group) < 2: continue
+        representative = max(group, key = lambda p: (hashes[p][1], [-ord(c) for c in p]))
+        groups[representative] = [p for p in group if p != representative]
+
+    return groups
+
+
+'''
+DESC:   Records which photos are duplicates of which, by file name, so
+        `Market_Basket_Driver` can count every group once. Groups found in
+        earlier runs are kept, except for the images hashed in this run, whose
+        old mappings are replaced. Chains left by earlier runs are followed to
+        their representative, and cycles are broken, so no photo is ever
+        dropped together with the photo that represents it
+
+INPUT:  groups:dict
+            - The result of `findDuplicates`
+        groupFile:str = GROUP_FILE
+            - Where the groups are saved
+        paths:list = None
+            - Every image that was grouped, duplicate or not. Defaults to the
+            images in `groups`
+
+OUTPUT: A dictionary where keys are the names of duplicate photos and values are
+        the name of the photo that represents them
+'''
+def saveGroups(groups:dict, groupFile:str = GROUP_FILE, paths:list = None):
+    regrouped = {os.path.basename(p) for p in (paths or [])}
+    for representative, others in groups.items():
+        regrouped.update(os.path.basename(p) for p in [representative] + others)
+
+    duplicates = {k: v for k, v in loadGroups(groupFile).items() if k not in regrouped}
+    for representative, others in groups.items():
+        for other in others:
+            duplicates[os.path.basename(other)] = os.path.basename(representative)
+
+    for name in sorted(duplicates):
+        if name not in duplicates: continue
+        chain = [name]
+        while chain[-1] in duplicates:
+            if duplicates[chain[-1]] in chain:
+                # Only an older mapping can close a cycle
+                del duplicates[chain[-1]]
+                break
+            chain.append(duplicates[chain[-1]])
+        for other in chain[:-1]: duplicates[other] = chain[-1]
+
+    directory = os.path.dirname(groupFile)
+    if directory and not os.path.isdir(directory): os.makedirs(directory)
+    with open(groupFile + '.tmp', 'w') as f:
+        json.dump(duplicates, f)
+    os.replace(groupFile + '.tmp', groupFile)
+    return duplicates
+
+
+'''
+DESC:   Loads the duplicate photos recorded by `saveGroups`
+
+INPUT:  groupFile:str = GROUP_FILE
+            - Where the groups were saved
+
+OUTPUT: A dictionary where keys are the names of duplicate photos and values are
+        the name of the photo that represents them
+'''
+def loadGroups(groupFile:str = GROUP_FILE):
+    if not os.path.exists(groupFile): return {}
+    with open(groupFile) as f:
+        return json.load(f)
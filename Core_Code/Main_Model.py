@@ -4,20 +4,38 @@
 '''
 
 import Astro
+import Image_Dedup
+import Face_Matcher
+import Result_Log
+import copy
+import json
+import fcntl
+import uuid
+import hashlib
 import pickle
+import zlib
 import face_recognition
 import os
 import shutil
 import re
+import time
 import numpy as np
 import multiprocessing as mp
 from multiprocessing import Process
+from queue import Empty
 
 # Whether images should be cached in a folder or not
 # Prevents image from being processed again
 cache_img = True
 err_log = []
 
+# Images whose shorter side is below this many pixels are treated as thumbnails
+SMALL_SIDE = 500
+# Images whose faces all span this fraction of the shorter side are close-ups
+CLOSE_UP = 0.25
+# The smallest face in pixels that HOG finds without upsampling
+HOG_FACE = 80
+
 '''
 DESC:   Gets the directory containing a file
 
@@ -47,6 +65,34 @@ def getFileName(filePath:str):
     filePath = regex.split(filePath)
     return filePath[-1]
 
+'''
+DESC:   Finds the `Scan_Result` key of a scanned directory, which its results
+        are saved under as '<key>_result.json'
+
+INPUT:  A string filepath to the scanned directory as `directory`
+
+OUTPUT: The name of the lowest level directory, or "origin"
+'''
+def resultKey(directory:str):
+    key = re.compile(r"/").split(directory)[-1]
+    return key if key != "" else "origin"
+
+'''
+DESC:   Finds all of the directory filepaths that you want to search in
+
+INPUT:  A string filepath to a directory as `directory`, and a bool that
+        determines whether you want to recursively include every sub-directory
+        in your search as `recursive`
+
+OUTPUT: A list of filepaths
+'''
+def findDir(directory:str, recursive:bool):
+    if recursive:
+        folder_list = os.walk(directory)
+        return [item[0] for item in folder_list]
+    else:
+        return [directory]
+
 '''
 DESC:   Creates a directory if it is missing
 
@@ -61,20 +107,190 @@ def prepDir(fileDir:str):
         os.makedirs(fileDir)
 
 '''
-DESC:   Saves a pickle object to a .dat file
+DESC:   Reads the image cache and the entries journaled since it was last
+        saved (see `journalCache`). The caller holds the cache's lock
+
+INPUT:  The filepath of the image cache as `cacheFile`
+
+OUTPUT: The image cache
+'''
+def readCacheFiles(cacheFile:str):
+    cache = {}
+    if os.path.exists(cacheFile):
+        with open(cacheFile, 'rb') as f:
+            cache = pickle.load(f)
+    if os.path.exists(cacheFile + ".journal"):
+        for offset, length, payload in Result_Log.scanSegment(cacheFile + ".journal"):
+            cache.update(pickle.loads(payload))
+    return cache
+
+'''
+DESC:   Loads the image cache, including the entries journaled since it was
+        last saved
+
+INPUT:  The filepath of the image cache as `cacheFile`
+
+OUTPUT: The image cache, or an empty one if there isn't one yet
+'''
+def loadCache(cacheFile:str):
+    if not os.path.exists(cacheFile) and not os.path.exists(cacheFile + ".journal"): return {}
+    with open(cacheFile + ".lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_SH)
+        return readCacheFiles(cacheFile)
+
+'''
+DESC:   Adds entries to the image cache on disk. The image cache is shared by
+        scans, the portrait cropper and the recognition service, so the cache
+        is locked, the entries are merged into whatever is on disk now, and
+        the result is renamed into place. Nothing another writer saved in the
+        meantime is lost. Any journaled entries are folded in too
+
+INPUT:  The filepath of the image cache as `cacheFile`, and a dictionary of
+        image names mapped to their new entries as `entries`
+
+OUTPUT: The merged image cache
+'''
+def mergeCache(cacheFile:str, entries:dict):
+    prepDir(getDir(cacheFile))
+    with open(cacheFile + ".lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        cache = readCacheFiles(cacheFile)
+        journaled = os.path.exists(cacheFile + ".journal")
+        if not entries and not journaled: return cache
+
+        cache.update(entries)
+        with open(cacheFile + ".tmp", "wb") as f:
+            pickle.dump(cache, f)
+        os.replace(cacheFile + ".tmp", cacheFile)
+        if journaled: os.remove(cacheFile + ".journal")
+    return cache
+
+'''
+DESC:   Appends entries to the image cache's journal instead of rewriting the
+        whole cache. Scans journal their new entries at every checkpoint and
+        only merge them into the cache when they finish, see `mergeCache`.
+        Entries are written as framed records, the same way as the result
+        log's, so a crash only loses the torn entries at the end
 
-INPUT:  A string `directory` as the file location to save to, a string
-        `file_name` as the name use for the new .dat file, and a pickle object
-        `pickle_obj` as the information to be pickled
+INPUT:  The filepath of the image cache as `cacheFile`, and a dictionary of
+        image names mapped to their new entries as `entries`
 
 OUTPUT: None
 '''
-def makePickle(directory:str, file_name:str, pickle_obj):
-    regex = re.compile(r"\.")
-    file_name_no_extension = regex.split(file_name)[0]
-    prepDir(directory)
-    with open("{0}{1}.dat".format(directory,file_name_no_extension),"wb") as f:
-        pickle.dump(pickle_obj,f)
+def journalCache(cacheFile:str, entries:dict):
+    if not entries: return
+    prepDir(getDir(cacheFile))
+    payload = pickle.dumps(entries, protocol = pickle.HIGHEST_PROTOCOL)
+    header = Result_Log.HEADER
+    with open(cacheFile + ".lock", "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        with open(cacheFile + ".journal", "a+b") as f:
+            # A record torn by a crash is cut off, or nothing after it could
+            # be read back
+            size = f.seek(0, os.SEEK_END)
+            end = f.seek(0)
+            while end + header.size <= size:
+                length = header.size + header.unpack(f.read(header.size))[0]
+                if end + length > size: break
+                end = f.seek(end + length)
+            if end < size: f.truncate(end)
+
+            f.write(header.pack(len(payload), zlib.crc32(payload)))
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+
+'''
+DESC:   Reads an entry of the image cache. Older caches only stored the facial
+        encodings, newer ones also store the face locations, and may keep the
+        encodings packed (see `Face_Matcher.packEncodings`)
+
+INPUT:  The cached entry for an image as `entry`
+
+OUTPUT: A tuple of the facial encodings and face locations found in the image
+'''
+def readCacheEntry(entry):
+    if type(entry) == dict:
+        encodings = entry["encodings"]
+        if type(encodings) != list: encodings = Face_Matcher.unpackEncodings(encodings)
+        return encodings, entry["locations"]
+    return entry, []
+
+'''
+DESC:   Reads the encodings of an image cache entry the way they are stored,
+        without unpacking them (see `Face_Matcher.stackEncodings`)
+
+INPUT:  The cached entry for an image as `entry`
+
+OUTPUT: The packed encodings, or a list of encodings for older entries
+'''
+def readPackedEncodings(entry):
+    if type(entry) == dict: return entry["encodings"]
+    return entry
+
+'''
+DESC:   Packs the encodings of an image cache entry, so large caches take less
+        memory and disk
+
+INPUT:  The cached entry for an image as `entry`, and one of
+        `Face_Matcher.PRECISIONS` as `precision`
+
+OUTPUT: The entry with its encodings packed. float64 entries are left as they
+        are, and older entries that only stored encodings are given empty
+        locations
+'''
+def packCacheEntry(entry, precision:str):
+    if precision == "float64": return entry
+    if type(entry) != dict: entry = {"encodings": entry, "locations": []}
+    packed = dict(entry)
+    packed["encodings"] = Face_Matcher.packEncodings(readCacheEntry(entry)[0], precision)
+    return packed
+
+'''
+DESC:   Calculates the distance between each face and every other face in a
+        photo, measured in average face widths
+
+INPUT:  A list of facial bounding boxes as `listOfAstroCoords`
+
+OUTPUT: An (n x n) numpy array of the distances between every pair of faces
+'''
+def custFaceDistance(listOfAstroCoords):
+    if len(listOfAstroCoords) == 0: return np.zeros((0, 0))
+    coords = np.asarray(listOfAstroCoords, dtype = np.float64)
+
+    # Compute the area of each face, and the side of the average face
+    faceArea = np.abs((coords[:,2]-coords[:,0])*(coords[:,3]-coords[:,1]))
+    avgFaceSize = max(np.sqrt(np.mean(faceArea)), 1.0)
+
+    # Find the center coordinate of each face
+    centers = np.stack([(coords[:,0]+coords[:,2])/2, (coords[:,1]+coords[:,3])/2], axis = 1)
+
+    # Compute the spatial euclidian distance between every pair of facial
+    # centerpoints at once
+    deltas = centers[:,None,:] - centers[None,:,:]
+    distances = np.sqrt(np.sum(deltas**2, axis = 2))
+
+    # Scale distance by face size to account for distance
+    # Farther away = smaller face, closer = larger face
+    return distances/avgFaceSize
+
+'''
+DESC:   Shrinks a face distance matrix to the faces that were identified,
+        keeping only the upper triangle so it can be stored compactly
+
+INPUT:  A square distance matrix as `distances` and a list of the indices of
+        the identified faces as `faces`
+
+OUTPUT: None if there are no distances to store, otherwise a dictionary with
+        the sorted face indices as "faces", and the condensed upper triangle of
+        their distance matrix (row by row) as "distances"
+'''
+def condenseDistances(distances, faces:list):
+    faces = sorted(faces)
+    if len(distances) == 0 or len(faces) < 2: return None
+    sub = np.asarray(distances)[np.ix_(faces, faces)]
+    upper = sub[np.triu_indices(len(faces), 1)]
+    return {"faces": faces, "distances": [round(float(d), 3) for d in upper]}
 
 '''
 DESC:   Prints the error message from the error log
@@ -91,6 +307,181 @@ def printErr(msg:str):
         print("\t{}".format(err_log.pop()))
 
 
+'''
+DESC:   Creates an astronaut object from a filepath to a photo
+
+INPUT:  A string filepath as `filepath`
+
+OUTPUT: Astro object, or None if the file name isn't formatted correctly
+'''
+def astroFromFile(filepath:str):
+    # Finds the name of the photo from the filepath
+    regex_noPath = re.compile(r'\/')
+    filename = regex_noPath.split(filepath)[-1]
+
+    # Finds the name and country from the file name
+    regex_nc = re.compile(r"&")
+    name_country = regex_nc.split(filename)
+
+    # Finds the astroaut's name
+    regex_names = re.compile(r"_")
+    ident = regex_names.split(name_country[0])
+
+    # Finds the astronaut's coutry
+    regex_no_dot = re.compile(r"\.")
+    country = regex_no_dot.split(name_country[1])[0]
+
+    # Removes an identifier string from the list of names
+    if "cropped" in ident:
+        ident.remove("cropped")
+
+    # If there's a middle name, assign it
+    if len(ident)==3:
+        fName, lName, mName = ident
+        return Astro.Astronaut(country,fName,lName,mName)
+    # If there's not, don't
+    elif len(ident)==2:
+        fName, lName = ident
+        return Astro.Astronaut(country, fName, lName)
+    # If there are the wrong number of names, print an error
+    else:
+        print("\tERROR: Incorrectly formatted file name: {}\n\tFiles must be named <first name>_<lastname>&country.jpg".format(filename))
+        print("\tFile will be ignored")
+        return None
+
+'''
+DESC:   Rotates points in a given image a certain number of times. This has
+        the effect of turning an xy plane 90º for every rotation specified
+
+INPUT:  The x/y coordinates of a point as `x` and `y`, the image that's being
+        referenced as `img`, the number of times to be rotated as `times`, and
+        the direction to be rotated as dir
+
+OUTPUT: A new, rotated, x/y pair of coordinates
+'''
+# Checked in `rotationTest.py` and it works as expected
+def rotateCoordinates90(x, y, img, times, dir = "r"):
+    x_max, y_max, z_max = img.shape
+
+    if dir == "r":
+        times = -times%4
+    elif dir == "l":
+        times = times%4
+    else:
+        raise ValueError("\'dir\' must be either \'r\' or \'l\'")
+
+    if times == 0:
+        return x,y
+    elif times == 1:
+        return y, x_max-x
+    elif times == 2:
+        return x_max-x, y_max-y
+    else:
+        return y_max-y, x
+
+'''
+DESC:   Takes a given image and list of facial locations and returns the
+        rotated version of those encodings
+
+INPUT:  A list of facial bounding box locations as `locations`, the image
+        being used for reference as `img`, and the number of times that the
+        points are to be rotated as `times`
+
+OUTPUT: A list of new facial locations that have been rotated the appropriate
+        number of times
+'''
+def rotateAllLocations(locations, img, times):
+    newEncodings = []
+    # Updates every rectangle (x1,y1,x2,y2) in locations
+    for rect in locations:
+        # Appends the rotated coordinates to the list of new encodings
+        # Since the image rotates left every time, we want to rotate the
+        # opposite direction (right), which is the default
+        newEncodings.append(rotateCoordinates90(rect[0], rect[1], img, times)+
+        rotateCoordinates90(rect[2], rect[3], img, times));
+
+    return newEncodings
+
+'''
+DESC:   Picks the detector upsample count and model for an image from its size
+        and, where the size alone doesn't settle it, a first pass that looks
+        for faces upright without upsampling. HOG only finds faces of about
+        `HOG_FACE` pixels or more without upsampling, so:
+            - Thumbnails are upsampled twice, which is cheap at their size.
+              Only if `allowCnn` is set does a first pass run, and if it found
+              nothing the CNN model is used instead, which finds small and
+              turned faces HOG misses but is far slower on a CPU
+            - Close-ups, where every face found spans at least `CLOSE_UP` of
+              the image's shorter side, aren't upsampled, and the first pass
+              is reused as their upright search
+            - Everything else is upsampled once, as scans always were. A large
+              face in a large image doesn't rule out small faces beside it
+
+INPUT:  The image to be scanned for faces, `img`, as a numpy array, and
+        whether the CNN model may be picked as `allowCnn`
+
+OUTPUT: A tuple of the upsample count, the model, the reason they were picked,
+        and the face locations the first pass found, or None if it didn't run
+'''
+def chooseDetector(img, allowCnn:bool = False):
+    shortSide = min(img.shape[:2])
+    if shortSide < SMALL_SIDE and not allowCnn: return 2, "hog", "thumbnail", None
+
+    firstPass = face_recognition.face_locations(img, 0, "hog")
+    sizes = [min(bottom - top, right - left) for top, right, bottom, left in firstPass]
+
+    if shortSide < SMALL_SIDE:
+        if not firstPass: return 1, "cnn", "thumbnail without faces", firstPass
+        return 2, "hog", "thumbnail", firstPass
+    if sizes and min(sizes) >= CLOSE_UP * shortSide: return 0, "hog", "close-up", firstPass
+    return 1, "hog", "default", firstPass
+
+'''
+DESC:   Finds every face in an image, rotating the image 4 times to make sure
+        that sideways and upside down faces are found. This is the detection
+        pass used by `Master_Model`, and its result is what gets stored in the
+        image cache
+
+INPUT:  The image to be scanned for faces, `img`, as a numpy array, the
+        number of times the detector upsamples the image to find smaller faces
+        as `upsample` (None picks it per image, see `chooseDetector`), the
+        face_recognition detector `model` ("hog" or "cnn"), and whether a
+        per image pick may use the CNN model as `allowCnn`
+
+OUTPUT: A dictionary with the facial "encodings", their "locations" rotated back
+        onto the original image (see `Master_Model.encodeWithRotation`), the
+        number of left "rotations" of the image each face was found in, each
+        face's "boxes" as (top, right, bottom, left) in that rotated image, and
+        the "detector" used: its "upsample", "model", the "reason" it was
+        picked, and the "seconds" detection took
+'''
+def detectFaces(img, upsample:int = 1, model:str = "hog", allowCnn:bool = False):
+    start = time.time()
+    entry = {"encodings": [], "locations": [], "rotations": [], "boxes": []}
+    firstPass = None
+    reason = "fixed"
+    if upsample is None: upsample, model, reason, firstPass = chooseDetector(img, allowCnn)
+
+    for i in range (0,4):
+        # Accoring to the docs, np.rot90 rotates to the left by default,
+        # which is the same as in our test. dlib's encoder needs a contiguous
+        # copy rather than a rotated view
+        imgSub = np.ascontiguousarray(np.rot90(img, k=i))
+        # Find the face locations in each revolution of the photo. The
+        # upright first pass is already the search to do without upsampling
+        if i == 0 and firstPass is not None and (upsample, model) == (0, "hog"): loc = firstPass
+        else: loc = face_recognition.face_locations(imgSub, upsample, model)
+        # Encode the faces that were just located instead of searching again
+        entry["encodings"] += face_recognition.face_encodings(imgSub, loc)
+        # Rotate the facial locations
+        entry["locations"] += rotateAllLocations(loc, img, i)
+        entry["rotations"] += [i] * len(loc)
+        entry["boxes"] += [tuple(int(v) for v in box) for box in loc]
+
+    entry["detector"] = {"upsample": upsample, "model": model, "reason": reason,
+        "seconds": round(time.time() - start, 3)}
+    return entry
+
 '''
 Model trained to find all astronauts. Contains methods for adding astronauts to
 model,searching a picture for astronauts, or searching all pictures in a
@@ -121,8 +512,25 @@ class Master_Model:
 
         self.parent_dir = '/'.join(train_dir.split('/')[0:-2])
         self.cache_dir = self.parent_dir + '/Temp'
+        # Where older versions pickled every result, moved into the result
+        # log the first time it is opened
         self.input_cache =  self.cache_dir + '/Photo_Bin'
         self.main_cache = self.cache_dir + "/Input_Cache.dat"
+        self.checkpoint_dir = self.cache_dir + "/Scan_Checkpoints/"
+        self.result_log_dir = self.cache_dir + "/Result_Log"
+        self.result_log = None
+        self.gallery = None
+        self.run_id = None
+        # The precision new cache entries and the gallery are packed in
+        self.encoding_precision = "float64"
+        # How many times the detector upsamples images, see `Scan_Tuner`.
+        # None picks the upsample count and model per image, which costs an
+        # extra upright pass on most images, so it's only used when asked for
+        self.upsample = 1
+        self.allow_cnn = False
+        # How many images each detector path was taken for, and how long they
+        # took, see `detectorStats`
+        self.detector_counts = {}
 
         # Initialize parameters
         self.astro_pickle_dir = astro_pickle_dir
@@ -130,15 +538,17 @@ class Master_Model:
         self.known_faces = self.itemizeKnown()
         self.found_faces = {}
         self.img_cache = {}
-        self.cache_path = self.input_cache + '/'
+        # Cache entries detected since the image cache was last saved
+        self.new_entries = {}
+        # The number of images collected from scanning processes, so a scan's
+        # progress can be watched from another thread
+        self.harvested = 0
 
         # Train the model on all of the faces in the training directory
         self.train(train_dir)
 
         # Load all photos from the cache
-        if os.path.exists(self.main_cache):
-            with open(self.main_cache,'rb') as f:
-                self.img_cache = pickle.load(f)
+        self.img_cache = loadCache(self.main_cache)
 
     '''
     DESC:   Outputs the found faces
@@ -272,39 +682,7 @@ class Master_Model:
     OUTPUT: Astro object
     '''
     def astroInit(self, filepath):
-        # Finds the name of the photo from the filepath
-        regex_noPath = re.compile(r'\/')
-        filename = regex_noPath.split(filepath)[-1]
-
-        # Finds the name and country from the file name
-        regex_nc = re.compile(r"&")
-        name_country = regex_nc.split(filename)
-
-        # Finds the astroaut's name
-        regex_names = re.compile(r"_")
-        ident = regex_names.split(name_country[0])
-
-        # Finds the astronaut's coutry
-        regex_no_dot = re.compile(r"\.")
-        country = regex_no_dot.split(name_country[1])[0]
-
-        # Removes an identifier string from the list of names
-        if "cropped" in ident:
-            ident.remove("cropped")
-
-        # If there's a middle name, assign it
-        if len(ident)==3:
-            fName, lName, mName = ident
-            return Astro.Astronaut(country,fName,lName,mName)
-        # If there's not, don't
-        elif len(ident)==2:
-            fName, lName = ident
-            return Astro.Astronaut(country, fName, lName)
-        # If there are the wrong number of names, print an error
-        else:
-            print("\tERROR: Incorrectly formatted file name: {}\n\tFiles must be named <first name>_<lastname>&country.jpg".format(filename))
-            print("\tFile will be ignored")
-            return None
+        return astroFromFile(filepath)
 
     '''
     DESC:   Initializes an astronaut from a filepath and loads their facial data
@@ -328,89 +706,76 @@ class Master_Model:
 
     Parameters:
         img_path:str = path of image to search for astronaut faces.
+        queue:mp.Queue = An (image name, new cache entry or None, error or
+        None, result or None) tuple is sent to the parent once the image is
+        done, so the parent can keep the cache, error log, and result this
+        process builds
+        run_id:str = The id of the scan, saved with the result
 
     Returns:
         img_entry:dict = Dictionary object consisting of (a:i) pairs where a is
         the found astronaut, i is the index of the face attributed to the
         astronaut. Indicies are generated by the face_recognition library.
     '''
-    def findFaces(self,img_path:str, sem:mp.Semaphore, lock:mp.Lock):
-        # A dictionary of all of the astronauts found in the photo
-        img_entry = {}
-        # Unknown faces found
-        unknown_encodings = None
-        # Location data that hasn't been labled yet
-        unknown_locations = []
-        # Whether the image is found in the cache
-        found_in_cache = False
+    def findFaces(self,img_path:str, sem:mp.Semaphore, lock:mp.Lock, queue, run_id = None):
         # Get the name of the file from path
         img_name = getFileName(img_path)
-
-        picklePath = '{0}/{1}.dat'.format(self.cache_path, img_name.split('.')[0])
-
-        # If we're supposed to look in the cache
-        if cache_img:
-            if img_name in self.img_cache:
-                # Assign already-found encodings
-                unknown_encodings = self.img_cache[img_name]
-                found_in_cache = True
-            elif os.path.exists(picklePath):
-                with open(picklePath,"rb") as f:
-                    self.img_cache[img_name] = pickle.load(f)
-                sem.release()
-                return
-
-        # If the image is not in the cache
-        if not found_in_cache:
-            try:
+        # The scanning process always reports back and frees its slot, even if
+        # the image can't be read, or the parent would wait for it forever
+        try:
+            # Unknown faces found
+            unknown_encodings = None
+            # Location data that hasn't been labled yet
+            unknown_locations = []
+            # Whether the image is found in the cache
+            found_in_cache = False
+            # The cache entry made for the image, if it had to be detected
+            new_entry = None
+
+            # If we're supposed to look in the cache
+            if cache_img:
+                if img_name in self.img_cache:
+                    # Assign already-found encodings
+                    unknown_encodings, unknown_locations = readCacheEntry(self.img_cache[img_name])
+                    found_in_cache = True
+
+            # If the image is not in the cache
+            if not found_in_cache:
                 unknown_image = face_recognition.load_image_file(img_path)
                 # Find dacial encodings and locations from the image
-                unknown_encodings, unknown_locations = self.encodeWithRotation(unknown_image)
-
-                # Save the encodings and locations to the cache
-                # self.img_cache[img_name] = (unknown_encodings,unknown_locations)
-                self.img_cache[img_name] = unknown_encodings
-
-            except IndexError:
-                lock.acquire()
-                err_log.append("\tI wasn't able to locate any faces in image: {} ... Image will not be included in results".format(img_path))
-                lock.release()
-                return None
+                new_entry = detectFaces(unknown_image, self.upsample, allowCnn = self.allow_cnn)
+                unknown_encodings, unknown_locations = new_entry["encodings"], new_entry["locations"]
 
-        # Find the distances between every astronaut and every other astronaut
-        face_dist = self.custFaceDistance(unknown_locations)
+                # Save the encodings, locations, and rotations to the cache
+                self.img_cache[img_name] = new_entry
 
-        # For every file in the pickling directory
-        for filename in os.listdir(self.astro_pickle_dir):
-            fullpath = self.astro_pickle_dir+filename
-
-            # Initialize astronaut
-            astro = self.loadAstro(fullpath)
-            if astro == None:
-                return None
+            # Find the distances between every astronaut and every other astronaut
+            face_dist = self.custFaceDistance(unknown_locations)
 
-            # Check their face against the encodings and which people match
-            found_arr = astro.checkFace(unknown_encodings)
+            # Match every face against the whole gallery at once
+            if self.gallery is None:
+                self.gallery = Face_Matcher.loadGallery(self.astro_pickle_dir, self.encoding_precision)
+            unrepeated = Face_Matcher.matchFaces(self.gallery, unknown_encodings)
 
-            # Find a list of deltas to the faces
-            facailSimilarities = astro.faceDistance(unknown_encodings)
+            # Pickle the results without repeats, along with the distances between
+            # the faces that were identified
+            identified = [i for indices in unrepeated.values() for i in indices]
+            pickle_obj = (img_name, unrepeated, condenseDistances(face_dist, identified), run_id)
+            queue.put((img_name, new_entry, None, pickle_obj))
 
-            # Skip the face if no one matched
-            if sum(found_arr) == 0 :
-                continue
-            # If there was a match
+        except Exception as e:
+            if isinstance(e, IndexError):
+                msg = "\tI wasn't able to locate any faces in image: {} ... Image will not be included in results".format(img_path)
             else:
-                # Create an entry for the image
-                img_entry[astro.filename] = []
-                for i in range(len(found_arr)):
-                    # Add astronauts to dictionary of people in the image
-                    if found_arr[i] != 0:
-                        img_entry[astro.filename].append((i,facailSimilarities[i], face_dist))
+                msg = "\tI wasn't able to read image: {0} ({1}: {2}) ... Image will not be included in results".format(
+                    img_path, type(e).__name__, e)
+            lock.acquire()
+            err_log.append(msg)
+            lock.release()
+            queue.put((img_name, None, msg, None))
 
-        # Pickle the results without repeats
-        pickle_obj = (img_name, self.deleteRepeats(img_entry))
-        makePickle(self.cache_path,img_name,pickle_obj)
-        sem.release()
+        finally:
+            sem.release()
 
     '''
     DESC:   Deletes the repeated faces in a photo
@@ -420,27 +785,7 @@ class Master_Model:
     OUTPUT: A dictionary of non-repeated faces
     '''
     def deleteRepeats(self,faces:dict):
-        unrepeated_faces = {}
-        seen_index = []
-
-        for k_1 in faces:
-            for t_1 in faces[k_1]:
-                current_index = t_1[0]
-                current_distance = t_1[1]
-                if current_index in seen_index: continue
-                seen_index.append(current_index)
-                entry = (k_1,current_index)
-                for k_2 in faces:
-                    for t_2 in faces[k_2]:
-                        if current_index == t_2[0]:
-                            if t_2[1]< current_distance:
-                                entry = (k_2,current_index)
-            if entry[0] in unrepeated_faces:
-                if not entry[1] in unrepeated_faces[entry[0]]:
-                    unrepeated_faces[entry[0]].append(entry[1])
-            else:
-                unrepeated_faces[entry[0]] = [entry[1]]
-        return unrepeated_faces
+        return Face_Matcher.deleteRepeats(faces)
 
 
     '''
@@ -451,6 +796,13 @@ class Master_Model:
         cache_search:bool = True value indicates that dictionary should be
         pickled and stored for future quick retrevial. Only set to false if
         very confident that no images in the directory will be searched again.
+        dedup:bool = True value indicates that near-duplicate images are only
+        scanned once. Every group of duplicates is represented by its largest
+        image, and the other images in the group copy its results
+        dedup_threshold:int = The largest number of differing perceptual hash
+        bits for two images to count as duplicates
+        resume:bool = Same as in findFacesFiles
+        checkpoint_every:int = Same as in findFacesFiles
 
         Side-Effect: Adds entries (img: dict) to found_faces dictionary, where
         img is the filepath of an image and the dict is the dictionary returned
@@ -461,40 +813,270 @@ class Master_Model:
         Side-Effects. Note that the returned variable is also an instance
         variable of the class.
     '''
-    def findFacesDir(self, img_dir, cache_search = True):
+    def findFacesDir(self, img_dir, cache_search = True, dedup = False, dedup_threshold = 6,
+        resume = False, checkpoint_every = 100):
+        print("Looking for learned faces in all images in {0} using {1} threads".format(img_dir, self.num_threads))
+
+        # Finds the jpg files
+        regex = re.compile(r"\.")
+        images = [img_dir + f for f in os.listdir(img_dir) if regex.split(f)[-1] == "jpg"]
+
+        # Group near-duplicates so only one image per group gets scanned
+        groups = {}
+        duplicates = set()
+        if dedup:
+            groups = Image_Dedup.findDuplicates(images, dedup_threshold,
+                hashFile = self.cache_dir + '/Hash_Cache.json', numProcesses = self.num_threads)
+            Image_Dedup.saveGroups(groups, self.cache_dir + '/Duplicate_Groups.json', images)
+            duplicates = {p for others in groups.values() for p in others}
+            print("Found {0} near-duplicate images in {1} groups".format(len(duplicates), len(groups)))
+
+        self.findFacesFiles([p for p in images if p not in duplicates], cache_search,
+            resume, checkpoint_every)
+
+        # Duplicates get a copy of their representative's results, which is
+        # also logged so it is found like any other result next time
+        for representative, others in groups.items():
+            rep_name = getFileName(representative)
+            if rep_name not in self.found_faces: continue
+            entry = self.found_faces[rep_name]
+            for other in others:
+                other_name = getFileName(other)
+                self.found_faces[other_name] = copy.deepcopy(entry)
+                Result_Log.appendRecord(self.result_log, (other_name, entry[0],
+                    entry[1] if len(entry) > 1 else None, self.run_id))
+        if groups: Result_Log.syncLog(self.result_log)
+
+        if not os.path.isdir("{0}/{1}".format(self.parent_dir, img_dir)):
+            os.mkdir("{0}/{1}".format(self.parent_dir, img_dir))
+
+        return self.found_faces
+
+    '''
+    Method searches the given images for astronaut faces. The image cache is
+    checkpointed as the scan goes, so a scan that dies part of the way through
+    can be resumed from the last checkpoint
+
+    Parameters:
+        img_paths:list = paths of the images to search
+        cache_search:bool = Same as in findFacesDir
+        resume:bool = True value continues the last scan of the same images,
+        skipping every image it had committed. Otherwise a new scan is started
+        checkpoint_every:int = The number of finished images between saves of
+        the image cache and the scan's progress
+        abort:threading.Event = If given and set while the scan runs, no more
+        images are started and running processes are terminated. What was
+        finished is checkpointed, so the scan can still be resumed
+        merge_cache:bool = True value merges the new cache entries into the
+        image cache when the scan ends. False leaves them in the cache's
+        journal, for callers that scan many small batches and merge with
+        `mergeCache` every so often
+
+        Side-Effect: Adds entries (img: dict) to found_faces dictionary, as
+        in findFacesDir. Results are kept in the result log, and only
+        results made by this scan are loaded
+
+    Returns:
+        found_faces = dictionary containing entries (img:dict)
+    '''
+    def findFacesFiles(self, img_paths, cache_search = True, resume = False, checkpoint_every = 100,
+        abort = None, merge_cache = True):
         semaphore = mp.Semaphore(self.num_threads)
         processes = []
         lock = mp.Lock()
-        print("Looking for learned faces in all images in {0} using {1} threads".format(img_dir, self.num_threads))
-        prepDir(self.cache_path)
-
-        # Cycles through all filenames
-        for filename in os.listdir(img_dir):
-            # Finds the jpg files
-            regex = re.compile(r"\.")
-            if regex.split(filename)[-1] != "jpg": continue
-            print("Analyzing image",filename)
-            fullpath = img_dir+filename
-            semaphore.acquire()
+        queue = mp.Queue()
+        if self.result_log is None:
+            self.result_log = Result_Log.openLog(self.result_log_dir)
+            Result_Log.migratePhotoBin(self.result_log, self.input_cache)
+        # Loaded once here so every scanning process inherits it
+        self.gallery = Face_Matcher.loadGallery(self.astro_pickle_dir, self.encoding_precision)
+
+        names = sorted(getFileName(p) for p in img_paths)
+        checkpoint = self.loadCheckpoint(names) if resume else None
+        if checkpoint is None:
+            checkpoint = {"run_id": uuid.uuid4().hex, "images": names, "committed": []}
+            committed = set()
+        else:
+            # Results logged after the last checkpoint are kept too
+            committed = set(checkpoint["committed"])
+            committed.update(r[0] for r in Result_Log.replayLog(self.result_log,
+                [n for n in names if n not in committed]) if r[3] == checkpoint["run_id"])
+            print("Resuming scan {0}, {1} of {2} images are already done".format(
+                checkpoint["run_id"], len(committed), len(names)))
+        self.run_id = checkpoint["run_id"]
+
+        aborted = lambda: abort is not None and abort.is_set()
+        uncommitted = 0
+        for fullpath in img_paths:
+            if getFileName(fullpath) in committed: continue
+            if aborted(): break
+            print("Analyzing image",getFileName(fullpath))
+
+            # Collect finished images while waiting for a free process
+            while not semaphore.acquire(timeout = 0.5):
+                uncommitted += self.harvestResults(queue, committed)
+                if aborted(): break
+            if aborted(): break
+            uncommitted += self.harvestResults(queue, committed)
+            if uncommitted >= checkpoint_every:
+                self.saveCheckpoint(checkpoint, committed)
+                uncommitted = 0
+
             # Creates a list of processes to run the faces
-            p = Process(target = self.findFaces, args = (fullpath, semaphore,lock))
+            p = Process(target = self.findFaces, args = (fullpath, semaphore, lock, queue, self.run_id))
             processes.append(p)
             p.start()
-
-        # Join processes
+            processes = [proc for proc in processes if proc.is_alive()]
+
+        # Processes can't exit until the parent has read what they sent
+        while any(proc.is_alive() for proc in processes) and not aborted():
+            self.harvestResults(queue, committed, timeout = 0.5)
+        if aborted():
+            # A terminated process may leave half a message, so nothing more
+            # is read from the queue
+            for proc in processes: proc.terminate()
+        else:
+            self.harvestResults(queue, committed)
         for proc in processes: proc.join()
+        self.saveCheckpoint(checkpoint, committed, final = merge_cache)
 
         # Load the results of all of the image processing
-        self.unpickleResults()
+        for result in Result_Log.replayLog(self.result_log, names):
+            if result[3] == self.run_id: self.addResult(result)
         printErr("While processing the images the following errors occured:")
-        if not os.path.isdir("{0}/{1}".format(self.parent_dir, img_dir)):
-            os.mkdir("{0}/{1}".format(self.parent_dir, img_dir))
+        for path, stats in self.detectorStats().items():
+            print("\t{0}: {1} images ({2:.0%}), {3:.2f}s per image".format(
+                path, stats["images"], stats["share"], stats["perImage"]))
 
-        with open(self.main_cache,"wb") as f:
-            pickle.dump(self.img_cache,f)
+        if Result_Log.garbageRatio(self.result_log) > 0.5: Result_Log.compactLog(self.result_log)
 
         return self.found_faces
 
+    '''
+    DESC:   Collects the images finished by the scanning processes, adding their
+            new cache entries and errors to the parent's copies and their
+            results to the result log
+
+    INPUT:  The queue the processes report to as `queue`, the set of finished
+            image names to add to as `committed`, and how long to wait for the
+            first report in seconds as `timeout` (0 doesn't wait)
+
+    OUTPUT: The number of images collected
+    '''
+    def harvestResults(self, queue, committed:set, timeout:float = 0):
+        count = 0
+        while True:
+            try:
+                if timeout and count == 0: img_name, entry, error, result = queue.get(timeout = timeout)
+                else: img_name, entry, error, result = queue.get_nowait()
+            except Empty:
+                return count
+            if entry is not None:
+                self.img_cache[img_name] = packCacheEntry(entry, self.encoding_precision)
+                self.new_entries[img_name] = self.img_cache[img_name]
+                self.countDetector(entry)
+            if error is not None: err_log.append(error)
+            if result is not None: Result_Log.appendRecord(self.result_log, result)
+            committed.add(img_name)
+            count += 1
+            self.harvested += 1
+
+    '''
+    DESC:   Counts the detector path a newly detected image took
+
+    INPUT:  The image's new cache entry as `entry`
+
+    OUTPUT: None
+    '''
+    def countDetector(self, entry):
+        detector = entry.get("detector")
+        if detector is None: return
+        path = "{0} x{1} ({2})".format(detector["model"], detector["upsample"], detector["reason"])
+        counts = self.detector_counts.setdefault(path, {"images": 0, "seconds": 0.0})
+        counts["images"] += 1
+        counts["seconds"] += detector["seconds"]
+
+    '''
+    DESC:   Summarizes how often each detector path was taken
+
+    INPUT:  Self
+
+    OUTPUT: A dictionary where keys are detector paths and values hold the
+            number of "images", their "share" of every detected image, the
+            total "seconds", and the seconds "perImage"
+    '''
+    def detectorStats(self):
+        total = sum(c["images"] for c in self.detector_counts.values())
+        return {path: {"images": c["images"], "share": c["images"] / total,
+            "seconds": round(c["seconds"], 3), "perImage": c["seconds"] / c["images"]}
+            for path, c in sorted(self.detector_counts.items())}
+
+    '''
+    DESC:   Loads the checkpoint of an earlier scan of the same images
+
+    INPUT:  The sorted names of the images being scanned as `names`
+
+    OUTPUT: The checkpoint, or None if there isn't one for these images
+    '''
+    def loadCheckpoint(self, names:list):
+        path = self.checkpointPath(names)
+        if not os.path.exists(path): return None
+        with open(path) as f:
+            checkpoint = json.load(f)
+        if checkpoint["images"] != names: return None
+        return checkpoint
+
+    '''
+    DESC:   Syncs the result log, then saves the new cache entries and the
+            scan's progress. Until the scan's last checkpoint the entries are
+            only journaled (see `journalCache`), so a checkpoint costs as much
+            as the images since the last one rather than the whole cache. The
+            progress is written to a temporary file and renamed, so a crash
+            leaves the last checkpoint intact, and images are only marked as
+            committed once their results and cache entries are saved. Once
+            every image is committed there is nothing to resume, and the
+            checkpoint is deleted
+
+    INPUT:  The checkpoint being updated as `checkpoint`, the set of finished
+            image names as `committed`, and whether this is the scan's last
+            checkpoint, which merges the journaled entries into the image
+            cache (see `mergeCache`), as `final`
+
+    OUTPUT: None
+    '''
+    def saveCheckpoint(self, checkpoint:dict, committed:set, final:bool = False):
+        Result_Log.syncLog(self.result_log)
+        if final:
+            # The cache on disk may hold less than this scan started with, for
+            # example a shard node's cache of the images it detected itself
+            self.img_cache.update(mergeCache(self.main_cache, self.new_entries))
+        else:
+            journalCache(self.main_cache, self.new_entries)
+        self.new_entries = {}
+
+        path = self.checkpointPath(checkpoint["images"])
+        if committed.issuperset(checkpoint["images"]):
+            if os.path.exists(path): os.remove(path)
+            return
+        checkpoint["committed"] = sorted(committed)
+        prepDir(self.checkpoint_dir)
+        with open(path + ".tmp","w") as f:
+            json.dump(checkpoint,f)
+        os.replace(path + ".tmp", path)
+
+    '''
+    DESC:   Finds where the checkpoint of a scan is saved. Every set of images
+            gets its own checkpoint, so scanning one directory doesn't throw
+            away the progress of another
+
+    INPUT:  The sorted names of the images being scanned as `names`
+
+    OUTPUT: The filepath of the checkpoint
+    '''
+    def checkpointPath(self, names:list):
+        digest = hashlib.sha1(json.dumps(names).encode()).hexdigest()[:16]
+        return "{0}{1}.json".format(self.checkpoint_dir, digest)
+
     '''
     DESC:   Lists all of the astronauts already known
 
@@ -511,18 +1093,18 @@ class Master_Model:
         return known_astro
 
     '''
-    DESC:   Loads all of the results from memory
+    DESC:   Adds the result of an image to found_faces
 
-    INPUT:  None
+    INPUT:  A result as `result`, made of the image name, its unrepeated
+            faces, and optionally the distances between them and the scan id
 
     OUTPUT: None
     '''
-    def unpickleResults(self):
-        for filename in os.listdir(self.cache_path):
-            with open(self.cache_path + filename,"rb") as f:
-                result = pickle.load(f)
-                self.found_faces[result[0]] = [result[1]]
-        # shutil.rmtree('../Data/Temp/Photo_Bin/')
+    def addResult(self, result):
+        self.found_faces[result[0]] = [result[1]]
+        # Keep the distances between faces if they were recorded
+        if len(result) > 2 and result[2] is not None:
+            self.found_faces[result[0]].append(result[2])
 
     '''
     DESC:   Rotates points in a given image a certain number of times. This has
@@ -536,23 +1118,7 @@ class Master_Model:
     '''
     # Checked in `rotationTest.py` and it works as expected
     def rotateCoordinates90(self, x, y, img, times, dir = "r"):
-        x_max, y_max, z_max = img.shape
-
-        if dir == "r":
-            times = -times%4
-        elif dir == "l":
-            times = times%4
-        else:
-            raise ValueError("\'dir\' must be either \'r\' or \'l\'")
-
-        if times == 0:
-            return x,y
-        elif times == 1:
-            return y, x_max-x
-        elif times == 2:
-            return x_max-x, y_max-y
-        else:
-            return y_max-y, x
+        return rotateCoordinates90(x, y, img, times, dir)
 
     '''
     DESC:   Finds all of the facial encodings in an image as well as the
@@ -568,21 +1134,8 @@ class Master_Model:
             the person's face
     '''
     def encodeWithRotation(self, img):
-        faces = []
-        locs = []
-
-        for i in range (0,4):
-            # Accoring to the docs, np.rot90 rotates to the left by default,
-            # which is the same as in our test
-            imgSub = np.rot90(img, k=i)
-            # Find the face locations in each revolution of the photo
-            loc = face_recognition.face_locations(imgSub)
-            # Grab all of the visible face encodings
-            faces += face_recognition.face_encodings(imgSub)
-            # Rotate the facial locations
-            locs += self.rotateAllLocations(loc, img, i)
-
-        return faces, locs
+        entry = detectFaces(img)
+        return entry["encodings"], entry["locations"]
 
     '''
     DESC:   Takes a given image and list of facial locations and returns the
@@ -596,16 +1149,7 @@ class Master_Model:
             appropriate number of times
     '''
     def rotateAllLocations(self, locations, img, times):
-        newEncodings = []
-        # Updates every rectangle (x1,y1,x2,y2) in locations
-        for rect in locations:
-            # Appends the rotated coordinates to the list of new encodings
-            # Since the image rotates left every time, we want to rotate the
-            # opposite direction (right), which is the default
-            newEncodings.append(self.rotateCoordinates90(rect[0], rect[1], img, times)+
-            self.rotateCoordinates90(rect[2], rect[3], img, times));
-
-        return newEncodings
+        return rotateAllLocations(locations, img, times)
 
     '''
     DESC:   Calculates the distance between each face and every other face in
@@ -617,38 +1161,12 @@ class Master_Model:
             [(x1,y1,x2,y2),...], where 1 is the bottom left and 2 is the top
             right of the box.
 
-    OUTPUT: A list of distances between each astronaut and every other
-            astronaut. The list is in the format [[d1,...,dn],...], where every
-            index of the outer list cooresponds to an astroaut found in the
-            image, and every element of the inner list cooresponds to an
-            astronaut. The astronauts in the same order in both the inner and
-            outer list, so astronaut at index [n] of the outer list would be at
-            index [n][n] of the outer list.
+    OUTPUT: A matrix of distances between each astronaut and every other
+            astronaut, measured in average face widths. The matrix is an
+            (n x n) numpy array, where every row cooresponds to an astroaut
+            found in the image, and every column cooresponds to an
+            astronaut. The astronauts in the same order in both the rows and
+            columns, so astronaut at row [n] would be at index [n][n].
     '''
     def custFaceDistance(self, listOfAstroCoords):
-        if listOfAstroCoords == []: return []
-
-        # Compute the area of each face
-        faceArea = np.array([((x[2]-x[0])*x[3]-x[1]) for x in listOfAstroCoords])
-        # Compute the average face area
-        avgFaceArea = np.sum(faceArea)/len(faceArea)
-
-        # Find the center coordinate of each face
-        centers = [[(x[2]-x[0])/2, (x[3]-x[1])/2] for x in listOfAstroCoords]
-        distances = []
-
-        # Cycle through the center points for every astronaut
-        for x1,y1 in centers:
-            # Holds the distances relative to the current astronaut
-            tempDistances = []
-            # Cycle through the center points for every astronaut again
-            for x2,y2 in centers:
-                # Compute the spatial euclidian distance between the given
-                # facial centerpoints
-                distance = ((x2-x1)**2+(y2-y1)**2)**(1/2.0)
-
-                # Scale distance by face area to account for distance
-                # Farther away = smaller face, closer = larger face
-                tempDistances.append(distance/avgFaceArea)
-            distances.append(tempDistances)
-        return distances
+        return custFaceDistance(listOfAstroCoords)
@@ -7,12 +7,27 @@
 import Main_Model
 import os
 import json
+import pickle
+import shutil
+import multiprocessing as mp
+import numpy as np
+from scipy import sparse
+from scipy.spatial.distance import squareform
 from apyori import apriori
+import Eclat_Miner
+import Pair_Significance
+import Edge_List
+import Image_Dedup
+import Result_Log
 import re # might be able to remove
 from Loading_Bar import Loading_Bar as lb
 from time import time
 import datetime
 
+# Bumped whenever the incremental state changes how photos are counted, so a
+# state saved by an older version is recounted instead of trusted
+STATE_VERSION = 3
+
 '''
 DESC:   Loads all of the photo data from the given directory and returns it in
         a dictionary
@@ -23,13 +38,15 @@ INPUT:  sourceDir:str = "../Data/Scan_Result"
             - Whether the function will output a status of what it's doing
 
 OUTPUT: Returns a dictionary where the keys are photo names and the values are
-        lists of astronauts in the photo
+        lists of astronauts in the photo. A photo that is in more than one file
+        is taken from the last file in sorted order, the same way
+        `updateModel` and `runPartitioned` count it
 '''
 def loadPhotos(sourceDir:str = '../Data/Scan_Result', verbose:bool = False):
     photos = {}
 
     # Get all json files in the directory
-    files = [f for f in os.listdir(sourceDir) if ".json" in f]
+    files = sorted(f for f in os.listdir(sourceDir) if f.endswith(".json"))
 
     #  If there are no json files
     if verbose and not files:
@@ -58,6 +75,29 @@ def loadPhotos(sourceDir:str = '../Data/Scan_Result', verbose:bool = False):
     return photos
 
 
+'''
+DESC:   Drops photos that are near-duplicates of another loaded photo, so every
+        group of duplicates found by `Image_Dedup` is only counted once
+
+INPUT:  photos:dict
+            - A dictionary of photo data
+        dupFileName:str = "../Data/Temp/Duplicate_Groups.json"
+            - Where the duplicate groups were saved by `Main_Model`
+        verbose:bool = False
+            - Whether the function will output a status of what it's doing
+
+OUTPUT: A dictionary of photo data without the duplicates
+'''
+def dropDuplicates(photos:dict, dupFileName:str = "../Data/Temp/Duplicate_Groups.json",
+    verbose:bool = False):
+    duplicates = Image_Dedup.loadGroups(dupFileName)
+
+    # A duplicate is only dropped while its representative is there to count it
+    kept = {k: v for k, v in photos.items() if duplicates.get(k) not in photos}
+    if verbose: print("\tDropped {0} duplicate photos".format(len(photos) - len(kept)))
+    return kept
+
+
 '''
 DESC:   Gets lists of astronauts in each photo
 
@@ -75,7 +115,7 @@ def generateTransactions(photos:dict, verbose:bool = False):
     for k in photos.keys():
         # if verbose: print('\t{0}'.format(k))
         # Grabs the lists of astronauts in each photo
-        transactions += [[k2 for k2 in list] for list in photos[k]]
+        transactions.append(photoAstronauts(photos[k]))
         if verbose: bar.update()
 
     if verbose: bar.update(True)
@@ -136,18 +176,88 @@ def runApriori(transactions:list, verbose:bool = False, threshold = 6):
         min_lift=1.0, max_length=threshold))
 
 
+'''
+DESC:   Mines frequent groups of astronauts of any size with the parallel Eclat
+        miner. Uses the same support/confidence/lift cutoffs as `runApriori`,
+        but stays fast for large values of `threshold`
+
+INPUT:  transactions:list
+            - A list of lists, where each inner list is a list of astronauts in
+            each photo
+        threshold:int = 6
+            - The largest group size to mine
+        numProcesses:int = None
+            - The number of worker processes. Defaults to the number of cores
+
+OUTPUT: A dictionary with the number of "transactions", the frequent
+        "itemsets" (tuples of names mapped to counts), and the "rules" derived
+        from them
+'''
+def runEclat(transactions:list, verbose:bool = False, threshold:int = 6,
+    numProcesses:int = None):
+    if verbose: print('Running eclat algorithm on groups of up to {0} astronauts'.format(threshold))
+
+    itemsets = Eclat_Miner.mineItemsets(transactions, 0.01, threshold, numProcesses)
+    rules = Eclat_Miner.findRules(itemsets, len(transactions), 0.80, 1.0)
+
+    if verbose: print('Found {0} frequent groups and {1} rules'.format(
+        len([i for i in itemsets if len(i) > 1]), len(rules)))
+
+    return {"transactions": len(transactions), "itemsets": itemsets, "rules": rules}
+
+
+'''
+DESC:   Converts the eclat results into a structured list of frequent groups and
+        group-level rules
+
+INPUT:  results:dict
+            - The results from `runEclat`
+        save:bool = False
+            - Whether the data should be saved in a file
+        fileName:str = "../Data/frequentGroups"
+            - The filepath for the data to be saved in. Should not contain a
+            file extension
+        minLength:int = 2
+            - The smallest group size to include
+
+OUTPUT: A dictionary with a "groups" list (each with "astronauts", "count", and
+        "support") and a "rules" list (each with "antecedent", "consequent",
+        "support", "confidence", and "lift")
+'''
+def findFrequentGroups(results:dict, save:bool = False, fileName:str = "../Data/frequentGroups",
+    minLength:int = 2, verbose:bool = False):
+    n = results["transactions"]
+
+    groups = [{"astronauts": list(itemset), "count": count, "support": count / n}
+        for itemset, count in results["itemsets"].items() if len(itemset) >= minLength]
+    groups.sort(key = lambda g: (-len(g["astronauts"]), -g["count"]))
+
+    rules = [r for r in results["rules"]
+        if len(r["antecedent"]) + len(r["consequent"]) >= minLength]
+    frequentGroups = {"transactions": n, "groups": groups, "rules": rules}
+
+    if save:
+        if verbose: print('Saving result')
+        with open('{0}.json'.format(fileName), 'w') as fp:
+            json.dump(frequentGroups, fp)
+
+    return frequentGroups
+
+
 '''
 DESC:   Parse the information out of the apriori results
 
 INPUT:  results:list
             - The results from the apriori algorithm
         save:bool = False
-            - Whether the data should be saved in a file
+            - Whether the data should be saved in a file, along with an
+            `Edge_List` edge list
         fileName:str = "../Data/frequentPairs"
             - The filepath for the data to be saved in. Should not contain a
             file extension
 
-OUTPUT: Returns a dictionary of frequent pairs/items
+OUTPUT: Returns a dictionary of frequent pairs/items, keyed by sorted tuples of
+        astronaut names. The saved json is keyed by the stringified tuples
 '''
 def findFrequentItems(results:list, save:bool = False, fileName:str = "../Data/frequentPairs", verbose:bool = False):
     if verbose: bar = lb(len(results), message='Finding frequent items')
@@ -156,11 +266,15 @@ def findFrequentItems(results:list, save:bool = False, fileName:str = "../Data/f
     frequentItems = {}
     for r in results:
         # Pull out names of each astronaut in a pair
-        names = [x for x in r[0]]
-        pair = str((names[0], names[1]))
+        names = sorted(r[0])
+        # Single astronauts aren't pairs
+        if len(names) < 2:
+            if verbose: bar.update()
+            continue
+        pair = (names[0], names[1])
 
         # If the pair isn't in the results, add them and their information
-        if pair not in results:
+        if pair not in frequentItems:
             frequentItems[pair] = {}
             frequentItems[pair]["support"] = r[1]
             frequentItems[pair]["confidence"] = r[2][0][2]
@@ -168,7 +282,7 @@ def findFrequentItems(results:list, save:bool = False, fileName:str = "../Data/f
 
         # If there's a higher confidence level somewhere, replace the values
         # with that one
-        elif r[2][0][2] > results[pair]["confidence"]:
+        elif r[2][0][2] > frequentItems[pair]["confidence"]:
             frequentItems[pair]["support"] = r[1]
             frequentItems[pair]["confidence"] = r[2][0][2]
             frequentItems[pair]["lift"] = r[2][0][3]
@@ -179,7 +293,8 @@ def findFrequentItems(results:list, save:bool = False, fileName:str = "../Data/f
         if verbose: print('Saving result')
         # Save the frequent pairs data to a json
         with open('{0}.json'.format(fileName), 'w') as fp:
-            json.dump(frequentItems, fp)
+            json.dump(pairsToJson(frequentItems), fp)
+        Edge_List.saveEdges(*Edge_List.fromDict(frequentItems), fileName)
 
     return frequentItems
 
@@ -227,44 +342,644 @@ DESC:   Produce a dictionary of all pairs appearing in the photos
 INPUT:  photos:dict
             - A dictionary of photos that has been loaded in
         save:bool = False
-            - Whether the result should be saved to a json file
+            - Whether the result should be saved to a json file, along with an
+            `Edge_List` edge list
         fileName:str = "pairs"
             - The filename of the file that the results will be saved in
 
-OUTPUT: A dictionary where keys are tuples of astronaut name pairings and the
-        values are the number of times that they were in photos together
+OUTPUT: A dictionary where keys are sorted tuples of astronaut names, the same
+        as every other pair count in this file, and the values are the number
+        of times that they were in photos together. The saved json is keyed by
+        the stringified tuples
 '''
 def findPairs(photos:dict, save:bool = False, fileName:str = "../Data/pairs", verbose:bool = False):
     if verbose: bar = lb(len(photos), message='Finding pairs')
 
-    pairs = {}
+    aggregate = newAggregate()
     for photo in photos:
-        for a1 in range(0, len(photo)):
-            for a2 in range(a1, len(photo)):
-                # Skip when they're the same astronaut
-                if photo[a1] == photo[a2]:
-                    continue
-
-                if str((photo[a1], photo[a2])) in pairs:
-                    pairs[str((photo[a1], photo[a2]))] += 1
-                elif str((photo[a2], photo[a1])) in pairs:
-                    pairs[str((photo[a2], photo[a1]))] += 1
-                else:
-                    pairs[str((photo[a1], photo[a2]))] = 1
-
+        countPhoto(aggregate, photo)
         if verbose: bar.update()
     if verbose: bar.update(True)
+    pairs = aggregate["pairs"]
 
     if save:
         if verbose: print('Saving result')
 
         # Save the frequencies at which pairs appear to a json
         with open('{0}.json'.format(fileName), 'w') as fp:
-            json.dump(pairs, fp)
+            json.dump(pairsToJson(pairs), fp)
+        Edge_List.saveEdges(*Edge_List.fromDict(pairs), fileName)
 
     return pairs
 
 
+'''
+DESC:   Loads pairs saved by `findPairs`, `findFrequentItems`, `updateModel`
+        or `runPartitioned` as an edge list
+
+INPUT:  fileName:str = "../Data/pairs"
+            - The filepath the pairs were saved to, without an extension
+        mmap:bool = True
+            - Whether the binary edge list should be memory-mapped
+
+OUTPUT: A tuple of the names table and an array of `Edge_List.EDGE_DTYPE`
+        records
+'''
+def loadPairs(fileName:str = "../Data/pairs", mmap:bool = True):
+    return Edge_List.loadEdges(fileName, mmap)
+
+
+'''
+DESC:   Expands the condensed distances stored with a photo's scan result, so
+        every pair of astronauts in the photo can look up their faces
+
+INPUT:  proximity:dict
+            - The "faces"/"distances" entry stored with the photo
+
+OUTPUT: A tuple of a dictionary from face index to row, and the square distance
+        matrix between the faces. A face's distance to itself is infinite
+'''
+def photoDistances(proximity:dict):
+    order = {face: i for i, face in enumerate(proximity["faces"])}
+    square = squareform(np.asarray(proximity["distances"], dtype = np.float64), checks = False)
+    np.fill_diagonal(square, np.inf)
+    return order, square
+
+
+'''
+DESC:   Finds the distance between two astronauts in a photo. If an astronaut
+        was matched to more than one face, the closest faces are used
+
+INPUT:  order:dict, square:np.ndarray
+            - The photo's face rows and distance matrix from `photoDistances`
+        faces1:list, faces2:list
+            - The face indices of each astronaut
+
+OUTPUT: The distance between the astronauts in face widths, or None if it
+        wasn't recorded
+'''
+def pairDistance(order:dict, square:np.ndarray, faces1:list, faces2:list):
+    rows1 = [order[f] for f in faces1 if f in order]
+    rows2 = [order[f] for f in faces2 if f in order]
+    if not rows1 or not rows2: return None
+    best = square[np.ix_(rows1, rows2)].min()
+    return None if np.isinf(best) else float(best)
+
+
+'''
+DESC:   Produce a dictionary of all pairs appearing in the photos, where pairs
+        standing close together count more than pairs far apart. A pair
+        counts exp(-distance/scale), where distance is measured in face widths.
+        Photos scanned before distances were recorded count as 1 per pair
+
+INPUT:  photos:dict
+            - A dictionary of photos that has been loaded in
+        save:bool = False
+            - Whether the result should be saved to a json file, along with an
+            `Edge_List` edge list holding the number of photos of every pair as
+            "count" and its summed weight as "weight"
+        fileName:str = "../Data/weightedPairs"
+            - The filename of the file that the results will be saved in
+        scale:float = 5.0
+            - The distance (in face widths) at which a pair's weight drops to
+            about a third
+
+OUTPUT: A dictionary where keys are sorted tuples of astronaut names, the same
+        as every other pair count in this file, and the values are their summed
+        proximity weights. The saved json is keyed by the stringified tuples
+'''
+def findWeightedPairs(photos:dict, save:bool = False, fileName:str = "../Data/weightedPairs",
+    scale:float = 5.0, verbose:bool = False):
+    if verbose: bar = lb(len(photos), message='Finding weighted pairs')
+
+    index = {}
+    rows = []
+    cols = []
+    distances = []
+
+    for entry in photos.values():
+        faces = entry[0] if entry else {}
+        proximity = entry[1] if len(entry) > 1 else None
+        astros = sorted(faces.keys())
+        # Every pair in the photo looks its faces up in the same matrix
+        if proximity is not None and len(astros) > 1: order, square = photoDistances(proximity)
+
+        for a1 in range(0, len(astros)):
+            for a2 in range(a1 + 1, len(astros)):
+                d = None
+                if proximity is not None:
+                    d = pairDistance(order, square, faces[astros[a1]], faces[astros[a2]])
+                rows.append(index.setdefault(astros[a1], len(index)))
+                cols.append(index.setdefault(astros[a2], len(index)))
+                distances.append(np.nan if d is None else d)
+
+        if verbose: bar.update()
+    if verbose: bar.update(True)
+
+    # Sum all of the weights at once; duplicate entries are added together
+    distances = np.array(distances, dtype = np.float64)
+    weights = np.where(np.isnan(distances), 1.0, np.exp(-distances/scale))
+    shape = (len(index), len(index))
+    matrix = sparse.coo_matrix((weights, (rows, cols)), shape = shape).tocsr().tocoo()
+    # Same entries as the weights, in the same order
+    counts = sparse.coo_matrix((np.ones(len(rows)), (rows, cols)), shape = shape).tocsr().tocoo()
+
+    names = list(index.keys())
+    pairs = {}
+    together = {}
+    for i, j, w, n in zip(matrix.row, matrix.col, matrix.data, counts.data):
+        pair = tuple(sorted((names[i], names[j])))
+        pairs[pair] = float(w)
+        together[pair] = int(n)
+
+    if save:
+        if verbose: print('Saving result')
+
+        # Save the weighted pairs to a json
+        with open('{0}.json'.format(fileName), 'w') as fp:
+            json.dump(pairsToJson(pairs), fp)
+        Edge_List.saveEdges(*Edge_List.fromDict({pair: {"count": together[pair], "weight": w}
+            for pair, w in pairs.items()}), fileName)
+
+    return pairs
+
+
+'''
+DESC:   Gets the astronauts found in a single photo entry of a scan result
+
+INPUT:  entry:list
+            - The value stored for a photo in a `*_result.json` file
+
+OUTPUT: A list of astronaut names
+'''
+def photoAstronauts(entry:list):
+    if not entry: return []
+    return list(entry[0].keys())
+
+
+'''
+DESC:   Creates an empty aggregate that can hold raw frequencies, pair counts,
+        and the number of transactions
+
+INPUT:  None
+
+OUTPUT: A dictionary with the keys "transactions", "rawFrequencies", and
+        "pairs". Pairs are keyed by sorted tuples of astronaut names
+'''
+def newAggregate():
+    return {"transactions": 0, "rawFrequencies": {}, "pairs": {}}
+
+
+'''
+DESC:   Adds (or subtracts) the astronauts of a single photo to an aggregate.
+        Counts that drop to zero are removed so the aggregate stays sparse
+
+INPUT:  aggregate:dict
+            - An aggregate created by `newAggregate`
+        astros:list
+            - The astronauts found in the photo
+        sign:int = 1
+            - 1 to count the photo, -1 to remove a previously counted photo
+
+OUTPUT: None
+'''
+def countPhoto(aggregate:dict, astros:list, sign:int = 1):
+    frequencies = aggregate["rawFrequencies"]
+    pairs = aggregate["pairs"]
+
+    for astro in astros:
+        frequencies[astro] = frequencies.get(astro, 0) + sign
+        if frequencies[astro] == 0: del frequencies[astro]
+
+    if len(astros) == 0: return
+    aggregate["transactions"] += sign
+
+    astros = sorted(set(astros))
+    for a1 in range(0, len(astros)):
+        for a2 in range(a1 + 1, len(astros)):
+            pair = (astros[a1], astros[a2])
+            pairs[pair] = pairs.get(pair, 0) + sign
+            if pairs[pair] == 0: del pairs[pair]
+
+
+'''
+DESC:   Counts every photo in a dictionary of photos into an aggregate
+
+INPUT:  photos:dict
+            - A dictionary of photos that has been loaded in
+        aggregate:dict = None
+            - The aggregate to add to. A new one is created if none is given
+        sign:int = 1
+            - 1 to count the photos, -1 to remove them
+
+OUTPUT: The aggregate
+'''
+def countPhotos(photos:dict, aggregate:dict = None, sign:int = 1):
+    if aggregate is None: aggregate = newAggregate()
+    for entry in photos.values():
+        countPhoto(aggregate, photoAstronauts(entry), sign)
+    return aggregate
+
+
+'''
+DESC:   Converts pair counts keyed by tuples into the json format that pairs
+        are saved and returned by `runModel` in
+
+INPUT:  pairs:dict
+            - Pair counts keyed by tuples of astronaut names
+
+OUTPUT: A dictionary where keys are stringified tuples of astronaut names and
+        values are the number of times they were in photos together
+'''
+def pairsToJson(pairs:dict):
+    return {str(pair): count for pair, count in pairs.items()}
+
+
+'''
+DESC:   Finds the directory the photos behind an aggregate state are kept in
+
+INPUT:  stateFile:str
+            - Where the aggregate state is pickled
+
+OUTPUT: The directory of the state's `Result_Log`
+'''
+def stateLogDir(stateFile:str):
+    return os.path.splitext(stateFile)[0] + "_Photos"
+
+
+'''
+DESC:   Loads the persistent aggregate state used for incremental updates. The
+        state only holds the counts and a signature of every counted result
+        file; the photos behind the counts are kept in a `Result_Log` beside
+        it (see `updatePhotos`). A state saved by an older version of
+        `updateModel`, or by an update that never finished, is started over
+
+INPUT:  stateFile:str = "../Data/Temp/Basket_State.dat"
+            - Where the state is pickled
+
+OUTPUT: A dictionary holding the aggregate (see `newAggregate`) and a "files"
+        entry with the size/mtime signature of every counted result file
+'''
+def loadState(stateFile:str = "../Data/Temp/Basket_State.dat"):
+    if os.path.exists(stateFile) and not os.path.exists(stateFile + ".dirty"):
+        with open(stateFile, 'rb') as f:
+            state = pickle.load(f)
+        if state.get("version") == STATE_VERSION: return state
+
+    if os.path.isdir(stateLogDir(stateFile)): shutil.rmtree(stateLogDir(stateFile))
+    if os.path.exists(stateFile + ".dirty"): os.remove(stateFile + ".dirty")
+    state = newAggregate()
+    state["files"] = {}
+    state["version"] = STATE_VERSION
+    return state
+
+
+'''
+DESC:   Saves the aggregate state. The state is written to a temporary file and
+        renamed so a crash can never leave a half-written state behind. Its
+        size only depends on the number of astronauts and result files
+
+INPUT:  state:dict
+            - The state returned by `loadState`
+        stateFile:str = "../Data/Temp/Basket_State.dat"
+            - Where the state should be pickled
+
+OUTPUT: None
+'''
+def saveState(state:dict, stateFile:str = "../Data/Temp/Basket_State.dat"):
+    Main_Model.prepDir(Main_Model.getDir(stateFile))
+    with open(stateFile + ".tmp", 'wb') as f:
+        pickle.dump(state, f)
+    os.replace(stateFile + ".tmp", stateFile)
+
+
+'''
+DESC:   Finds the astronauts a photo is counted with. A photo that is in more
+        than one result file is counted once, from the last file in sorted
+        order, the same way `loadPhotos` reads it
+
+INPUT:  copies:dict
+            - The result files the photo is in, mapped to its astronauts there
+
+OUTPUT: The astronauts counted for the photo, or None if it isn't in any file
+'''
+def countedAstronauts(copies:dict):
+    if not copies: return None
+    return copies[max(copies)]
+
+
+'''
+DESC:   Brings the photos of changed result files up to date in the state's
+        log and applies the difference to the counts. The log holds a record
+        of the photo names in every result file, and a record of the
+        astronauts of every photo in every file it is in, so only the records
+        of photos in the changed files are read and appended
+
+INPUT:  state:dict
+            - The state returned by `loadState`
+        log:dict
+            - The state's log, from `Result_Log.openLog`
+        changes:dict
+            - Every changed result file mapped to its photos and their sorted
+            astronauts, or to None if the file was removed
+
+OUTPUT: The number of photos whose counts changed
+'''
+def updatePhotos(state:dict, log:dict, changes:dict):
+    photos = {}
+    changed = 0
+    for file, newPhotos in sorted(changes.items()):
+        record = Result_Log.readRecord(log, "file:" + file)
+        oldNames = record[1] if record is not None else []
+        if newPhotos is None: newPhotos = {}
+
+        for name in set(oldNames) | set(newPhotos):
+            if name not in photos:
+                record = Result_Log.readRecord(log, "photo:" + name)
+                photos[name] = record[1] if record is not None else {}
+            before = countedAstronauts(photos[name])
+            if name in newPhotos: photos[name][file] = newPhotos[name]
+            else: photos[name].pop(file, None)
+            after = countedAstronauts(photos[name])
+
+            if before == after: continue
+            if before is not None: countPhoto(state, before, -1)
+            if after is not None: countPhoto(state, after)
+            changed += 1
+
+        Result_Log.appendRecord(log, ("file:" + file, sorted(newPhotos)))
+
+    for name, copies in photos.items():
+        Result_Log.appendRecord(log, ("photo:" + name, copies))
+    return changed
+
+
+'''
+DESC:   Brings the persistent raw frequencies and pair counts up to date with
+        the result files in `sourceDir`. Only files that are new, replaced, or
+        removed since the last update are read, and only the photos that
+        changed inside them are added to or subtracted from the counts, so an
+        update costs as much as the results that changed. An update that dies
+        part of the way through leaves a marker behind, and the next update
+        counts everything again
+
+INPUT:  sourceDir:str = '../Data/Scan_Result'
+            - Where the jsons of photo data will be found
+        stateFile:str = "../Data/Temp/Basket_State.dat"
+            - Where the aggregate state is persisted between runs
+        saveRawFreq:bool = False
+            - Whether the raw frequencies data should be saved
+        rawFreqFileName:str = "../Data/rawFrequencies"
+            - Where the raw frequencies data should be saved
+        savePairs:bool = False
+            - Whether the astronaut pairing data should be saved
+        pairFileName:str = "../Data/pairs"
+            - Where the astronaut pairing data should be saved
+        verbose:bool = False
+            - Whether the function will output a status of what it's doing
+
+OUTPUT: A dictionary with the updated "rawFreq", "pairs", and "transactions",
+        as well as the list of result files that were "changed"
+'''
+def updateModel(sourceDir:str = '../Data/Scan_Result',
+    stateFile:str = "../Data/Temp/Basket_State.dat", saveRawFreq:bool = False,
+    rawFreqFileName:str = "../Data/rawFrequencies", savePairs:bool = False,
+    pairFileName:str = "../Data/pairs", verbose:bool = False):
+
+    state = loadState(stateFile)
+    counted = state["files"]
+    changes = {}
+
+    files = sorted(f for f in os.listdir(sourceDir) if f.endswith(".json"))
+
+    # Forget result files that have been removed
+    for file in [f for f in counted if f not in files]:
+        del counted[file]
+        changes[file] = None
+
+    for file in files:
+        stat = os.stat(sourceDir + "/" + file)
+        signature = (stat.st_mtime_ns, stat.st_size)
+
+        # Skip files that haven't been touched since they were counted
+        if counted.get(file) == signature: continue
+
+        with open(sourceDir + "/" + file) as jsonfile:
+            data = json.load(jsonfile)
+        counted[file] = signature
+        changes[file] = {k: sorted(photoAstronauts(v)) for k, v in data.items()}
+
+    changedFiles = sorted(changes)
+    if changes:
+        Main_Model.prepDir(Main_Model.getDir(stateFile))
+        open(stateFile + ".dirty", 'w').close()
+        log = Result_Log.openLog(stateLogDir(stateFile))
+        changed = updatePhotos(state, log, changes)
+        Result_Log.closeLog(log)
+        if Result_Log.garbageRatio(log) > 0.5: Result_Log.compactLog(log)
+
+        saveState(state, stateFile)
+        os.remove(stateFile + ".dirty")
+        if verbose: print("\t{0} files changed, {1} photos changed".format(len(changedFiles), changed))
+
+    if saveRawFreq and (changedFiles or not os.path.exists(rawFreqFileName + ".json")):
+        with open('{0}.json'.format(rawFreqFileName), 'w') as fp:
+            json.dump(state["rawFrequencies"], fp)
+
+    if savePairs and (changedFiles or not os.path.exists(pairFileName + ".json")):
+        with open('{0}.json'.format(pairFileName), 'w') as fp:
+            json.dump(pairsToJson(state["pairs"]), fp)
+        Edge_List.saveEdges(*Edge_List.fromDict(state["pairs"]), pairFileName)
+
+    return {"rawFreq": state["rawFrequencies"], "pairs": pairsToJson(state["pairs"]),
+        "transactions": state["transactions"], "changed": changedFiles}
+
+
+'''
+DESC:   Adds the counts of one aggregate into another
+
+INPUT:  total:dict
+            - The aggregate being added to
+        part:dict
+            - The aggregate being added
+
+OUTPUT: The total aggregate
+'''
+def mergeAggregate(total:dict, part:dict):
+    total["transactions"] += part["transactions"]
+    for key in ["rawFrequencies", "pairs"]:
+        counts = total[key]
+        for item, count in part[key].items():
+            counts[item] = counts.get(item, 0) + count
+    return total
+
+
+'''
+DESC:   Merges a list of partial aggregates into one global aggregate
+
+INPUT:  aggregates:list
+            - The aggregates to be merged
+
+OUTPUT: A new aggregate holding the sum of every given aggregate
+'''
+def mergeAggregates(aggregates:list):
+    total = newAggregate()
+    for part in aggregates:
+        mergeAggregate(total, part)
+    return total
+
+
+'''
+DESC:   Counts the photos in a single result file. Each `*_result.json` file
+        holds one album or directory, so every file is a partition that can be
+        counted independently of the others
+
+INPUT:  fp:str
+            - The filepath to a result json
+
+OUTPUT: A tuple of the partition name, its aggregate, and a dictionary of its
+        photo names mapped to their astronauts
+'''
+def countPartition(fp:str):
+    with open(fp) as jsonfile:
+        data = json.load(jsonfile)
+
+    name = Main_Model.getFileName(fp)
+    if name.endswith("_result.json"): name = name[:-len("_result.json")]
+
+    return name, countPhotos(data), {k: photoAstronauts(v) for k, v in data.items()}
+
+
+'''
+DESC:   Converts an aggregate into the same format `runModel` returns
+
+INPUT:  aggregate:dict
+            - The aggregate to be converted
+
+OUTPUT: A dictionary with "transactions", "rawFreq", and "pairs" keys
+'''
+def aggregateResult(aggregate:dict):
+    return {"transactions": aggregate["transactions"],
+        "rawFreq": aggregate["rawFrequencies"],
+        "pairs": pairsToJson(aggregate["pairs"])}
+
+
+'''
+DESC:   Counts raw frequencies and pairs for every result file in a process
+        pool and merges the partial results. The per-partition results (for
+        example, one per expedition album) come out of the same pass
+
+INPUT:  sourceDir:str = '../Data/Scan_Result'
+            - Where the jsons of photo data will be found
+        numProcesses:int = None
+            - The number of worker processes. Defaults to the number of cores
+        saveRawFreq:bool = False
+            - Whether the raw frequencies data should be saved
+        rawFreqFileName:str = "../Data/rawFrequencies"
+            - Where the raw frequencies data should be saved
+        savePairs:bool = False
+            - Whether the astronaut pairing data should be saved
+        pairFileName:str = "../Data/pairs"
+            - Where the astronaut pairing data should be saved
+        savePartitions:bool = False
+            - Whether the per-partition results should be saved
+        partitionFileName:str = "../Data/partitionResults"
+            - Where the per-partition results should be saved
+        verbose:bool = False
+            - Whether the function will output a status of what it's doing
+
+OUTPUT: A dictionary with the global "transactions", "rawFreq", and "pairs",
+        and a "partitions" dictionary holding the same values per partition
+'''
+def runPartitioned(sourceDir:str = '../Data/Scan_Result', numProcesses:int = None,
+    saveRawFreq:bool = False, rawFreqFileName:str = "../Data/rawFrequencies",
+    savePairs:bool = False, pairFileName:str = "../Data/pairs",
+    savePartitions:bool = False, partitionFileName:str = "../Data/partitionResults",
+    verbose:bool = False):
+
+    files = [sourceDir + "/" + f for f in sorted(os.listdir(sourceDir)) if f.endswith(".json")]
+    if numProcesses is None: numProcesses = mp.cpu_count()
+    numProcesses = max(1, min(numProcesses, len(files)))
+
+    partitions = {}
+    photos = {}
+    if verbose and files: bar = lb(len(files), message='Counting partitions')
+
+    with mp.Pool(numProcesses) as pool:
+        # imap keeps the files in order, so later files override earlier ones
+        for name, aggregate, partPhotos in pool.imap(countPartition, files):
+            partitions[name] = aggregate
+            photos[name] = partPhotos
+            if verbose: bar.update()
+    if verbose and files: bar.update(True)
+
+    # A photo in several files is only counted globally from the last of them
+    total = mergeAggregates(partitions.values())
+    seen = set()
+    for name in reversed(list(photos)):
+        for photo, astros in photos[name].items():
+            if photo in seen: countPhoto(total, astros, -1)
+            else: seen.add(photo)
+
+    result = aggregateResult(total)
+    result["partitions"] = {name: aggregateResult(aggregate)
+        for name, aggregate in partitions.items()}
+
+    if saveRawFreq:
+        with open('{0}.json'.format(rawFreqFileName), 'w') as fp:
+            json.dump(result["rawFreq"], fp)
+
+    if savePairs:
+        with open('{0}.json'.format(pairFileName), 'w') as fp:
+            json.dump(result["pairs"], fp)
+        Edge_List.saveEdges(*Edge_List.fromDict(total["pairs"]), pairFileName)
+
+    if savePartitions:
+        with open('{0}.json'.format(partitionFileName), 'w') as fp:
+            json.dump(result["partitions"], fp)
+
+    return result
+
+
+'''
+DESC:   Computes how significant the number of photos every pair of astronauts
+        shares is, using a permutation test that keeps photo sizes and
+        astronaut frequencies fixed
+
+INPUT:  transactions:list
+            - A list of lists, where each inner list is a list of astronauts in
+            each photo
+        save:bool = False
+            - Whether the result should be saved to a json file
+        fileName:str = "../Data/pairSignificance"
+            - The filename of the file that the results will be saved in
+        numPermutations:int = 1000
+            - The number of randomized data sets to compare against
+        seed:int = 0
+            - The seed used to randomize the data sets
+        numProcesses:int = None
+            - The number of worker processes. Defaults to the number of cores
+
+OUTPUT: A dictionary where keys are stringified tuples of astronaut names and
+        values are dictionaries holding the "count", "expected", and "pValue"
+'''
+def findSignificance(transactions:list, save:bool = False,
+    fileName:str = "../Data/pairSignificance", numPermutations:int = 1000,
+    seed:int = 0, numProcesses:int = None, verbose:bool = False):
+    if verbose: print('Running {0} permutations of the pair counts'.format(numPermutations))
+
+    significance = Pair_Significance.pairSignificance(transactions,
+        numPermutations, seed, numProcesses)
+    significance = pairsToJson(significance)
+
+    if save:
+        if verbose: print('Saving result')
+        with open('{0}.json'.format(fileName), 'w') as fp:
+            json.dump(significance, fp)
+
+    return significance
+
+
 '''
 DESC:   Runs the entire model and returns the results
 
@@ -293,6 +1008,53 @@ INPUT:  apriori:bool = False
             - Whether the astronaut pairing data should be saved
         pairFileName:str = "pairs"
             - Where the astronaut pairing data should be saved
+        incremental:bool = False
+            - Whether raw frequencies and pairs should be brought up to date
+            from the persisted state instead of being recounted from scratch
+        stateFile:str = "../Data/Temp/Basket_State.dat"
+            - Where the incremental state is persisted
+        numProcesses:int = None
+            - The number of worker processes used to mine frequent groups and
+            find pair significance, which default to the number of cores. Raw
+            frequencies and pairs are counted serially unless more than one
+            process is asked for, in which case every result file is counted
+            in a process pool
+        partitions:bool = False
+            - Whether the raw frequencies and pairs of every result file should
+            also be returned. Implies a partitioned count
+        groups:bool = False
+            - Whether frequent groups of any size should be mined with eclat
+        saveGroups:bool = False
+            - Whether the frequent groups data should be saved
+        groupFileName:str = "../Data/frequentGroups"
+            - Where the frequent groups data should be saved
+        groupLength:int = 6
+            - The largest group size mined by eclat
+        sig:bool = False
+            - Whether the permutation-test p-values of every pair should be
+            found and returned
+        saveSig:bool = False
+            - Whether the pair significance data should be saved
+        sigFileName:str = "../Data/pairSignificance"
+            - Where the pair significance data should be saved
+        numPermutations:int = 1000
+            - The number of permutations used to find the pair significance.
+            Has to be at least 1
+        seed:int = 0
+            - The seed used to randomize the permutations, so the p-values can
+            be reproduced
+        weighted:bool = False
+            - Whether the proximity-weighted pair counts should be found and
+            returned
+        saveWeighted:bool = False
+            - Whether the proximity-weighted pair data should be saved
+        weightedFileName:str = "../Data/weightedPairs"
+            - Where the proximity-weighted pair data should be saved
+        countOnce:bool = False
+            - Whether every group of near-duplicate photos should only be
+            counted once. Counts are always made from scratch in this case
+        dupFileName:str = "../Data/Temp/Duplicate_Groups.json"
+            - Where the duplicate groups were saved by `Main_Model`
 
 OUTPUT: A dictionary that contains the information specified by the boolean
         parameters
@@ -301,28 +1063,72 @@ def runModel(apriori:bool = False, fItems:bool = False, rawF:bool = False,
     pairs:bool = False, sourceDir:str = '../Data/Scan_Result', verbose:bool = False,
     saveFreq:bool = False, freqFileName:str = "../Data/frequentPairs",
     saveRawFreq:bool = False, rawFreqFileName:str = "../Data/rawFrequencies",
-    savePairs:bool = False, pairFileName:str = "../Data/pairs"):
+    savePairs:bool = False, pairFileName:str = "../Data/pairs",
+    incremental:bool = False, stateFile:str = "../Data/Temp/Basket_State.dat",
+    numProcesses:int = None, partitions:bool = False, groups:bool = False,
+    saveGroups:bool = False, groupFileName:str = "../Data/frequentGroups",
+    groupLength:int = 6, sig:bool = False, saveSig:bool = False,
+    sigFileName:str = "../Data/pairSignificance", numPermutations:int = 1000,
+    seed:int = 0, weighted:bool = False, saveWeighted:bool = False,
+    weightedFileName:str = "../Data/weightedPairs", countOnce:bool = False,
+    dupFileName:str = "../Data/Temp/Duplicate_Groups.json"):
 
     # Skips the entire thing if the flags indicate nothing should be run
-    if not (apriori or fItems or rawF or pairs): return {}
+    if not (apriori or fItems or rawF or pairs or groups or sig or weighted): return {}
+
+    if sig and numPermutations < 1:
+        raise ValueError("numPermutations has to be at least 1, got {0}".format(numPermutations))
 
     returnValue = {}
+
+    # The incremental and partitioned counts don't know about duplicates
+    if incremental and (rawF or pairs) and not countOnce:
+        update = updateModel(sourceDir, stateFile, saveRawFreq and rawF,
+            rawFreqFileName, savePairs and pairs, pairFileName, verbose)
+        if rawF: returnValue["rawFreq"] = update["rawFreq"]
+        if pairs: returnValue["pairs"] = update["pairs"]
+        rawF = pairs = False
+        if not (apriori or fItems or groups or sig or weighted): return returnValue
+
+    # A process pool only pays off on large archives, so it has to be asked for
+    if ((numProcesses or 1) > 1 or partitions) and (rawF or pairs) and not countOnce:
+        result = runPartitioned(sourceDir, numProcesses, saveRawFreq and rawF,
+            rawFreqFileName, savePairs and pairs, pairFileName, verbose = verbose)
+        if rawF: returnValue["rawFreq"] = result["rawFreq"]
+        if pairs: returnValue["pairs"] = result["pairs"]
+        if partitions: returnValue["partitions"] = result["partitions"]
+        rawF = pairs = False
+        if not (apriori or fItems or groups or sig or weighted): return returnValue
+
     photos = loadPhotos(sourceDir, verbose)
+    if countOnce: photos = dropDuplicates(photos, dupFileName, verbose)
     transactions = generateTransactions(photos, verbose)
     transactions = cleanTransactions(transactions, verbose)
 
     if apriori or fItems:
         results = runApriori(transactions, verbose)
         if fItems:
-            returnValue["frequentItems"] = findFrequentItems(results, saveFreq, freqFileName, verbose)
+            returnValue["frequentItems"] = pairsToJson(findFrequentItems(results, saveFreq, freqFileName, verbose))
         if apriori:
             returnValue["apriori"] = results
 
+    if groups:
+        results = runEclat(transactions, verbose, groupLength, numProcesses)
+        returnValue["frequentGroups"] = findFrequentGroups(results, saveGroups, groupFileName, verbose = verbose)
+
+    if sig:
+        returnValue["significance"] = findSignificance(transactions, saveSig,
+            sigFileName, numPermutations, seed, numProcesses, verbose = verbose)
+
     if rawF:
         returnValue["rawFreq"] = findRawFrequencies(photos, saveRawFreq, rawFreqFileName, verbose)
 
     if pairs:
-        returnValue['pairs'] = findPairs(transactions, savePairs, pairFileName, verbose)
+        returnValue['pairs'] = pairsToJson(findPairs(transactions, savePairs, pairFileName, verbose))
+
+    if weighted:
+        returnValue['weightedPairs'] = pairsToJson(findWeightedPairs(photos, saveWeighted,
+            weightedFileName, verbose = verbose))
 
     return returnValue
 
@@ -0,0 +1,191 @@
+'''
+@desc:      Estimates how significant the co-occurrence count of every pair of
+            astronauts is. Photos are randomly rebuilt under a null model that
+            keeps every photo's size and every astronaut's frequency, and the
+            observed counts are compared against the randomized ones. The
+            randomized incidence matrices are kept sparse, so a permutation
+            costs as much as the number of astronaut appearances rather than
+            photos x astronauts, and only the pairs seen together are tracked.
+            Batches of permutations are spread across processes.
+'''
+
+import numpy as np
+import multiprocessing as mp
+from scipy import sparse
+
+# Number of permutations handled by a single task. Tasks are seeded one by one,
+# so results don't depend on the number of processes
+PERMS_PER_TASK = 32
+
+# Set in every worker by `initWorker`
+_rows = None
+_cols = None
+_shape = None
+_pairs = None
+_observed = None
+_batchSize = 1
+
+
+'''
+DESC:   Builds the sparse incidence structure (which astronaut is in which
+        photo) of a list of transactions
+
+INPUT:  transactions:list
+            - A list of lists, where each inner list is a list of astronauts in
+            each photo
+
+OUTPUT: A tuple (names, rows, cols) where names is the sorted list of
+        astronauts, and rows/cols are arrays such that astronaut cols[i] is in
+        photo rows[i]
+'''
+def buildIncidence(transactions:list):
+    names = sorted({a for t in transactions for a in t})
+    index = {name: i for i, name in enumerate(names)}
+
+    rows = []
+    cols = []
+    for photo, transaction in enumerate(transactions):
+        for astro in set(transaction):
+            rows.append(photo)
+            cols.append(index[astro])
+
+    return names, np.array(rows, dtype = np.int64), np.array(cols, dtype = np.int64)
+
+
+'''
+DESC:   Counts how often every pair of astronauts appears together. An
+        astronaut listed twice for the same photo only counts once
+
+INPUT:  rows:np.ndarray, cols:np.ndarray
+            - The incidence structure from `buildIncidence`
+        shape:tuple
+            - The number of photos and astronauts
+
+OUTPUT: A sparse (astronauts x astronauts) matrix of co-occurrence counts
+'''
+def cooccurrence(rows:np.ndarray, cols:np.ndarray, shape:tuple):
+    incidence = sparse.csr_matrix((np.ones(len(rows), dtype = np.float32), (rows, cols)), shape = shape)
+    incidence.data[:] = 1
+    return (incidence.T @ incidence).tocsr()
+
+
+'''
+DESC:   Stores the data shared by every permutation in a worker process
+
+INPUT:  rows:np.ndarray, cols:np.ndarray
+            - The incidence structure from `buildIncidence`
+        shape:tuple
+            - The number of photos and astronauts
+        pairs:tuple
+            - The rows and columns of the pairs seen together
+        observed:np.ndarray
+            - The observed count of every pair in `pairs`
+        batchSize:int
+            - The number of permutations shuffled at once
+
+OUTPUT: None
+'''
+def initWorker(rows:np.ndarray, cols:np.ndarray, shape:tuple, pairs:tuple,
+    observed:np.ndarray, batchSize:int):
+    global _rows, _cols, _shape, _pairs, _observed, _batchSize
+    _rows = rows
+    _cols = cols
+    _shape = shape
+    _pairs = pairs
+    _observed = observed
+    _batchSize = batchSize
+
+
+'''
+DESC:   Runs a number of permutations of the null model. Each permutation
+        shuffles which astronaut fills which photo slot, so every photo keeps
+        its size and every astronaut keeps their number of appearances. An
+        astronaut drawn twice for the same photo only counts once
+
+INPUT:  task:tuple
+            - A (numpy SeedSequence, number of permutations) tuple
+
+OUTPUT: A tuple of the number of times every observed pair's randomized count
+        was at least as large as its observed count, and the sum of its
+        randomized counts
+'''
+def runPermutations(task:tuple):
+    seed, numPermutations = task
+    rng = np.random.default_rng(seed)
+
+    exceeded = np.zeros(len(_observed), dtype = np.int64)
+    total = np.zeros(len(_observed), dtype = np.float64)
+
+    for start in range(0, numPermutations, _batchSize):
+        batch = min(_batchSize, numPermutations - start)
+        shuffled = rng.permuted(np.broadcast_to(_cols, (batch, len(_cols))), axis = 1)
+
+        for cols in shuffled:
+            counts = np.asarray(cooccurrence(_rows, cols, _shape)[_pairs]).ravel()
+            exceeded += counts >= _observed
+            total += counts
+
+    return exceeded, total
+
+
+'''
+DESC:   Computes a permutation-test p-value for the co-occurrence count of every
+        pair of astronauts that appears together at least once
+
+INPUT:  transactions:list
+            - A list of lists, where each inner list is a list of astronauts in
+            each photo
+        numPermutations:int = 1000
+            - The number of randomized data sets to compare against. Has to be
+            at least 1
+        seed:int = 0
+            - The seed for the random number generator
+        numProcesses:int = None
+            - The number of worker processes. Defaults to the number of cores
+        memoryLimit:int = 256*2**20
+            - The approximate number of bytes each worker may use for a batch of
+            shuffled astronaut appearances
+
+OUTPUT: A dictionary where keys are sorted tuples of astronaut names and values
+        are dictionaries with the observed "count", the "expected" count under
+        the null model, and the "pValue"
+'''
+def pairSignificance(transactions:list, numPermutations:int = 1000, seed:int = 0,
+    numProcesses:int = None, memoryLimit:int = 256*2**20):
+    if numPermutations < 1:
+        raise ValueError("numPermutations has to be at least 1, got {0}".format(numPermutations))
+    names, rows, cols = buildIncidence(transactions)
+    shape = (len(transactions), len(names))
+    if len(names) < 2: return {}
+
+    upper = sparse.triu(cooccurrence(rows, cols, shape), 1).tocoo()
+    pairs = (upper.row, upper.col)
+    observed = upper.data
+    batchSize = int(max(1, min(PERMS_PER_TASK, memoryLimit // (8 * max(1, len(cols))))))
+
+    # Split the permutations into independently seeded tasks
+    sizes = [PERMS_PER_TASK] * (numPermutations // PERMS_PER_TASK)
+    if numPermutations % PERMS_PER_TASK: sizes.append(numPermutations % PERMS_PER_TASK)
+    tasks = list(zip(np.random.SeedSequence(seed).spawn(len(sizes)), sizes))
+
+    if numProcesses is None: numProcesses = mp.cpu_count()
+    numProcesses = max(1, min(numProcesses, len(tasks)))
+    args = (rows, cols, shape, pairs, observed, batchSize)
+
+    if numProcesses == 1:
+        initWorker(*args)
+        results = [runPermutations(task) for task in tasks]
+    else:
+        with mp.Pool(numProcesses, initWorker, args) as pool:
+            results = pool.map(runPermutations, tasks)
+
+    exceeded = sum(r[0] for r in results)
+    expected = sum(r[1] for r in results) / numPermutations
+
+    significance = {}
+    for k, (i, j) in enumerate(zip(*pairs)):
+        significance[(names[i], names[j])] = {"count": int(observed[k]),
+            "expected": float(expected[k]),
+            "pValue": float((exceeded[k] + 1) / (numPermutations + 1))}
+
+    return significance
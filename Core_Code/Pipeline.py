@@ -0,0 +1,258 @@
+'''
+@desc:      A small memoized pipeline. Stages are declared with the stages they
+            depend on and the files they read, and every stage's result is
+            cached on disk under a key built from its parameters, the hashes of
+            its source files, and the hashes of its dependencies' results. A
+            stage only runs again when one of those changes, and a stage whose
+            result comes out the same doesn't invalidate the stages after it.
+            The last few results of every stage are kept, each in a file named
+            by its key, so switching parameters back and forth reuses them.
+'''
+
+import os
+import json
+import pickle
+import hashlib
+
+CACHE_DIR = '../Data/Temp/Pipeline_Cache'
+
+# Marks a cached result that hasn't been read from disk yet
+_NOT_LOADED = object()
+
+# The number of results kept for every stage
+KEEP_RESULTS = 4
+
+
+'''
+DESC:   Creates an empty pipeline
+
+INPUT:  cacheDir:str = CACHE_DIR
+            - Where stage results are cached
+        verbose:bool = False
+            - Whether stages will report when they run or are reused
+
+OUTPUT: A dictionary holding the pipeline's stages and cache index
+'''
+def newPipeline(cacheDir:str = CACHE_DIR, verbose:bool = False):
+    if not os.path.isdir(cacheDir): os.makedirs(cacheDir)
+
+    index = {}
+    if os.path.exists(cacheDir + '/index.json'):
+        with open(cacheDir + '/index.json') as f:
+            index = json.load(f)
+
+    return {"cacheDir": cacheDir, "verbose": verbose, "stages": {}, "index": index}
+
+
+'''
+DESC:   Adds a stage to a pipeline
+
+INPUT:  pipeline:dict
+            - A pipeline from `newPipeline`
+        name:str
+            - The name of the stage
+        func
+            - The function that produces the stage's result. It is called with
+            the results of `deps` in order, followed by `params` as keywords
+        deps:tuple = ()
+            - The names of the stages this stage depends on
+        params:dict = None
+            - Keyword arguments for `func`. Changing them invalidates the stage
+        sources = None
+            - Files the stage reads, as a list or a function returning a list.
+            Their contents are hashed every run
+        outputs:list = None
+            - Files the stage writes. The stage runs again if any are missing
+        version:int = 1
+            - Bump to invalidate cached results after changing `func`
+
+OUTPUT: None
+'''
+def addStage(pipeline:dict, name:str, func, deps:tuple = (), params:dict = None,
+    sources = None, outputs:list = None, version:int = 1):
+    for dep in deps:
+        if dep not in pipeline["stages"]:
+            raise ValueError('Stage \"{0}\" depends on unknown stage \"{1}\"'.format(name, dep))
+
+    pipeline["stages"][name] = {"func": func, "deps": tuple(deps),
+        "params": params or {}, "sources": sources, "outputs": outputs or [],
+        "version": version}
+
+
+'''
+DESC:   Hashes the contents of the files a stage reads. The hash of a file is
+        reused while its size and modification time stay the same
+
+INPUT:  pipeline:dict
+            - A pipeline from `newPipeline`
+        files:list
+            - The files to hash
+
+OUTPUT: A sorted list of [filepath, hash] pairs
+'''
+def hashSources(pipeline:dict, files:list):
+    known = pipeline["index"].setdefault("__sources__", {})
+    hashes = []
+    for file in sorted(files):
+        stat = os.stat(file)
+        signature = [stat.st_mtime_ns, stat.st_size]
+        key = os.path.abspath(file)
+        if key not in known or known[key][0] != signature:
+            sha = hashlib.sha1()
+            with open(file, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    sha.update(block)
+            known[key] = [signature, sha.hexdigest()]
+        hashes.append([file, known[key][1]])
+    return hashes
+
+
+'''
+DESC:   Finds the file a stage's result is cached in
+
+INPUT:  pipeline:dict
+            - A pipeline from `newPipeline`
+        name:str
+            - The name of the stage
+        key:str
+            - The key the result was made under
+
+OUTPUT: The filepath
+'''
+def cachePath(pipeline:dict, name:str, key:str):
+    return '{0}/{1}-{2}.pkl'.format(pipeline["cacheDir"], name, key)
+
+
+'''
+DESC:   Gets the cached results of a stage, most recently used first. Records
+        written before results were kept per key are dropped
+
+INPUT:  pipeline:dict
+            - A pipeline from `newPipeline`
+        name:str
+            - The name of the stage
+
+OUTPUT: A list of {"key", "result"} records
+'''
+def stageRecords(pipeline:dict, name:str):
+    records = pipeline["index"].get(name)
+    if not isinstance(records, list):
+        oldFile = '{0}/{1}.pkl'.format(pipeline["cacheDir"], name)
+        if os.path.exists(oldFile): os.remove(oldFile)
+        records = pipeline["index"][name] = []
+    return records
+
+
+'''
+DESC:   Makes sure a stage and everything it depends on is up to date
+
+INPUT:  pipeline:dict
+            - A pipeline from `newPipeline`
+        name:str
+            - The stage to resolve
+        resolved:dict
+            - Stages resolved during this run, mapping names to a list of
+            [result hash, result]
+
+OUTPUT: The [result hash, result, key] of the stage. The result is
+        `_NOT_LOADED` if it was cached and hasn't been needed yet
+'''
+def resolveStage(pipeline:dict, name:str, resolved:dict):
+    if name in resolved: return resolved[name]
+    stage = pipeline["stages"][name]
+
+    depHashes = [resolveStage(pipeline, dep, resolved)[0] for dep in stage["deps"]]
+    sources = stage["sources"]
+    if callable(sources): sources = sources()
+    sourceHashes = hashSources(pipeline, sources or [])
+
+    key = hashlib.sha1(json.dumps([name, stage["version"], stage["params"],
+        depHashes, sourceHashes], sort_keys = True, default = repr).encode()).hexdigest()
+    records = stageRecords(pipeline, name)
+    cacheFile = cachePath(pipeline, name, key)
+    record = next((r for r in records if r["key"] == key), None)
+
+    if record is not None and os.path.exists(cacheFile) and \
+        all(os.path.exists(f) for f in stage["outputs"]):
+        if pipeline["verbose"]: print('Reusing {0}'.format(name))
+        records.remove(record)
+        records.insert(0, record)
+        resolved[name] = [record["result"], _NOT_LOADED, key]
+        return resolved[name]
+
+    if pipeline["verbose"]: print('Running {0}'.format(name))
+    args = [stageResult(pipeline, dep, resolved) for dep in stage["deps"]]
+    result = stage["func"](*args, **stage["params"])
+
+    data = pickle.dumps(result, protocol = pickle.HIGHEST_PROTOCOL)
+    with open(cacheFile + '.tmp', 'wb') as f:
+        f.write(data)
+    os.replace(cacheFile + '.tmp', cacheFile)
+
+    record = {"key": key, "result": hashlib.sha1(data).hexdigest()}
+    records = [record] + [r for r in records if r["key"] != key]
+    for evicted in records[KEEP_RESULTS:]:
+        evictedFile = cachePath(pipeline, name, evicted["key"])
+        if os.path.exists(evictedFile): os.remove(evictedFile)
+    pipeline["index"][name] = records[:KEEP_RESULTS]
+    saveIndex(pipeline)
+
+    resolved[name] = [record["result"], result, key]
+    return resolved[name]
+
+
+'''
+DESC:   Gets the result of a resolved stage, reading it from the cache if it
+        hasn't been loaded yet
+
+INPUT:  pipeline:dict
+            - A pipeline from `newPipeline`
+        name:str
+            - The stage whose result is needed
+        resolved:dict
+            - Stages resolved during this run
+
+OUTPUT: The stage's result
+'''
+def stageResult(pipeline:dict, name:str, resolved:dict):
+    entry = resolveStage(pipeline, name, resolved)
+    if entry[1] is _NOT_LOADED:
+        with open(cachePath(pipeline, name, entry[2]), 'rb') as f:
+            entry[1] = pickle.load(f)
+    return entry[1]
+
+
+'''
+DESC:   Saves the cache index of a pipeline
+
+INPUT:  pipeline:dict
+            - A pipeline from `newPipeline`
+
+OUTPUT: None
+'''
+def saveIndex(pipeline:dict):
+    indexFile = pipeline["cacheDir"] + '/index.json'
+    with open(indexFile + '.tmp', 'w') as f:
+        json.dump(pipeline["index"], f)
+    os.replace(indexFile + '.tmp', indexFile)
+
+
+'''
+DESC:   Runs the stages needed to produce the targets, reusing every cached
+        result whose inputs haven't changed
+
+INPUT:  pipeline:dict
+            - A pipeline from `newPipeline`
+        targets:list
+            - The names of the stages whose results are wanted
+
+OUTPUT: A dictionary where keys are the target names and values are their
+        results
+'''
+def runPipeline(pipeline:dict, targets:list):
+    resolved = {}
+    results = {name: stageResult(pipeline, name, resolved) for name in targets}
+
+    # Source hashes may have been refreshed even if nothing ran
+    saveIndex(pipeline)
+    return results
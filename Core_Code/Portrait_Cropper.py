@@ -0,0 +1,183 @@
+'''
+@desc:      Crops astronaut portraits down to their face in parallel. Every
+            portrait goes through the same detection pass as the scanner
+            (`Main_Model.detectFaces`, including rotated faces), and detections
+            are shared with the scanner's image cache, so each portrait is only
+            detected once. The largest face is cropped, and its encoding from
+            the same pass is saved as the astronaut's gallery encoding.
+            Originals are never modified.
+'''
+
+import os
+import time
+import pickle
+import numpy as np
+import multiprocessing as mp
+import face_recognition
+from PIL import Image
+import Main_Model
+
+CACHE_FILE = '../Data/Temp/Input_Cache.dat'
+
+
+'''
+DESC:   Picks the largest face found in a portrait
+
+INPUT:  entry:dict
+            - A detection result from `Main_Model.detectFaces`
+
+OUTPUT: The index of the largest face, or None if there are no faces
+'''
+def largestFace(entry:dict):
+    if not entry["boxes"]: return None
+    areas = [abs((bottom - top) * (right - left)) for top, right, bottom, left in entry["boxes"]]
+    return int(np.argmax(areas))
+
+
+'''
+DESC:   Detects the faces in a portrait (unless they are already cached) and
+        saves a crop of the largest one. A portrait that can't be read or
+        cropped is reported instead of stopping the other workers
+
+INPUT:  task:tuple
+            - A (portrait filepath, crop filepath, cached entry or None) tuple
+
+OUTPUT: A tuple of the portrait filepath, its detection entry, the index of
+        the cropped face (None if no face was found), and an error message
+        (None unless the portrait failed, in which case the entry is None)
+'''
+def cropPortrait(task:tuple):
+    source, target, entry = task
+    try:
+        image = face_recognition.load_image_file(source)
+        if entry is None: entry = Main_Model.detectFaces(image)
+
+        face = largestFace(entry)
+        if face is None: return source, entry, None, None
+
+        # Crop in the rotation the face was found in, so the portrait is upright
+        top, right, bottom, left = entry["boxes"][face]
+        rotated = np.rot90(image, k = entry["rotations"][face])
+        crop = Image.fromarray(np.ascontiguousarray(rotated[top:bottom, left:right]))
+
+        crop.save(target + '.tmp', "JPEG", quality = 95)
+        os.replace(target + '.tmp', target)
+        return source, entry, face, None
+
+    except Exception as e:
+        if os.path.exists(target + '.tmp'): os.remove(target + '.tmp')
+        return source, None, None, "{0}: {1}".format(type(e).__name__, e)
+
+
+'''
+DESC:   Saves a gallery encoding in the same format as `Astro.Astronaut.saveData`
+
+INPUT:  source:str
+            - The portrait the encoding came from
+        encoding:np.ndarray
+            - The facial encoding
+        pickleDir:str
+            - The directory gallery encodings are saved in
+
+OUTPUT: None
+'''
+def saveEncoding(source:str, encoding:np.ndarray, pickleDir:str):
+    astro = Main_Model.astroFromFile(source)
+    if astro is None: return
+
+    path = "{0}{1}.dat".format(pickleDir, astro.filename)
+    with open(path + '.tmp', 'wb') as f:
+        pickle.dump({astro.filename: encoding}, f)
+    os.replace(path + '.tmp', path)
+
+
+'''
+DESC:   Crops every portrait in a directory down to the astronaut's face
+
+INPUT:  sourceDir:str = '../Data/Portraits/'
+            - Where the original portraits are found
+        cropDir:str = '../Data/Portraits_Cropped/'
+            - Where crops are saved, as 'cropped_<original name>'
+        pickleDir:str = '../Data/Facial_Data/'
+            - Where gallery encodings are saved. None skips saving them
+        cacheFile:str = CACHE_FILE
+            - The image cache shared with `Main_Model.Master_Model`
+        numProcesses:int = None
+            - The number of worker processes. Defaults to the number of cores
+        overwrite:bool = False
+            - Whether portraits that already have a crop are cropped again
+        verbose:bool = True
+            - Whether the function will report skipped images and throughput
+
+OUTPUT: A dictionary with the lists of "cropped" and "skipped" portraits, the
+        portraits that "failed" as (filepath, error message) tuples, the number
+        of portraits read from the "cached" detections, and the number of
+        images processed per second as "imagesPerSecond"
+'''
+def cropPortraits(sourceDir:str = '../Data/Portraits/', cropDir:str = '../Data/Portraits_Cropped/',
+    pickleDir:str = '../Data/Facial_Data/', cacheFile:str = CACHE_FILE,
+    numProcesses:int = None, overwrite:bool = False, verbose:bool = True):
+    start = time.time()
+    Main_Model.prepDir(cropDir)
+    if pickleDir is not None: Main_Model.prepDir(pickleDir)
+
+    cache = Main_Model.loadCache(cacheFile)
+
+    tasks = []
+    cached = 0
+    for filename in sorted(os.listdir(sourceDir)):
+        if filename.split('.')[-1].lower() not in ("jpg", "jpeg"): continue
+        target = cropDir + "cropped_" + filename
+        if os.path.exists(target) and not overwrite: continue
+
+        # Only entries from the current detection pass know which rotation
+        # each face was found in
+        entry = cache.get(filename)
+        if not isinstance(entry, dict) or "boxes" not in entry: entry = None
+        else: cached += 1
+        tasks.append((sourceDir + filename, target, entry))
+
+    if numProcesses is None: numProcesses = mp.cpu_count()
+    numProcesses = max(1, min(numProcesses, len(tasks)))
+
+    cropped = []
+    skipped = []
+    failed = []
+    # Only portraits that had to be detected are saved back to the cache
+    fresh = {source for source, _, entry in tasks if entry is None}
+    detected = {}
+    if tasks:
+        with mp.Pool(numProcesses) as pool:
+            for source, entry, face, error in pool.imap_unordered(cropPortrait, tasks):
+                if error is not None:
+                    failed.append((source, error))
+                    if verbose: print("\tI wasn't able to crop {0} ({1}), skipping it".format(source, error))
+                    continue
+
+                if source in fresh: detected[Main_Model.getFileName(source)] = entry
+                if face is None:
+                    skipped.append(source)
+                    if verbose: print("\tNo face found in {0}, skipping it".format(source))
+                    continue
+
+                cropped.append(source)
+                if pickleDir is not None:
+                    saveEncoding(source, Main_Model.readCacheEntry(entry)[0][face], pickleDir)
+
+        # Scans may be saving the same cache while portraits are cropped
+        Main_Model.mergeCache(cacheFile, detected)
+
+    elapsed = max(time.time() - start, 1e-9)
+    rate = len(tasks) / elapsed
+    if verbose:
+        print("Cropped {0} portraits, skipped {1} and failed on {2} in {3:.1f}s ({4:.2f} "
+            "images/s, {5} detections reused, {6} processes)".format(len(cropped), len(skipped),
+            len(failed), elapsed, rate, cached, numProcesses))
+
+    return {"cropped": cropped, "skipped": skipped, "failed": failed, "cached": cached,
+        "imagesPerSecond": rate}
+
+
+
+if __name__ == '__main__':
+    cropPortraits()
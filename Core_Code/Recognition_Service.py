@@ -0,0 +1,368 @@
+'''
+@desc:      A long-running recognition service. The astronaut gallery and the
+            image cache are loaded once and kept in memory, and scan requests
+            are taken over a local Unix socket, so a lookup doesn't pay for
+            building a `Main_Model.Master_Model` every time. Faces are detected
+            in a process pool, and the faces of requests that arrive together
+            are matched against the gallery in a single batch.
+
+            The protocol is one json object per line. A request holds an "id"
+            and one of:
+                "image" - the filepath of an image
+                "dir"   - a directory, every jpg in it is scanned
+                "data"  - a base64 encoded image, optionally with a "name"
+                "op"    - "stats" for counters, or "reload" to reload the
+                          gallery after training new astronauts
+            Every scanned image is streamed back as soon as it is done as
+            {"id", "image", "faces", "proximity", "cached"}, in the same format
+            as `Scan_Result`, followed by {"id", "done", "count", "ms"}.
+            Failures are sent as {"id", "error"}.
+'''
+
+import os
+import io
+import json
+import time
+import base64
+import signal
+import socket
+import hashlib
+import asyncio
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+import face_recognition
+import Main_Model
+import Face_Matcher
+
+SOCKET_PATH = '../Data/Temp/Recognition.sock'
+CACHE_FILE = '../Data/Temp/Input_Cache.dat'
+
+# The longest request line, which has to fit a base64 encoded upload
+MAX_REQUEST = 64 << 20
+
+
+'''
+DESC:   Detects the faces in an image for the process pool
+
+INPUT:  task:tuple
+            - A ("path", filepath) or ("data", image bytes) tuple
+
+OUTPUT: A detection entry from `Main_Model.detectFaces`
+'''
+def detectTask(task:tuple):
+    kind, value = task
+    image = face_recognition.load_image_file(value if kind == "path" else io.BytesIO(value))
+    return Main_Model.detectFaces(image)
+
+
+'''
+DESC:   Creates the state of the service
+
+INPUT:  pickleDir:str
+            - Where the astronauts' facial data is kept
+        cacheFile:str = CACHE_FILE
+            - The image cache shared with `Main_Model.Master_Model`
+        numProcesses:int = None
+            - The number of detection processes. Defaults to the number of cores
+        batchWindow:float = 0.005
+            - How many seconds the matcher waits for more requests to batch
+        maxBatch:int = 64
+            - The largest number of images matched in one batch
+        saveEvery:int = 100
+            - The number of new cache entries between saves of the cache
+        precision:str = "float64"
+            - The precision the gallery and new cache entries are packed in,
+            see `Face_Matcher.packEncodings`
+
+OUTPUT: A dictionary holding the gallery, cache, pool, and counters
+'''
+def newService(pickleDir:str, cacheFile:str = CACHE_FILE, numProcesses:int = None,
+    batchWindow:float = 0.005, maxBatch:int = 64, saveEvery:int = 100, precision:str = "float64"):
+    if pickleDir[-1] != "/": pickleDir += "/"
+
+    cache = Main_Model.loadCache(cacheFile)
+
+    return {"pickleDir": pickleDir, "gallery": Face_Matcher.loadGallery(pickleDir, precision),
+        "precision": precision, "cacheFile": cacheFile, "cache": cache, "uploads": {}, "unsaved": {},
+        "saveEvery": saveEvery, "batchWindow": batchWindow, "maxBatch": maxBatch,
+        "pool": ProcessPoolExecutor(numProcesses or mp.cpu_count()), "queue": None,
+        "saving": asyncio.Lock(),
+        "stats": {"requests": 0, "images": 0, "cacheHits": 0, "detections": 0,
+        "batches": 0, "batchedImages": 0}}
+
+
+'''
+DESC:   Saves the detections made since the last save into the image cache,
+        so scans and later runs of the service can use them. While serving, the
+        entries are only appended to the cache's journal; the final save merges
+        them into the cache and picks up entries saved by scans in the
+        meantime, see `Main_Model.mergeCache`. The file work runs in a thread so
+        requests keep being served, and saves run one at a time
+
+INPUT:  service:dict
+            - The service from `newService`
+        final:bool = False
+            - Whether the journal should be merged into the cache
+
+OUTPUT: None
+'''
+async def saveCache(service:dict, final:bool = False):
+    loop = asyncio.get_running_loop()
+    async with service["saving"]:
+        # Detections made while this save runs go into the next one
+        entries = service["unsaved"]
+        service["unsaved"] = {}
+        if final:
+            service["cache"] = await loop.run_in_executor(None, Main_Model.mergeCache,
+                service["cacheFile"], entries)
+        elif entries:
+            await loop.run_in_executor(None, Main_Model.journalCache, service["cacheFile"], entries)
+
+
+'''
+DESC:   Matches queued faces against the gallery. Whatever is queued while a
+        batch is being gathered is matched together
+
+INPUT:  service:dict
+            - The service from `newService`
+
+OUTPUT: None, runs until cancelled
+'''
+async def batchMatcher(service:dict):
+    queue = service["queue"]
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await queue.get()]
+        deadline = loop.time() + service["batchWindow"]
+        while len(batch) < service["maxBatch"]:
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), max(deadline - loop.time(), 0)))
+            except asyncio.TimeoutError:
+                break
+
+        results = Face_Matcher.matchBatch(service["gallery"], [encodings for encodings, _ in batch])
+        for (_, future), result in zip(batch, results):
+            if not future.done(): future.set_result(result)
+        service["stats"]["batches"] += 1
+        service["stats"]["batchedImages"] += len(batch)
+
+
+'''
+DESC:   Scans one image, detecting its faces unless they are cached
+
+INPUT:  service:dict
+            - The service from `newService`
+        kind:str
+            - "path" or "data"
+        value
+            - The filepath or the image bytes
+        name:str
+            - The name the image is reported and cached under
+
+OUTPUT: A dictionary with the "image" name, the astronauts as "faces", the
+        distances between them as "proximity", and whether it was "cached"
+'''
+async def scanImage(service:dict, kind:str, value, name:str):
+    loop = asyncio.get_running_loop()
+
+    # Uploads are only cached for the life of the service, by content
+    if kind == "path":
+        key, store = name, service["cache"]
+    else:
+        key, store = hashlib.sha1(value).hexdigest(), service["uploads"]
+
+    cached = key in store
+    if cached:
+        service["stats"]["cacheHits"] += 1
+    else:
+        entry = await loop.run_in_executor(service["pool"], detectTask, (kind, value))
+        store[key] = Main_Model.packCacheEntry(entry, service["precision"])
+        service["stats"]["detections"] += 1
+        if kind == "path":
+            service["unsaved"][key] = store[key]
+            if len(service["unsaved"]) >= service["saveEvery"]: await saveCache(service)
+
+    encodings, locations = Main_Model.readCacheEntry(store[key])
+    future = loop.create_future()
+    await service["queue"].put((encodings, future))
+    faces = await future
+
+    identified = [i for indices in faces.values() for i in indices]
+    proximity = Main_Model.condenseDistances(Main_Model.custFaceDistance(locations), identified)
+    service["stats"]["images"] += 1
+    return {"image": name, "faces": faces, "proximity": proximity, "cached": cached}
+
+
+'''
+DESC:   Handles one request, streaming a line back for every image. A request
+        that can't be read, like one naming a directory that doesn't exist or
+        holding data that isn't base64, gets a single error line
+
+INPUT:  service:dict
+            - The service from `newService`
+        request:dict
+            - The parsed request
+        send
+            - A function that writes one response object
+
+OUTPUT: None
+'''
+async def handleRequest(service:dict, request:dict, send):
+    start = time.time()
+    rid = request.get("id") if isinstance(request, dict) else None
+    service["stats"]["requests"] += 1
+
+    try:
+        op = request.get("op")
+        if op == "stats":
+            send(dict(service["stats"], id = rid, astronauts = len(service["gallery"]["names"]),
+                cached = len(service["cache"])))
+            return
+        if op == "reload":
+            service["gallery"] = Face_Matcher.loadGallery(service["pickleDir"], service["precision"])
+            send({"id": rid, "done": True, "astronauts": len(service["gallery"]["names"])})
+            return
+
+        if "image" in request:
+            tasks = [("path", request["image"], Main_Model.getFileName(request["image"]))]
+        elif "dir" in request:
+            directory = request["dir"] if request["dir"].endswith('/') else request["dir"] + '/'
+            tasks = [("path", directory + f, f) for f in sorted(os.listdir(directory))
+                if f.split('.')[-1] == "jpg"]
+        elif "data" in request:
+            tasks = [("data", base64.b64decode(request["data"], validate = True),
+                request.get("name", "upload.jpg"))]
+        else:
+            send({"id": rid, "error": "A request needs an \"image\", \"dir\", \"data\", or \"op\""})
+            return
+    except Exception as e:
+        send({"id": rid, "error": "{0}: {1}".format(type(e).__name__, e)})
+        return
+
+    count = 0
+    pending = [asyncio.ensure_future(scanImage(service, *task)) for task in tasks]
+    for done in asyncio.as_completed(pending):
+        try:
+            result = await done
+        except Exception as e:
+            send({"id": rid, "error": "{0}: {1}".format(type(e).__name__, e)})
+            continue
+        result["id"] = rid
+        send(result)
+        count += 1
+
+    send({"id": rid, "done": True, "count": count, "ms": round((time.time() - start) * 1000, 2)})
+
+
+'''
+DESC:   Serves one client connection. Requests on a connection run
+        concurrently, so a client can send several before reading results
+
+INPUT:  service:dict
+            - The service from `newService`
+        reader:asyncio.StreamReader
+            - The connection's reader
+        writer:asyncio.StreamWriter
+            - The connection's writer
+
+OUTPUT: None
+'''
+async def handleClient(service:dict, reader:asyncio.StreamReader, writer:asyncio.StreamWriter):
+    def send(obj):
+        writer.write((json.dumps(obj) + '\n').encode())
+
+    requests = []
+    try:
+        while True:
+            try:
+                line = await reader.readline()
+            except ValueError:
+                send({"id": None, "error": "Requests can be at most {0} bytes".format(MAX_REQUEST)})
+                break
+            if not line: break
+            try:
+                request = json.loads(line)
+            except ValueError:
+                send({"id": None, "error": "Requests must be one json object per line"})
+                continue
+            requests.append(asyncio.ensure_future(handleRequest(service, request, send)))
+            await writer.drain()
+
+        # One request failing mustn't stop the others from finishing
+        await asyncio.gather(*requests, return_exceptions = True)
+        await writer.drain()
+    except ConnectionError:
+        for request in requests: request.cancel()
+    finally:
+        writer.close()
+
+
+'''
+DESC:   Runs the service until it gets SIGINT or SIGTERM, then saves the cache
+
+INPUT:  pickleDir:str = '../Data/Temp/Portrait_Bin'
+            - Where the astronauts' facial data is kept. Train the model
+            before starting the service
+        socketPath:str = SOCKET_PATH
+            - Where the Unix socket is created
+        cacheFile:str = CACHE_FILE
+            - The image cache shared with `Main_Model.Master_Model`
+        numProcesses:int = None
+            - The number of detection processes. Defaults to the number of cores
+        precision:str = "float64"
+            - The precision the gallery and new cache entries are packed in
+
+OUTPUT: None
+'''
+async def serve(pickleDir:str = '../Data/Temp/Portrait_Bin', socketPath:str = SOCKET_PATH,
+    cacheFile:str = CACHE_FILE, numProcesses:int = None, precision:str = "float64"):
+    service = newService(pickleDir, cacheFile, numProcesses, precision = precision)
+    service["queue"] = asyncio.Queue()
+
+    if os.path.exists(socketPath): os.remove(socketPath)
+    server = await asyncio.start_unix_server(
+        lambda r, w: handleClient(service, r, w), path = socketPath, limit = MAX_REQUEST)
+    matcher = asyncio.ensure_future(batchMatcher(service))
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM): loop.add_signal_handler(sig, stop.set)
+
+    print("Serving {0} astronauts on {1}".format(len(service["gallery"]["names"]), socketPath))
+    try:
+        await stop.wait()
+    finally:
+        server.close()
+        await server.wait_closed()
+        matcher.cancel()
+        await saveCache(service, final = True)
+        service["pool"].shutdown()
+        if os.path.exists(socketPath): os.remove(socketPath)
+
+
+'''
+DESC:   Sends a request to a running service and yields its responses
+
+INPUT:  request:dict
+            - The request, see the top of this file
+        socketPath:str = SOCKET_PATH
+            - The service's Unix socket
+
+OUTPUT: A generator of response dictionaries, ending after "done" or a request
+        level error
+'''
+def requestScan(request:dict, socketPath:str = SOCKET_PATH):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socketPath)
+        sock.sendall((json.dumps(request) + '\n').encode())
+        sock.shutdown(socket.SHUT_WR)
+        with sock.makefile('r') as f:
+            for line in f:
+                response = json.loads(line)
+                yield response
+                if response.get("done"): return
+
+
+
+if __name__ == "__main__":
+    asyncio.run(serve())
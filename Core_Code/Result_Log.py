@@ -0,0 +1,381 @@
+'''
+@desc:      An append-only log of scan results, replacing the pickle per image
+            that used to be written to `Photo_Bin`. Records are appended to
+            numbered segment files as a length and checksum header followed by
+            the pickled record, so a run that dies mid-write only loses the
+            torn record at the end. An index of where the latest record of
+            every image lives is kept beside the segments. Syncs only append
+            what changed to a journal of the index, which is folded into a
+            fresh index once it outgrows it. Compaction rewrites the live
+            records into fresh segments. Results left in `Photo_Bin` by older
+            versions are moved into the log by `migratePhotoBin`.
+'''
+
+import os
+import json
+import zlib
+import pickle
+import shutil
+import struct
+
+LOG_DIR = '../Data/Temp/Result_Log'
+SEGMENT_SIZE = 64 << 20
+
+# Every record starts with the length and crc32 of its payload
+HEADER = struct.Struct('<II')
+
+
+'''
+DESC:   Finds the filepath of a segment
+
+INPUT:  log:dict
+            - A log from `openLog`
+        segment:int
+            - The number of the segment
+
+OUTPUT: The filepath of the segment
+'''
+def segmentPath(log:dict, segment:int):
+    return '{0}/segment_{1:05d}.log'.format(log["logDir"], segment)
+
+
+'''
+DESC:   Reads the records of a segment in order, starting at an offset. A
+        record that is cut short or fails its checksum ends the segment
+
+INPUT:  path:str
+            - The segment to read
+        offset:int = 0
+            - Where to start reading
+
+OUTPUT: A generator of (offset, length, payload) tuples, where length
+        includes the header
+'''
+def scanSegment(path:str, offset:int = 0):
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        while True:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size: return
+            size, crc = HEADER.unpack(header)
+            payload = f.read(size)
+            if len(payload) < size or zlib.crc32(payload) != crc: return
+            yield offset, HEADER.size + size, payload
+            offset += HEADER.size + size
+
+
+'''
+DESC:   Opens a log, creating it if needed. The saved index is brought up to
+        date with anything appended after it was saved, and a torn record at
+        the end of the last segment is cut off
+
+INPUT:  logDir:str = LOG_DIR
+            - The directory the segments and index are kept in
+        segmentSize:int = SEGMENT_SIZE
+            - The size in bytes after which a new segment is started
+
+OUTPUT: A dictionary holding the log's index and open segment
+'''
+def openLog(logDir:str = LOG_DIR, segmentSize:int = SEGMENT_SIZE):
+    if not os.path.isdir(logDir): os.makedirs(logDir)
+    log = {"logDir": logDir, "segmentSize": segmentSize, "sizes": {}, "records": {}, "file": None,
+        "unsaved": set(), "journalSize": 0}
+
+    segments = sorted(int(f[8:13]) for f in os.listdir(logDir)
+        if f.startswith('segment_') and f.endswith('.log'))
+
+    saved = {"sizes": {}, "records": {}, "generation": 0}
+    log["indexSize"] = 0
+    if os.path.exists(logDir + '/index.json'):
+        with open(logDir + '/index.json') as f:
+            saved = json.load(f)
+        log["indexSize"] = os.path.getsize(logDir + '/index.json')
+    log["generation"] = saved.get("generation", 0)
+
+    # Syncs since the index was saved are replayed from its journal. A line
+    # torn by a crash ends the journal, and the segments are read from there
+    journal = journalPath(log)
+    torn = False
+    if os.path.exists(journal):
+        with open(journal) as f:
+            for line in f:
+                try: change = json.loads(line)
+                except ValueError:
+                    torn = True
+                    break
+                saved["sizes"].update(change["sizes"])
+                saved["records"].update(change["records"])
+        log["journalSize"] = os.path.getsize(journal)
+    for f in os.listdir(logDir):
+        if f.startswith('index_') and f.endswith('.journal') and f != os.path.basename(journal):
+            os.remove(logDir + '/' + f)
+
+    # The saved index is only trusted if none of its segments have shrunk or
+    # gone missing, otherwise every segment is read again
+    sizes = {int(k): v for k, v in saved["sizes"].items()}
+    rebuilt = any(s not in segments or os.path.getsize(segmentPath(log, s)) < size
+        for s, size in sizes.items())
+    if rebuilt:
+        sizes = {}
+        saved["records"] = {}
+    log["records"] = {name: tuple(entry) for name, entry in saved["records"].items()}
+
+    for segment in segments:
+        end = sizes.get(segment, 0)
+        for offset, length, payload in scanSegment(segmentPath(log, segment), end):
+            name = pickle.loads(payload)[0]
+            log["records"][name] = (segment, offset, length)
+            log["unsaved"].add(name)
+            end = offset + length
+        log["sizes"][segment] = end
+
+    # Anything past the last good record is a torn write
+    active = segments[-1] if segments else 0
+    log["active"] = active
+    path = segmentPath(log, active)
+    if os.path.exists(path) and os.path.getsize(path) > log["sizes"].get(active, 0):
+        with open(path, 'r+b') as f:
+            f.truncate(log["sizes"][active])
+    log["sizes"].setdefault(active, 0)
+    if rebuilt or torn: saveIndex(log)
+    return log
+
+
+'''
+DESC:   Appends a record to the log, starting a new segment once the current
+        one is full
+
+INPUT:  log:dict
+            - A log from `openLog`
+        record:tuple
+            - The record, whose first element is the name of its image. A later
+            record for the same image replaces the earlier one
+
+OUTPUT: None
+'''
+def appendRecord(log:dict, record:tuple):
+    if log["sizes"][log["active"]] >= log["segmentSize"]:
+        closeSegment(log)
+        log["active"] += 1
+        log["sizes"][log["active"]] = 0
+
+    if log["file"] is None: log["file"] = open(segmentPath(log, log["active"]), 'ab')
+
+    payload = pickle.dumps(record, protocol = pickle.HIGHEST_PROTOCOL)
+    log["file"].write(HEADER.pack(len(payload), zlib.crc32(payload)))
+    log["file"].write(payload)
+
+    offset = log["sizes"][log["active"]]
+    log["records"][record[0]] = (log["active"], offset, HEADER.size + len(payload))
+    log["sizes"][log["active"]] = offset + HEADER.size + len(payload)
+    log["unsaved"].add(record[0])
+
+
+'''
+DESC:   Flushes and closes the segment being appended to
+
+INPUT:  log:dict
+            - A log from `openLog`
+
+OUTPUT: None
+'''
+def closeSegment(log:dict):
+    if log["file"] is None: return
+    log["file"].flush()
+    os.fsync(log["file"].fileno())
+    log["file"].close()
+    log["file"] = None
+
+
+'''
+DESC:   Finds the filepath of the journal of the current index
+
+INPUT:  log:dict
+            - A log from `openLog`
+
+OUTPUT: The filepath of the journal
+'''
+def journalPath(log:dict):
+    return '{0}/index_{1:05d}.journal'.format(log["logDir"], log["generation"])
+
+
+'''
+DESC:   Saves the whole index and starts a new, empty journal for it
+
+INPUT:  log:dict
+            - A log from `openLog`
+
+OUTPUT: None
+'''
+def saveIndex(log:dict):
+    old = journalPath(log)
+    log["generation"] += 1
+    indexFile = log["logDir"] + '/index.json'
+    with open(indexFile + '.tmp', 'w') as f:
+        json.dump({"sizes": log["sizes"], "records": log["records"], "generation": log["generation"]}, f)
+    os.replace(indexFile + '.tmp', indexFile)
+    if os.path.exists(old): os.remove(old)
+
+    log["indexSize"] = os.path.getsize(indexFile)
+    log["journalSize"] = 0
+    log["unsaved"] = set()
+
+
+'''
+DESC:   Makes everything appended so far durable and saves the index. Only the
+        records appended since the last sync are written, to the index's
+        journal, until the journal is larger than the index itself
+
+INPUT:  log:dict
+            - A log from `openLog`
+
+OUTPUT: None
+'''
+def syncLog(log:dict):
+    if log["file"] is not None:
+        log["file"].flush()
+        os.fsync(log["file"].fileno())
+    if not log["unsaved"]: return
+
+    if log["journalSize"] > log["indexSize"]: return saveIndex(log)
+    line = json.dumps({"sizes": log["sizes"],
+        "records": {name: log["records"][name] for name in log["unsaved"]}}) + '\n'
+    with open(journalPath(log), 'a') as f:
+        f.write(line)
+    log["journalSize"] += len(line)
+    log["unsaved"] = set()
+
+
+'''
+DESC:   Reads the latest records of the given images. Records are read in the
+        order they sit on disk, one segment at a time
+
+INPUT:  log:dict
+            - A log from `openLog`
+        names:list = None
+            - The images to read. Defaults to every image in the log
+
+OUTPUT: A generator of records
+'''
+def replayLog(log:dict, names:list = None):
+    if log["file"] is not None: log["file"].flush()
+    if names is None: names = log["records"]
+    entries = sorted(log["records"][name] for name in names if name in log["records"])
+
+    f = None
+    current = None
+    for segment, offset, length in entries:
+        if segment != current:
+            if f is not None: f.close()
+            f = open(segmentPath(log, segment), 'rb')
+            current = segment
+        if f.tell() != offset: f.seek(offset)
+        yield pickle.loads(f.read(length)[HEADER.size:])
+    if f is not None: f.close()
+
+
+'''
+DESC:   Reads the latest record of an image
+
+INPUT:  log:dict
+            - A log from `openLog`
+        name:str
+            - The name of the image
+
+OUTPUT: The record, or None if the image isn't in the log
+'''
+def readRecord(log:dict, name:str):
+    for record in replayLog(log, [name]): return record
+    return None
+
+
+'''
+DESC:   Finds how much of a log is taken up by records that have been replaced
+
+INPUT:  log:dict
+            - A log from `openLog`
+
+OUTPUT: The fraction of the log's bytes that are no longer live
+'''
+def garbageRatio(log:dict):
+    total = sum(log["sizes"].values())
+    if total == 0: return 0.0
+    return 1 - sum(entry[2] for entry in log["records"].values()) / total
+
+
+'''
+DESC:   Rewrites the live records of a log into new segments and deletes the
+        old ones. The new segments are numbered after the old ones, so a crash
+        part way through still leaves the latest records winning when the log
+        is opened again
+
+INPUT:  log:dict
+            - A log from `openLog`
+
+OUTPUT: A tuple of the number of bytes before and after compaction
+'''
+def compactLog(log:dict):
+    before = sum(log["sizes"].values())
+    old = sorted(log["sizes"])
+    records = list(replayLog(log))
+
+    closeSegment(log)
+    log["active"] = old[-1] + 1
+    log["sizes"] = {log["active"]: 0}
+    log["records"] = {}
+    for record in records: appendRecord(log, record)
+    closeSegment(log)
+    saveIndex(log)
+
+    for segment in old:
+        if os.path.exists(segmentPath(log, segment)): os.remove(segmentPath(log, segment))
+    return before, sum(log["sizes"].values())
+
+
+'''
+DESC:   Syncs and closes a log
+
+INPUT:  log:dict
+            - A log from `openLog`
+
+OUTPUT: None
+'''
+def closeLog(log:dict):
+    syncLog(log)
+    closeSegment(log)
+
+
+'''
+DESC:   Moves the results older versions pickled to `Photo_Bin`, one .dat file
+        per image, into a log and removes the directory. An image the log
+        already has a record of keeps it, since the log is newer. Results that
+        can't be read are dropped, the same as a torn record
+
+INPUT:  log:dict
+            - A log from `openLog`
+        photoBin:str
+            - The directory of the old pickles
+
+OUTPUT: The number of results moved
+'''
+def migratePhotoBin(log:dict, photoBin:str):
+    if not os.path.isdir(photoBin): return 0
+
+    moved = 0
+    for filename in sorted(os.listdir(photoBin)):
+        if not filename.endswith('.dat'): continue
+        try:
+            with open(os.path.join(photoBin, filename), 'rb') as f:
+                result = tuple(pickle.load(f))
+        except (OSError, EOFError, pickle.UnpicklingError):
+            continue
+        if result[0] in log["records"]: continue
+
+        # Results from before scans had ids lack the distances and the id
+        appendRecord(log, result + (None,) * (4 - len(result)))
+        moved += 1
+
+    # The pickles are only removed once their records are on disk
+    syncLog(log)
+    shutil.rmtree(photoBin)
+    return moved
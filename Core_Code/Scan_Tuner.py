@@ -0,0 +1,257 @@
+'''
+@desc:      Calibrates the scan engine on the machine it runs on. A sample of
+            images is scanned with different detector upsample factors, process
+            counts, and native (BLAS/OpenMP) thread counts per process, and the
+            setting that scans the most images per second, without finding
+            fewer faces, is saved as a profile. `Facial_Detection_Driver`
+            loads the profile automatically when it is run.
+
+            Native thread counts are set through environment variables, which
+            libraries only read when they're loaded, so a profile governs the
+            processes started after it is applied, and calibration runs every
+            setting in freshly spawned processes.
+'''
+
+import os
+import json
+import time
+import socket
+import multiprocessing as mp
+
+PROFILE_FILE = '../Data/Temp/Scan_Profile.json'
+
+# The variables the common BLAS and OpenMP builds read their thread count from
+NATIVE_THREAD_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+
+'''
+DESC:   Loads the saved profile. A profile made on a machine with a different
+        number of cores is ignored
+
+INPUT:  profileFile:str = PROFILE_FILE
+            - Where the profile is kept
+
+OUTPUT: The profile, or None if there isn't one for this machine
+'''
+def loadProfile(profileFile:str = PROFILE_FILE):
+    if not os.path.exists(profileFile): return None
+    with open(profileFile) as f:
+        profile = json.load(f)
+    if profile.get("cpus") != os.cpu_count(): return None
+    return profile
+
+
+'''
+DESC:   Sets the native thread count of a profile for libraries that haven't
+        been loaded yet, and for every process started afterwards. Variables
+        that are already set are left alone, so they can still be overridden
+        from the shell
+
+INPUT:  profile:dict
+            - A profile from `loadProfile`, or None
+
+OUTPUT: The profile
+'''
+def applyProfile(profile:dict):
+    if profile is None: return None
+    for var in NATIVE_THREAD_VARS:
+        os.environ.setdefault(var, str(profile["threads"]))
+    return profile
+
+
+'''
+DESC:   Picks a sample of images spread evenly over a directory
+
+INPUT:  dataDir:str
+            - The directory to sample, including its sub-directories
+        sampleSize:int
+            - The number of images to pick
+
+OUTPUT: A list of image filepaths
+'''
+def sampleImages(dataDir:str, sampleSize:int):
+    images = []
+    for root, dirs, files in os.walk(dataDir):
+        dirs.sort()
+        images += [os.path.join(root, f) for f in sorted(files) if f.split('.')[-1] == "jpg"]
+    if len(images) <= sampleSize: return images
+    step = len(images) / sampleSize
+    return [images[int(i * step)] for i in range(sampleSize)]
+
+
+'''
+DESC:   Loads the detector in a calibration process before it is timed
+
+INPUT:  None
+
+OUTPUT: None
+'''
+def initWorker():
+    # Imported here, after the process has its native thread variables
+    import Main_Model
+
+
+'''
+DESC:   A short task that makes sure every process in a pool has started
+
+INPUT:  seconds:float
+            - How long to wait
+
+OUTPUT: None
+'''
+def warmTask(seconds:float):
+    time.sleep(seconds)
+
+
+'''
+DESC:   Detects the faces in one image, the way a scan does
+
+INPUT:  task:tuple
+            - The (image filepath, upsample factor) to detect with
+
+OUTPUT: The number of faces found
+'''
+def detectTask(task:tuple):
+    import face_recognition
+    import Main_Model
+    path, upsample = task
+    return len(Main_Model.detectFaces(face_recognition.load_image_file(path), upsample)["encodings"])
+
+
+'''
+DESC:   Times one setting on the sample. The pool is spawned rather than
+        forked so every process loads its libraries with the thread count
+        being tried
+
+INPUT:  sample:list
+            - The images to scan
+        processes:int
+            - The number of scanning processes
+        threads:int
+            - The number of native threads in each process
+        upsample:int
+            - The detector's upsample factor, or None to pick one per image
+
+OUTPUT: A dictionary of the setting, the "seconds" it took, the
+        "imagesPerSecond", and the number of "faces" found
+'''
+def timeSetting(sample:list, processes:int, threads:int, upsample:int):
+    saved = {var: os.environ.get(var) for var in NATIVE_THREAD_VARS}
+    for var in NATIVE_THREAD_VARS: os.environ[var] = str(threads)
+    try:
+        with mp.get_context('spawn').Pool(processes, initializer = initWorker) as pool:
+            pool.map(warmTask, [0.1] * processes, chunksize = 1)
+            start = time.time()
+            faces = pool.map(detectTask, [(path, upsample) for path in sample], chunksize = 1)
+            elapsed = time.time() - start
+    finally:
+        for var, value in saved.items():
+            if value is None: os.environ.pop(var, None)
+            else: os.environ[var] = value
+
+    return {"processes": processes, "threads": threads, "upsample": upsample,
+        "seconds": round(elapsed, 3), "imagesPerSecond": round(len(sample) / elapsed, 3),
+        "faces": sum(faces)}
+
+
+'''
+DESC:   Lists the counts worth trying up to a limit: the powers of two, and the
+        limit itself
+
+INPUT:  limit:int
+            - The largest count
+
+OUTPUT: A sorted list of counts
+'''
+def candidateCounts(limit:int):
+    counts = {limit}
+    count = 1
+    while count < limit:
+        counts.add(count)
+        count *= 2
+    return sorted(counts)
+
+
+'''
+DESC:   Calibrates the scan engine and saves the fastest setting as the
+        profile. The upsample factor is picked first, with one native thread
+        per process, from the factors that find at least `minFaces` of the
+        faces the most thorough factor finds. Process and thread counts are
+        then tried with it, never using more threads in total than there are
+        cores
+
+INPUT:  dataDir:str = "../Data/Input"
+            - The images to sample
+        sampleSize:int = None
+            - The number of images each setting scans. Defaults to two per
+            core, and at least 8, so every process gets images to scan
+        processCounts:list = None
+            - The process counts to try. Defaults to the powers of two up to
+            the number of cores, and the number of cores. Counts larger than
+            the sample are skipped, since the extra processes would sit idle
+        threadCounts:list = None
+            - The native thread counts to try, chosen the same way
+        upsamples:tuple = (0, 1, 2, None)
+            - The upsample factors to try. None picks one per image, see
+            `Main_Model.chooseDetector`
+        minFaces:float = 1.0
+            - The fraction of the most faces found that a factor has to find
+        profileFile:str = PROFILE_FILE
+            - Where the profile is saved
+        verbose:bool = True
+            - Whether every setting is printed
+
+OUTPUT: The profile, with every timed setting as "trials"
+'''
+def tuneScan(dataDir:str = "../Data/Input", sampleSize:int = None, processCounts:list = None,
+    threadCounts:list = None, upsamples:tuple = (0, 1, 2, None), minFaces:float = 1.0,
+    profileFile:str = PROFILE_FILE, verbose:bool = True):
+    cpus = os.cpu_count()
+    if sampleSize is None: sampleSize = max(8, 2 * cpus)
+    sample = sampleImages(dataDir, sampleSize)
+    if not sample: raise ValueError("There are no images in {0} to calibrate with".format(dataDir))
+    if processCounts is None: processCounts = candidateCounts(cpus)
+    processCounts = [p for p in processCounts if p <= len(sample)]
+    if threadCounts is None: threadCounts = candidateCounts(cpus)
+
+    trials = []
+    def run(processes, threads, upsample):
+        trial = timeSetting(sample, processes, threads, upsample)
+        trials.append(trial)
+        if verbose:
+            print("\t{processes} processes x {threads} threads, upsample {0}: "
+                "{imagesPerSecond:.2f} images/s, {faces} faces".format(
+                "adaptive" if upsample is None else upsample, **trial))
+        return trial
+
+    if verbose: print("Calibrating on {0} images from {1} with {2} cores".format(len(sample), dataDir, cpus))
+    processes = min(cpus, len(sample))
+    byUpsample = [run(processes, 1, upsample) for upsample in upsamples]
+    most = max(trial["faces"] for trial in byUpsample)
+    upsample = max((t for t in byUpsample if t["faces"] >= minFaces * most),
+        key = lambda t: t["imagesPerSecond"])["upsample"]
+
+    settings = [(p, t) for p in processCounts for t in threadCounts if t == 1 or p * t <= cpus]
+    best = max([run(p, t, upsample) for p, t in settings if (p, t) != (processes, 1)] +
+        [t for t in byUpsample if t["upsample"] == upsample], key = lambda t: t["imagesPerSecond"])
+
+    profile = {"processes": best["processes"], "threads": best["threads"], "upsample": upsample,
+        "imagesPerSecond": best["imagesPerSecond"], "cpus": cpus, "host": socket.gethostname(),
+        "sample": len(sample), "created": time.strftime('%Y-%m-%d %H:%M:%S'), "trials": trials}
+
+    os.makedirs(os.path.dirname(profileFile) or '.', exist_ok = True)
+    with open(profileFile + '.tmp', 'w') as f:
+        json.dump(profile, f, indent = 2)
+    os.replace(profileFile + '.tmp', profileFile)
+
+    if verbose:
+        print("Saved {0}: {1} processes x {2} threads, upsample {3}, {4:.2f} images/s".format(
+            profileFile, profile["processes"], profile["threads"],
+            "adaptive" if upsample is None else upsample, profile["imagesPerSecond"]))
+    return profile
+
+
+
+if __name__ == "__main__":
+    tuneScan()
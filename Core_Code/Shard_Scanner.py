@@ -0,0 +1,429 @@
+'''
+@desc:      Scans an image archive with several nodes sharing one work directory
+            (over NFS, or locally with several worker processes). The images
+            are split into shards, and nodes claim shards by creating lease
+            files with O_EXCL. A node keeps its lease alive with a heartbeat
+            while it scans, and a lease whose heartbeat stops is taken over
+            once it expires. Finished shards are written as partial results,
+            which are merged into the usual `Scan_Result` jsons at the end.
+
+            A node stops the heartbeat and gives a shard up if it loses the
+            lease, if no image has finished for a whole lease time, or if the
+            shard runs past its deadline, so a stuck node never holds a shard
+            forever.
+
+            Work directory layout:
+                manifest.json       - the shards and the images in each
+                leases/<shard>      - the node currently scanning a shard
+                done/<shard>.json   - the results of every finished shard
+                nodes/<node>/       - each node's own result log, checkpoints,
+                                      and the cache entries it detected
+
+            Results are the same no matter which node scans a shard, so a
+            shard that ends up scanned twice (a lease expired while its node
+            was still alive) is harmless; the last copy written wins. Lease
+            expiry compares file modification times against the local clock,
+            so node clocks should agree to well within the lease time.
+'''
+
+import os
+import json
+import time
+import uuid
+import socket
+import threading
+import multiprocessing as mp
+import Main_Model
+from Atomic_Write import writeJson
+
+LEASE_TIME = 300
+# The longest a node spends on one shard before giving it up
+SHARD_TIME = 3600
+
+
+'''
+DESC:   Splits the images in a directory into shards and saves the manifest.
+        The first node to create the manifest wins; every other node reads the
+        existing one, so all nodes agree on the shards
+
+INPUT:  dataDir:str
+            - The directory of images to scan
+        workDir:str
+            - The shared work directory
+        shardSize:int = 50
+            - The number of images in each shard
+        recursive:bool = True
+            - Whether sub-directories are scanned too
+
+OUTPUT: The manifest, a dictionary where keys are shard names and values are
+        dictionaries with the result "key" and the "images" in the shard
+'''
+def planShards(dataDir:str, workDir:str, shardSize:int = 50, recursive:bool = True):
+    for sub in ("leases", "done", "nodes"):
+        Main_Model.prepDir('{0}/{1}/'.format(workDir, sub))
+
+    manifestFile = workDir + '/manifest.json'
+    if os.path.exists(manifestFile):
+        with open(manifestFile) as f:
+            return json.load(f)
+
+    manifest = {}
+    for directory in sorted(Main_Model.findDir(dataDir, recursive)):
+        images = sorted(f for f in os.listdir(directory) if f.split('.')[-1] == "jpg")
+        prefix = directory if directory.endswith('/') else directory + '/'
+        for start in range(0, len(images), shardSize):
+            name = 'shard_{0:05d}'.format(len(manifest))
+            manifest[name] = {"key": Main_Model.resultKey(directory),
+                "images": [prefix + f for f in images[start:start + shardSize]]}
+
+    # Publishing with a hard link fails if another node got there first
+    tmp = '{0}.{1}.tmp'.format(manifestFile, uuid.uuid4().hex)
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f)
+    try:
+        os.link(tmp, manifestFile)
+    except FileExistsError:
+        with open(manifestFile) as f:
+            manifest = json.load(f)
+    finally:
+        os.remove(tmp)
+
+    return manifest
+
+
+'''
+DESC:   Tries to claim a shard. A lease that hasn't had a heartbeat in
+        `leaseTime` seconds is considered abandoned; it is renamed out of the
+        way (only one node can win the rename) and claimed again. The lease
+        can be renewed or replaced between checking it and renaming it, so the
+        renamed file is checked again, and put back if it isn't the stale
+        lease anymore
+
+INPUT:  workDir:str
+            - The shared work directory
+        shard:str
+            - The shard to claim
+        token:str
+            - A token unique to this claim, written into the lease
+        leaseTime:float = LEASE_TIME
+            - How long a lease lives without a heartbeat
+
+OUTPUT: True if the shard was claimed
+'''
+def claimLease(workDir:str, shard:str, token:str, leaseTime:float = LEASE_TIME):
+    lease = '{0}/leases/{1}'.format(workDir, shard)
+    aside = '{0}.expired.{1}'.format(lease, token)
+    try:
+        stale = os.stat(lease)
+        if time.time() - stale.st_mtime > leaseTime:
+            with open(lease) as f:
+                staleToken = f.read()
+            os.rename(lease, aside)
+            with open(aside) as f:
+                moved = f.read() == staleToken and os.fstat(f.fileno()).st_mtime_ns == stale.st_mtime_ns
+            if not moved:
+                # Put it back, unless a new lease has been created meanwhile
+                try:
+                    os.link(aside, lease)
+                except FileExistsError:
+                    pass
+                os.remove(aside)
+                return False
+            os.remove(aside)
+    except FileNotFoundError:
+        pass
+
+    try:
+        fd = os.open(lease, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+    except FileExistsError:
+        return False
+
+    with os.fdopen(fd, 'w') as f:
+        f.write(token)
+    return True
+
+
+'''
+DESC:   Checks whether a lease still belongs to a claim
+
+INPUT:  workDir:str
+            - The shared work directory
+        shard:str
+            - The leased shard
+        token:str
+            - The token of the claim
+
+OUTPUT: True if the lease is still held with the token
+'''
+def holdsLease(workDir:str, shard:str, token:str):
+    try:
+        with open('{0}/leases/{1}'.format(workDir, shard)) as f:
+            return f.read() == token
+    except FileNotFoundError:
+        return False
+
+
+'''
+DESC:   Gives up a lease, unless another node has already taken it over
+
+INPUT:  workDir:str
+            - The shared work directory
+        shard:str
+            - The leased shard
+        token:str
+            - The token of the claim
+
+OUTPUT: None
+'''
+def releaseLease(workDir:str, shard:str, token:str):
+    if holdsLease(workDir, shard, token):
+        try:
+            os.remove('{0}/leases/{1}'.format(workDir, shard))
+        except FileNotFoundError:
+            pass
+
+
+'''
+DESC:   Keeps a lease alive by touching it until told to stop. The heartbeat
+        stops on its own, and sets `lost`, when the lease is lost to another
+        node, when the scan makes no progress for `stallTime` seconds, or when
+        the deadline passes, so the lease can expire and another node can take
+        the shard over
+
+INPUT:  workDir:str
+            - The shared work directory
+        shard:str
+            - The leased shard
+        token:str
+            - The token of the claim
+        stop:threading.Event
+            - Set when the shard is finished
+        interval:float
+            - The number of seconds between heartbeats
+        lost:threading.Event = None
+            - Set when the heartbeat stops on its own, so the scan can stop too
+        progress = None
+            - A function returning a count that grows as the scan progresses
+        stallTime:float = None
+            - How long the count may stay the same
+        deadline:float = None
+            - The time, from `time.time`, the shard has to be finished by
+
+OUTPUT: None
+'''
+def heartbeat(workDir:str, shard:str, token:str, stop:threading.Event, interval:float,
+    lost:threading.Event = None, progress = None, stallTime:float = None, deadline:float = None):
+    count, changed = None, time.time()
+    while not stop.wait(interval):
+        now = time.time()
+        if progress is not None and progress() != count: count, changed = progress(), now
+        if stallTime is not None and now - changed > stallTime: break
+        if deadline is not None and now > deadline: break
+        if not holdsLease(workDir, shard, token): break
+        try:
+            os.utime('{0}/leases/{1}'.format(workDir, shard))
+        except FileNotFoundError:
+            break
+    else:
+        return
+
+    if lost is not None: lost.set()
+
+
+'''
+DESC:   Lists the shards that have no results yet
+
+INPUT:  manifest:dict
+            - The manifest from `planShards`
+        workDir:str
+            - The shared work directory
+
+OUTPUT: A list of shard names
+'''
+def pendingShards(manifest:dict, workDir:str):
+    return [s for s in sorted(manifest)
+        if not os.path.exists('{0}/done/{1}.json'.format(workDir, s))]
+
+
+'''
+DESC:   Runs one scanning node. The node claims shards until every shard has
+        results, waiting for leases held by other nodes to finish or expire.
+        A shard the node had to give up (see `heartbeat`) is left to the other
+        nodes
+
+INPUT:  trainDir:str
+            - The directory of astronaut portraits, as in
+            `Facial_Detection_Driver.runModel`
+        pickleDir:str
+            - Where the astronauts' facial data is kept. Should already be
+            trained, so nodes don't train at the same time
+        workDir:str
+            - The shared work directory. `planShards` must have been run
+        numThreads:int = 4
+            - The number of processes this node scans with
+        leaseTime:float = LEASE_TIME
+            - How long a lease lives without a heartbeat
+        nodeId:str = None
+            - A name for the node. Defaults to the hostname and process id
+        shardTime:float = SHARD_TIME
+            - The longest the node spends on one shard
+
+OUTPUT: A list of the shards this node finished
+'''
+def runNode(trainDir:str, pickleDir:str, workDir:str, numThreads:int = 4,
+    leaseTime:float = LEASE_TIME, nodeId:str = None, shardTime:float = SHARD_TIME):
+    if trainDir[-1] != "/": trainDir += "/"
+    if pickleDir[-1] != "/": pickleDir += "/"
+    if nodeId is None: nodeId = '{0}-{1}'.format(socket.gethostname(), os.getpid())
+
+    with open(workDir + '/manifest.json') as f:
+        manifest = json.load(f)
+
+    # Every node keeps its own files so nodes never write the same file. The
+    # shared image cache is only read; new entries are saved to the node's
+    # cache, which `mergeShards` folds back in
+    model = Main_Model.Master_Model(trainDir, pickleDir, numThreads)
+    nodeDir = '{0}/nodes/{1}'.format(workDir, nodeId)
+    model.result_log_dir = nodeDir + '/Result_Log'
+    model.checkpoint_dir = nodeDir + '/Scan_Checkpoints/'
+    model.main_cache = nodeDir + '/Input_Cache.dat'
+    Main_Model.prepDir(nodeDir + '/')
+
+    finished = []
+    abandoned = set()
+    while True:
+        pending = [s for s in pendingShards(manifest, workDir) if s not in abandoned]
+        if not pending: break
+
+        claimed = False
+        for shard in pending:
+            token = '{0}:{1}'.format(nodeId, uuid.uuid4().hex)
+            if not claimLease(workDir, shard, token, leaseTime): continue
+            # Another node may have finished it between listing and claiming
+            if os.path.exists('{0}/done/{1}.json'.format(workDir, shard)):
+                releaseLease(workDir, shard, token)
+                continue
+
+            claimed = True
+            stop = threading.Event()
+            lost = threading.Event()
+            beat = threading.Thread(target = heartbeat, daemon = True,
+                args = (workDir, shard, token, stop, leaseTime / 3, lost,
+                lambda: model.harvested, leaseTime, time.time() + shardTime))
+            beat.start()
+            try:
+                model.clearResults()
+                results = model.findFacesFiles(manifest[shard]["images"], abort = lost)
+                if lost.is_set():
+                    print("Node {0} gave up {1}".format(nodeId, shard))
+                    abandoned.add(shard)
+                    continue
+                writeJson('{0}/done/{1}.json'.format(workDir, shard),
+                    {"key": manifest[shard]["key"], "node": nodeId, "results": results})
+                finished.append(shard)
+            finally:
+                stop.set()
+                beat.join()
+                releaseLease(workDir, shard, token)
+
+        # Everything left is leased by other nodes
+        if not claimed: time.sleep(min(leaseTime / 3, 10))
+
+    return finished
+
+
+'''
+DESC:   Merges the results of every shard into `Scan_Result` jsons, one per
+        scanned directory, and the cache entries every node detected into the
+        shared image cache
+
+INPUT:  workDir:str
+            - The shared work directory
+        dumpDir:str = "../Data/Scan_Result"
+            - Where the merged results are saved
+        cacheFile:str = None
+            - The shared image cache. The nodes' caches aren't merged if it
+            isn't given
+
+OUTPUT: A list of the result files that were written
+'''
+def mergeShards(workDir:str, dumpDir:str = "../Data/Scan_Result", cacheFile:str = None):
+    with open(workDir + '/manifest.json') as f:
+        manifest = json.load(f)
+
+    pending = pendingShards(manifest, workDir)
+    if pending:
+        raise RuntimeError("{0} shards have no results yet, starting with {1}".format(
+            len(pending), pending[0]))
+
+    merged = {}
+    for shard in sorted(manifest):
+        with open('{0}/done/{1}.json'.format(workDir, shard)) as f:
+            part = json.load(f)
+        merged.setdefault(part["key"], {}).update(part["results"])
+
+    if cacheFile is not None:
+        entries = {}
+        for node in sorted(os.listdir(workDir + '/nodes')):
+            entries.update(Main_Model.loadCache('{0}/nodes/{1}/Input_Cache.dat'.format(workDir, node)))
+        Main_Model.mergeCache(cacheFile, entries)
+
+    Main_Model.prepDir(dumpDir)
+    written = []
+    for key, photos in merged.items():
+        written.append('{0}/{1}_result.json'.format(dumpDir, key))
+        writeJson(written[-1], photos)
+    return written
+
+
+'''
+DESC:   Scans an archive with several local worker processes acting as nodes,
+        then merges their results. Each worker is a full node, so this is the
+        same code path multi-machine runs take
+
+INPUT:  trainDir:str
+            - The directory of astronaut portraits
+        dataDir:str
+            - The directory of images to scan
+        pickleDir:str
+            - Where the astronauts' facial data is kept
+        workDir:str
+            - The work directory shared by the nodes
+        numNodes:int = 2
+            - The number of worker processes
+        numThreads:int = 1
+            - The number of processes each node scans with
+        dumpDir:str = "../Data/Scan_Result"
+            - Where the merged results are saved
+        shardSize:int = 50
+            - The number of images in each shard
+        recursive:bool = True
+            - Whether sub-directories are scanned too
+        leaseTime:float = LEASE_TIME
+            - How long a lease lives without a heartbeat
+
+OUTPUT: A list of the result files that were written
+'''
+def runLocal(trainDir:str, dataDir:str, pickleDir:str, workDir:str, numNodes:int = 2,
+    numThreads:int = 1, dumpDir:str = "../Data/Scan_Result", shardSize:int = 50,
+    recursive:bool = True, leaseTime:float = LEASE_TIME):
+    if trainDir[-1] != "/": trainDir += "/"
+    if pickleDir[-1] != "/": pickleDir += "/"
+
+    # Train once up front so the nodes only read the facial data
+    model = Main_Model.Master_Model(trainDir, pickleDir, numThreads)
+    planShards(dataDir, workDir, shardSize, recursive)
+
+    nodes = [mp.Process(target = runNode, args = (trainDir, pickleDir, workDir,
+        numThreads, leaseTime, 'local-{0}'.format(i))) for i in range(numNodes)]
+    for node in nodes: node.start()
+    for node in nodes: node.join()
+
+    return mergeShards(workDir, dumpDir, model.main_cache)
+
+
+
+if __name__ == "__main__":
+    runLocal(trainDir = "../Data/Portraits", dataDir = "../Data/Input",
+        pickleDir = "../Data/Temp/Portrait_Bin", workDir = "../Data/Temp/Shard_Work",
+        numNodes = 2, shardSize = 20)
@@ -0,0 +1,208 @@
+'''
+@desc:      Caches resized astronaut portraits. Thumbnails are keyed by the
+            hash of the source image and the target width, so only portraits
+            that changed are resized again. Resizing runs in a worker pool, and
+            all thumbnails are packed into one atlas png whose index is stored
+            in the png itself, so the whole set loads with a single read.
+'''
+
+import os
+import glob
+import json
+import math
+import hashlib
+import multiprocessing as mp
+from PIL import Image, PngImagePlugin
+from Atomic_Write import writeJson
+
+CACHE_DIR = '../Data/Temp/Thumbnail_Cache'
+ATLAS_FILE = '../Data/Temp/Portrait_Atlas.png'
+
+
+'''
+DESC:   Gets the astronaut name a portrait belongs to, in the same way as
+        `Graph_Generation_Driver.assignPhotos`
+
+INPUT:  path:str
+            - A filepath such as '../cropped_first_last&country.jpg'
+
+OUTPUT: The name of the astronaut as "first last"
+'''
+def portraitName(path:str):
+    name = os.path.basename(path).split('&')[0].split('_')
+    return name[-2] + " " + name[-1]
+
+
+'''
+DESC:   Hashes the contents of a file
+
+INPUT:  path:str
+            - The file to hash
+
+OUTPUT: The sha1 hex digest of the file
+'''
+def fileHash(path:str):
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+'''
+DESC:   Hashes every portrait, reusing the hash of any file whose size and
+        modification time haven't changed since the last run
+
+INPUT:  files:list
+            - The portraits to hash
+        cacheDir:str = CACHE_DIR
+            - Where the hashes are remembered between runs
+
+OUTPUT: A dictionary where keys are filepaths and values are their hashes
+'''
+def hashPortraits(files:list, cacheDir:str = CACHE_DIR):
+    manifestFile = cacheDir + '/hashes.json'
+    manifest = {}
+    if os.path.exists(manifestFile):
+        with open(manifestFile) as f:
+            manifest = json.load(f)
+
+    hashes = {}
+    changed = False
+    for file in files:
+        stat = os.stat(file)
+        signature = [stat.st_mtime_ns, stat.st_size]
+        key = os.path.abspath(file)
+        if key not in manifest or manifest[key][0] != signature:
+            manifest[key] = [signature, fileHash(file)]
+            changed = True
+        hashes[file] = manifest[key][1]
+
+    if changed: writeJson(manifestFile, manifest)
+    return hashes
+
+
+'''
+DESC:   Resizes a portrait to a given width, keeping its aspect ratio, and saves
+        it to the cache
+
+INPUT:  task:tuple
+            - A (source filepath, thumbnail filepath, width) tuple
+
+OUTPUT: The thumbnail filepath
+'''
+def resizePortrait(task:tuple):
+    source, target, baseWidth = task
+    im = Image.open(source).convert("RGB")
+
+    wpercent = (baseWidth / float(im.size[0]))
+    hsize = max(1, int((float(im.size[1]) * float(wpercent))))
+
+    resized = im.resize((baseWidth, hsize), Image.LANCZOS)
+    resized.save(target + '.tmp', "PNG")
+    os.replace(target + '.tmp', target)
+    return target
+
+
+'''
+DESC:   Makes sure every portrait has an up to date thumbnail and packs them into
+        an atlas. Only portraits whose contents changed are resized, and the
+        atlas is only repacked if any thumbnail changed
+
+INPUT:  photoPath:str = '../Data/Portraits_Cropped/'
+            - Where the source portraits are found
+        baseWidth:int = 128
+            - The width of every thumbnail
+        cacheDir:str = CACHE_DIR
+            - Where the thumbnails are cached
+        atlasFile:str = ATLAS_FILE
+            - Where the atlas should be saved
+        numProcesses:int = None
+            - The number of worker processes. Defaults to the number of cores
+        verbose:bool = False
+            - Whether the function will output a status of what it's doing
+
+OUTPUT: The filepath of the atlas
+'''
+def buildAtlas(photoPath:str = '../Data/Portraits_Cropped/', baseWidth:int = 128,
+    cacheDir:str = CACHE_DIR, atlasFile:str = ATLAS_FILE, numProcesses:int = None,
+    verbose:bool = False):
+    if not os.path.isdir(cacheDir): os.makedirs(cacheDir)
+
+    files = sorted(glob.glob(photoPath + '*.jpg') + glob.glob(photoPath + '*.jpeg'))
+    hashes = hashPortraits(files, cacheDir)
+    thumbs = {f: '{0}/{1}_{2}.png'.format(cacheDir, hashes[f], baseWidth) for f in files}
+
+    # Resize the portraits that aren't cached yet
+    tasks = [(f, thumbs[f], baseWidth) for f in files if not os.path.exists(thumbs[f])]
+    if tasks:
+        if verbose: print('Resizing {0} of {1} portraits'.format(len(tasks), len(files)))
+        if numProcesses is None: numProcesses = mp.cpu_count()
+        with mp.Pool(max(1, min(numProcesses, len(tasks)))) as pool:
+            pool.map(resizePortrait, tasks)
+
+    # Later files win, the same as when the portraits are loaded one by one
+    entries = {}
+    for f in files:
+        entries[portraitName(f)] = thumbs[f]
+    key = {name: os.path.basename(thumb) for name, thumb in entries.items()}
+
+    if os.path.exists(atlasFile):
+        with Image.open(atlasFile) as atlas:
+            if json.loads(atlas.text.get('atlas', '{}')).get('key') == key:
+                return atlasFile
+
+    if verbose: print('Packing {0} thumbnails into {1}'.format(len(entries), atlasFile))
+    packAtlas(entries, key, atlasFile)
+    return atlasFile
+
+
+'''
+DESC:   Packs thumbnails into a single image laid out as a grid
+
+INPUT:  entries:dict
+            - A dictionary where keys are astronaut names and values are
+            thumbnail filepaths
+        key:dict
+            - What the atlas was built from, stored so unchanged atlases can be
+            detected
+        atlasFile:str
+            - Where the atlas should be saved
+
+OUTPUT: None
+'''
+def packAtlas(entries:dict, key:dict, atlasFile:str):
+    images = {name: Image.open(thumb).convert("RGB") for name, thumb in entries.items()}
+    cellWidth = max([im.size[0] for im in images.values()] + [1])
+    cellHeight = max([im.size[1] for im in images.values()] + [1])
+    columns = max(1, math.ceil(math.sqrt(len(images))))
+    rows = max(1, math.ceil(len(images) / columns))
+
+    atlas = Image.new("RGB", (columns * cellWidth, rows * cellHeight), (255, 255, 255))
+    boxes = {}
+    for i, (name, im) in enumerate(sorted(images.items())):
+        x = (i % columns) * cellWidth
+        y = (i // columns) * cellHeight
+        atlas.paste(im, (x, y))
+        boxes[name] = [x, y, x + im.size[0], y + im.size[1]]
+
+    info = PngImagePlugin.PngInfo()
+    info.add_text('atlas', json.dumps({"key": key, "boxes": boxes}))
+    atlas.save(atlasFile + '.tmp', "PNG", pnginfo = info)
+    os.replace(atlasFile + '.tmp', atlasFile)
+
+
+'''
+DESC:   Loads every thumbnail from an atlas
+
+INPUT:  atlasFile:str = ATLAS_FILE
+            - The atlas built by `buildAtlas`
+
+OUTPUT: A dictionary where keys are astronaut names and values are their
+        thumbnails as PIL images
+'''
+def loadAtlas(atlasFile:str = ATLAS_FILE):
+    with Image.open(atlasFile) as atlas:
+        atlas.load()
+        boxes = json.loads(atlas.text['atlas'])["boxes"]
+        return {name: atlas.crop(tuple(box)) for name, box in boxes.items()}
@@ -0,0 +1,278 @@
+'''
+@desc:      Renders the astronaut relations graph as a deep zoom tile pyramid.
+            Every zoom level is cut into 256 pixel tiles that are drawn one by
+            one in worker processes, so the full resolution image never exists
+            in memory. Each tile is hashed from the nodes and edges that reach
+            it, and only tiles whose hash changed are drawn again.
+'''
+
+import os
+import json
+import math
+import hashlib
+import numpy as np
+import multiprocessing as mp
+from PIL import Image
+import Graph_Renderer
+
+TILE_SIZE = 256
+TILE_FORMAT = 'png'
+
+# Set in every worker by `initWorker`
+_scene = None
+_xy = None
+_img = None
+_thumbs = {}
+
+
+'''
+DESC:   Finds the size of every level of the pyramid. Level 0 is a single pixel
+        and every level is twice the size of the one before it, up to the full
+        size of the image
+
+INPUT:  size:int
+            - The width and height of the full image in pixels
+
+OUTPUT: A list of level sizes, from smallest to largest
+'''
+def levelSizes(size:int):
+    maxLevel = int(math.ceil(math.log2(max(size, 1))))
+    return [int(math.ceil(size / 2**(maxLevel - level))) for level in range(maxLevel + 1)]
+
+
+'''
+DESC:   Works out which tiles every node and edge can be seen in at one level
+
+INPUT:  scene:dict
+            - A scene built by `Graph_Generation_Driver.buildScene`
+        xy:np.ndarray
+            - The pixel coordinates of every node at `Graph_Renderer.BASE_SIZE`
+        zoom:float
+            - How much the base image is scaled at this level
+        tiles:int
+            - The number of tiles along each side of the level
+
+OUTPUT: A dictionary where keys are (column, row) tuples and values are a tuple
+        of the node indices and edge indices drawn on that tile
+'''
+def assignTiles(scene:dict, xy:np.ndarray, zoom:float, tiles:int):
+    contents = {}
+    if len(xy) == 0: return contents
+    points = xy * zoom
+
+    # The same reach `Graph_Renderer.drawScene` uses to cull nodes
+    reach = max(Graph_Renderer.NODE_RADIUS * zoom, Graph_Renderer.THUMB_SIZE * zoom) + \
+        Graph_Renderer.FONT_SIZE * zoom * 10
+    low = np.clip(np.floor((points - reach) / TILE_SIZE), 0, tiles - 1).astype(np.int64)
+    high = np.clip(np.floor((points + reach) / TILE_SIZE), 0, tiles - 1).astype(np.int64)
+    for i in range(len(points)):
+        for col in range(low[i, 0], high[i, 0] + 1):
+            for row in range(low[i, 1], high[i, 1] + 1):
+                contents.setdefault((col, row), ([], []))[0].append(i)
+
+    # Edges are assigned to every tile their bounding box touches
+    if scene["edges"]:
+        edges = np.asarray(scene["edges"], dtype = np.int64)
+        pad = max(1, zoom)
+        start = points[edges[:, 0]]
+        end = points[edges[:, 1]]
+        low = np.clip(np.floor((np.minimum(start, end) - pad) / TILE_SIZE), 0, tiles - 1).astype(np.int64)
+        high = np.clip(np.floor((np.maximum(start, end) + pad) / TILE_SIZE), 0, tiles - 1).astype(np.int64)
+        for e in range(len(edges)):
+            for col in range(low[e, 0], high[e, 0] + 1):
+                for row in range(low[e, 1], high[e, 1] + 1):
+                    contents.setdefault((col, row), ([], []))[1].append(e)
+
+    return contents
+
+
+'''
+DESC:   Hashes everything that is drawn on a tile
+
+INPUT:  levelSize:int
+            - The size of the tile's level in pixels
+        nodes:list, edges:list
+            - The node and edge indices drawn on the tile
+        scene:dict
+            - The scene being rendered
+        xy:np.ndarray
+            - The pixel coordinates of every node at `Graph_Renderer.BASE_SIZE`
+        portraits:dict
+            - A dictionary where keys are astronaut names and values are hashes
+            of their portraits
+
+OUTPUT: A hex digest identifying the contents of the tile
+'''
+def tileHash(levelSize:int, nodes:list, edges:list, scene:dict, xy:np.ndarray,
+    portraits:dict):
+    names = scene["nodes"]
+    data = [TILE_SIZE, levelSize,
+        [[names[i], scene["colors"][i], portraits.get(names[i]),
+            [round(float(v), 2) for v in xy[i]]] for i in nodes],
+        [[[round(float(v), 2) for v in xy[i]], [round(float(v), 2) for v in xy[j]]]
+            for i, j in (scene["edges"][e] for e in edges)]]
+    return hashlib.sha1(json.dumps(data).encode()).hexdigest()
+
+
+'''
+DESC:   Stores the scene and portraits in a worker process
+
+INPUT:  scene:dict
+            - The scene being rendered
+        xy:np.ndarray
+            - The pixel coordinates of every node at `Graph_Renderer.BASE_SIZE`
+        img:dict
+            - A dictionary where keys are astronaut names and values are their
+            portraits
+
+OUTPUT: None
+'''
+def initWorker(scene:dict, xy:np.ndarray, img:dict):
+    global _scene, _xy, _img, _thumbs
+    _scene = scene
+    _xy = xy
+    _img = img
+    _thumbs = {}
+
+
+'''
+DESC:   Draws a single tile and saves it
+
+INPUT:  task:tuple
+            - A (filepath, level size, column, row, node indices, edge indices)
+            tuple
+
+OUTPUT: The filepath of the tile
+'''
+def renderTile(task:tuple):
+    path, levelSize, col, row, nodes, edges = task
+    zoom = levelSize / Graph_Renderer.BASE_SIZE
+
+    # Thumbnails are resized once per level in each worker
+    thumbSize = max(1, int(round(Graph_Renderer.THUMB_SIZE * zoom)))
+    if thumbSize not in _thumbs:
+        _thumbs[thumbSize] = Graph_Renderer.buildThumbnails(_img, thumbSize)
+
+    # Only the nodes and edges that reach this tile are drawn. Endpoints of
+    # edges that cross the tile are included so the edges can be drawn, and
+    # `drawScene` skips the endpoints themselves since they can't reach it
+    used = sorted(set(nodes) | {i for e in edges for i in _scene["edges"][e]})
+    local = {n: i for i, n in enumerate(used)}
+    scene = {"nodes": [_scene["nodes"][i] for i in used],
+        "colors": [_scene["colors"][i] for i in used],
+        "edges": [(local[i], local[j]) for i, j in (_scene["edges"][e] for e in edges)]}
+
+    width = min(TILE_SIZE, levelSize - col*TILE_SIZE)
+    height = min(TILE_SIZE, levelSize - row*TILE_SIZE)
+    canvas = Image.new("RGB", (width, height), (255, 255, 255))
+    Graph_Renderer.drawScene(canvas, scene, _xy[used], _thumbs[thumbSize], zoom,
+        (col*TILE_SIZE, row*TILE_SIZE))
+
+    canvas.save(path + '.tmp', TILE_FORMAT.upper())
+    os.replace(path + '.tmp', path)
+    return path
+
+
+'''
+DESC:   Writes the deep zoom descriptor that viewers such as OpenSeadragon load
+
+INPUT:  dziFile:str
+            - Where the descriptor should be saved
+        size:int
+            - The width and height of the full image in pixels
+
+OUTPUT: None
+'''
+def writeDescriptor(dziFile:str, size:int):
+    with open(dziFile + '.tmp', 'w') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" '
+            'Format="{0}" Overlap="0" TileSize="{1}">\n'
+            '    <Size Width="{2}" Height="{2}"/>\n'
+            '</Image>\n'.format(TILE_FORMAT, TILE_SIZE, size))
+    os.replace(dziFile + '.tmp', dziFile)
+
+
+'''
+DESC:   Renders a scene as a deep zoom tile pyramid. The tiles are saved as
+        '<ofp>_files/<level>/<column>_<row>.png' next to a '<ofp>.dzi'
+        descriptor, and a manifest of tile hashes is kept so tiles whose
+        contents didn't change are not drawn again
+
+INPUT:  scene:dict
+            - A scene built by `Graph_Generation_Driver.buildScene`
+        img:dict
+            - A dictionary where keys are astronaut names and values are their
+            portraits
+        ofp:str = "../Data/Astronaut_Relations"
+            - The name the pyramid will be saved under, without the extension
+        size:int = Graph_Renderer.BASE_SIZE
+            - The width and height of the most detailed level in pixels
+        numProcesses:int = None
+            - The number of worker processes. Defaults to the number of cores
+        verbose:bool = False
+            - Whether the function will output a status of what it's doing
+
+OUTPUT: The filepath of the descriptor
+'''
+def buildPyramid(scene:dict, img:dict, ofp:str = "../Data/Astronaut_Relations",
+    size:int = Graph_Renderer.BASE_SIZE, numProcesses:int = None, verbose:bool = False):
+    tileDir = ofp + '_files'
+    manifestFile = tileDir + '/manifest.json'
+    if not os.path.isdir(tileDir): os.makedirs(tileDir)
+
+    manifest = {}
+    if os.path.exists(manifestFile):
+        with open(manifestFile) as f:
+            manifest = json.load(f)
+
+    # Portraits are hashed at their largest size, so any change to one shows up
+    # in every tile it is drawn on
+    img = Graph_Renderer.buildThumbnails(img, max(Graph_Renderer.THUMB_SIZE,
+        int(round(Graph_Renderer.THUMB_SIZE * size / Graph_Renderer.BASE_SIZE))))
+    portraits = {name: hashlib.sha1(im.tobytes()).hexdigest() for name, im in img.items()}
+    xy = Graph_Renderer.placeScene(scene, Graph_Renderer.BASE_SIZE)
+
+    hashes = {}
+    tasks = []
+    for level, levelSize in enumerate(levelSizes(size)):
+        levelDir = '{0}/{1}'.format(tileDir, level)
+        if not os.path.isdir(levelDir): os.makedirs(levelDir)
+
+        tiles = int(math.ceil(levelSize / TILE_SIZE))
+        contents = assignTiles(scene, xy, levelSize / Graph_Renderer.BASE_SIZE, tiles)
+        for col in range(tiles):
+            for row in range(tiles):
+                nodes, edges = contents.get((col, row), ([], []))
+                name = '{0}/{1}_{2}.{3}'.format(level, col, row, TILE_FORMAT)
+                hashes[name] = tileHash(levelSize, nodes, edges, scene, xy, portraits)
+
+                path = '{0}/{1}'.format(tileDir, name)
+                if manifest.get(name) != hashes[name] or not os.path.exists(path):
+                    tasks.append((path, levelSize, col, row, nodes, edges))
+
+    if verbose: print('Rendering {0} of {1} tiles'.format(len(tasks), len(hashes)))
+
+    if tasks:
+        if numProcesses is None: numProcesses = mp.cpu_count()
+        numProcesses = max(1, min(numProcesses, len(tasks)))
+        if numProcesses == 1:
+            initWorker(scene, xy, img)
+            for task in tasks: renderTile(task)
+        else:
+            # Deep levels have the most tiles, so they are handed out first
+            tasks.sort(key = lambda t: -t[1])
+            with mp.Pool(numProcesses, initWorker, (scene, xy, img)) as pool:
+                for _ in pool.imap_unordered(renderTile, tasks, chunksize = 8): pass
+
+    # Tiles left over from a larger pyramid are removed
+    for name in set(manifest) - set(hashes):
+        path = '{0}/{1}'.format(tileDir, name)
+        if os.path.exists(path): os.remove(path)
+
+    with open(manifestFile + '.tmp', 'w') as f:
+        json.dump(hashes, f)
+    os.replace(manifestFile + '.tmp', manifestFile)
+
+    writeDescriptor(ofp + '.dzi', size)
+    return ofp + '.dzi'
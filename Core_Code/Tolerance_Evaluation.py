@@ -0,0 +1,246 @@
+'''
+@desc:      Measures how well the scanner identifies astronauts at different
+            match tolerances, using the image cache instead of scanning again.
+            Every cached face is scored against the gallery once, and the
+            precision, recall, and F1 score of a whole grid of tolerances are
+            then read off the same distances in one pass.
+
+            The ground truth is a json keyed by photo name. A photo's value is
+            either a list of the astronauts in it, which is scored per photo,
+            or a dictionary of astronauts and their face indices in the same
+            format as `Scan_Result`, which is scored per face. A hand-checked
+            `Scan_Result` json can be used as is.
+
+            By default every face goes to the nearest astronaut in the gallery,
+            and counts as identified if that astronaut is within the tolerance.
+            `Face_Matcher.deleteRepeats` doesn't always give a face to its
+            nearest astronaut, so an exact mode resolves the matches of every
+            photo at every tolerance the way a scan would, which is slower but
+            scores exactly what `Scan_Result` would hold.
+'''
+
+import json
+import time
+import numpy as np
+import Main_Model
+import Face_Matcher
+
+TRUTH_FILE = '../Data/Ground_Truth.json'
+CACHE_FILE = '../Data/Temp/Input_Cache.dat'
+
+# The number of faces scored against the gallery at a time
+CHUNK_SIZE = 4096
+
+
+'''
+DESC:   Finds the nearest astronaut to every face. Chunks of faces are scored
+        with `Face_Matcher.packedDistances`, so a chunk is one matrix product
+        in the precision the faces are cached in
+
+INPUT:  gallery:dict
+            - A gallery from `Face_Matcher.loadGallery`
+        faces:np.ndarray
+            - Facial encodings stacked by `Face_Matcher.stackEncodings`
+
+OUTPUT: A tuple of the gallery row of every face's nearest astronaut and the
+        distance to it
+'''
+def nearestAstronauts(gallery:dict, faces:np.ndarray):
+    nearest = np.zeros(len(faces), dtype = np.int64)
+    distances = np.full(len(faces), np.inf)
+    if len(faces) == 0 or len(gallery["names"]) == 0: return nearest, distances
+
+    for start in range(0, len(faces), CHUNK_SIZE):
+        chunk = faces[start:start + CHUNK_SIZE]
+        scored = Face_Matcher.packedDistances(chunk, gallery["encodings"])
+        rows = np.argmin(scored, axis = 1)
+        nearest[start:start + len(chunk)] = rows
+        distances[start:start + len(chunk)] = scored[np.arange(len(chunk)), rows]
+    return nearest, distances
+
+
+'''
+DESC:   Counts the predictions made, and the correct ones, at every tolerance
+
+INPUT:  predicted:np.ndarray
+            - The distance every prediction is made at
+        correct:np.ndarray
+            - Whether each prediction is right
+        tolerances:np.ndarray
+            - The tolerances to count at
+
+OUTPUT: A tuple of arrays with the number of predictions and the number of
+        correct predictions made at each tolerance
+'''
+def countPredictions(predicted:np.ndarray, correct:np.ndarray, tolerances:np.ndarray):
+    made = predicted[:, None] <= tolerances[None, :]
+    return made.sum(axis = 0), (made & correct[:, None]).sum(axis = 0)
+
+
+'''
+DESC:   Counts the predictions made, and the correct ones, at every tolerance
+        by resolving each photo's matches the way a scan does
+
+INPUT:  gallery:dict
+            - A gallery from `Face_Matcher.loadGallery`
+        truth:dict
+            - The ground truth of every photo
+        photos:list
+            - The photos being evaluated
+        faces:np.ndarray
+            - Every photo's encodings, stacked by `Face_Matcher.stackEncodings`
+        owners:np.ndarray
+            - The index in `photos` of every face
+        level:str
+            - "photo" or "face"
+        tolerances:np.ndarray
+            - The tolerances to count at
+
+OUTPUT: A tuple of arrays with the number of predictions and the number of
+        correct predictions made at each tolerance, and the number of positives
+        in the ground truth
+'''
+def resolvedCounts(gallery:dict, truth:dict, photos:list, faces:np.ndarray, owners:np.ndarray,
+    level:str, tolerances:np.ndarray):
+    made = np.zeros(len(tolerances), dtype = np.int64)
+    right = np.zeros(len(tolerances), dtype = np.int64)
+    positives = 0
+
+    for i, photo in enumerate(photos):
+        distances = Face_Matcher.faceDistances(gallery, faces[owners == i])
+        if level == "face":
+            labels = {index: name for name, indices in truth[photo].items() for index in indices}
+            positives += len(labels)
+        else:
+            positives += len(set(truth[photo]))
+
+        for j, tolerance in enumerate(tolerances):
+            found = Face_Matcher.resolveMatches(gallery, distances, tolerance)
+            if level == "face":
+                assigned = [(name, index) for name, indices in found.items() for index in indices]
+                made[j] += len(assigned)
+                right[j] += sum(labels.get(index) == name for name, index in assigned)
+            else:
+                made[j] += len(found)
+                right[j] += sum(name in truth[photo] for name in found)
+    return made, right, positives
+
+
+'''
+DESC:   Evaluates a grid of match tolerances against a ground truth
+
+INPUT:  truthFile:str = TRUTH_FILE
+            - The labeled ground truth, see the top of this file
+        pickleDir:str = "../Data/Temp/Portrait_Bin"
+            - Where the astronauts' facial data is kept
+        cacheFile:str = CACHE_FILE
+            - The image cache holding every photo's encodings
+        tolerances:list = None
+            - The tolerances to evaluate. Defaults to 0.30 through 0.80 in steps
+            of 0.01
+        exact:bool = False
+            - Whether matches are resolved exactly the way a scan resolves them,
+            instead of giving every face to its nearest astronaut
+        verbose:bool = True
+            - Whether a table of the results is printed
+
+OUTPUT: A dictionary with a row of "tolerance", "precision", "recall", "f1",
+        "tp", "fp", and "fn" for every tolerance as "results", the row with the
+        highest F1 as "best", the "level" that was scored ("photo" or "face"),
+        the number of "photos" and "faces" evaluated, the number of labeled
+        photos "missing" from the cache, and the "seconds" taken to score the
+        faces and to "sweep" the tolerances
+'''
+def evaluateTolerances(truthFile:str = TRUTH_FILE, pickleDir:str = "../Data/Temp/Portrait_Bin",
+    cacheFile:str = CACHE_FILE, tolerances:list = None, exact:bool = False, verbose:bool = True):
+    if pickleDir[-1] != "/": pickleDir += "/"
+    if tolerances is None: tolerances = np.round(np.arange(0.30, 0.805, 0.01), 2)
+    tolerances = np.asarray(tolerances, dtype = np.float64)
+
+    with open(truthFile) as f:
+        truth = json.load(f)
+    cache = Main_Model.loadCache(cacheFile)
+    gallery = Face_Matcher.loadGallery(pickleDir)
+
+    # A photo's truth may be wrapped the way `Scan_Result` stores it
+    truth = {photo: labels[0] if isinstance(labels, list) and labels and isinstance(labels[0], dict)
+        else labels for photo, labels in truth.items()}
+    photos = sorted(photo for photo in truth if photo in cache)
+    level = "face" if any(isinstance(truth[photo], dict) for photo in photos) else "photo"
+
+    # Stack every face, remembering which photo it came from
+    stacked = []
+    owners = []
+    for i, photo in enumerate(photos):
+        encodings = Main_Model.readPackedEncodings(cache[photo])
+        stacked.append(encodings)
+        owners.extend([i] * len(encodings))
+    faces = Face_Matcher.stackEncodings(stacked)
+    owners = np.asarray(owners, dtype = np.int64)
+
+    start = time.time()
+    nearest, distances = nearestAstronauts(gallery, faces)
+    scored = time.time() - start
+
+    start = time.time()
+    names = np.asarray(gallery["names"] + [None], dtype = object)
+    if exact:
+        made, right, positives = resolvedCounts(gallery, truth, photos, faces, owners, level, tolerances)
+    elif level == "face":
+        # Every labeled face is a positive, and every face within the
+        # tolerance is a prediction
+        labels = np.full(len(faces), None, dtype = object)
+        offsets = np.searchsorted(owners, np.arange(len(photos)))
+        positives = 0
+        for i, photo in enumerate(photos):
+            for name, indices in truth[photo].items():
+                for index in indices:
+                    positives += 1
+                    if offsets[i] + index < len(faces) and owners[offsets[i] + index] == i:
+                        labels[offsets[i] + index] = name
+        made, right = countPredictions(distances, names[nearest] == labels, tolerances)
+    else:
+        # An astronaut is predicted in a photo at the distance of their
+        # closest face there
+        pairs = {}
+        for i, row, distance in zip(owners.tolist(), nearest.tolist(), distances.tolist()):
+            key = (i, row)
+            if distance < pairs.get(key, np.inf): pairs[key] = distance
+        keys = list(pairs)
+        correct = np.asarray([names[row] in truth[photos[i]] for i, row in keys], dtype = bool)
+        made, right = countPredictions(np.asarray([pairs[k] for k in keys], dtype = np.float64),
+            correct, tolerances)
+        positives = sum(len(set(truth[photo])) for photo in photos)
+    swept = time.time() - start
+
+    results = []
+    for tolerance, m, r in zip(tolerances.tolist(), made.tolist(), right.tolist()):
+        precision = r / m if m else 1.0
+        recall = r / positives if positives else 1.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        results.append({"tolerance": tolerance, "precision": round(precision, 4),
+            "recall": round(recall, 4), "f1": round(f1, 4), "tp": r, "fp": m - r, "fn": positives - r})
+    best = max(results, key = lambda row: row["f1"]) if results else None
+
+    summary = {"results": results, "best": best, "level": level, "photos": len(photos),
+        "faces": len(faces), "missing": len(truth) - len(photos),
+        "seconds": round(scored, 4), "sweep": round(swept, 4)}
+
+    if verbose:
+        print("Scored {0} faces in {1} photos per {2} in {3:.3f}s ({4:.0f} faces/s), swept {5} "
+            "tolerances{6} in {7:.3f}s".format(len(faces), len(photos), level, scored,
+            len(faces) / scored if scored else 0, len(tolerances), " exactly" if exact else "", swept))
+        if summary["missing"]:
+            print("\t{0} labeled photos aren't cached and were skipped".format(summary["missing"]))
+        print("tolerance  precision  recall  f1      tp     fp     fn")
+        for row in results:
+            print("{tolerance:<9.2f}  {precision:<9.4f}  {recall:<6.4f}  {f1:<6.4f}  {tp:<5d}  "
+                "{fp:<5d}  {fn:<5d}".format(**row))
+        if best is not None:
+            print("Best F1 {0:.4f} at a tolerance of {1:.2f}".format(best["f1"], best["tolerance"]))
+    return summary
+
+
+
+if __name__ == "__main__":
+    evaluateTolerances()
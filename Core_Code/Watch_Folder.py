@@ -0,0 +1,272 @@
+'''
+@desc:      Watches a folder for new photos and scans them as they arrive. The
+            folder is watched with inotify (through ctypes, so nothing extra
+            has to be installed), falling back to polling where inotify isn't
+            available. A photo is only scanned once its size and modification
+            time have stopped changing, photos that arrive together are scanned
+            as one batch by a model that stays loaded, and their results are
+            added to the folder's `Scan_Result` json. Raw frequencies and pairs
+            are then brought up to date incrementally. Each batch only appends
+            its detections to the image cache's journal; the journal is merged
+            into the cache every few batches and when watching stops. The
+            process sleeps in select() while nothing is arriving.
+'''
+
+import os
+import json
+import time
+import ctypes
+import ctypes.util
+import select
+import struct
+import Main_Model
+import Market_Basket_Driver as mbd
+from Atomic_Write import writeJson
+
+# inotify event masks, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+
+# struct inotify_event {int wd; uint32_t mask, cookie, len; char name[];}
+EVENT = struct.Struct('iIII')
+
+
+'''
+DESC:   Starts watching a directory with inotify
+
+INPUT:  directory:str
+            - The directory to watch
+
+OUTPUT: A non-blocking inotify file descriptor, or None if inotify isn't
+        available
+'''
+def openInotify(directory:str):
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno = True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0: return None
+
+    mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY
+    if libc.inotify_add_watch(fd, os.fsencode(directory), mask) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+
+'''
+DESC:   Reads the pending events of an inotify file descriptor
+
+INPUT:  fd:int
+            - A file descriptor from `openInotify`
+
+OUTPUT: A tuple of the set of file names that changed, and whether the kernel
+        dropped events because its queue overflowed
+'''
+def readEvents(fd:int):
+    names = set()
+    overflow = False
+    while True:
+        try:
+            data = os.read(fd, 64 * 1024)
+        except BlockingIOError:
+            return names, overflow
+
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = EVENT.unpack_from(data, offset)
+            name = data[offset + EVENT.size:offset + EVENT.size + length].rstrip(b'\0')
+            offset += EVENT.size + length
+            if mask & IN_Q_OVERFLOW: overflow = True
+            elif name: names.add(os.fsdecode(name))
+
+
+'''
+DESC:   Lists the photos in a directory along with their size and modification
+        time
+
+INPUT:  directory:str
+            - The directory to list
+
+OUTPUT: A dictionary where keys are file names and values are (modification
+        time, size) tuples
+'''
+def listImages(directory:str):
+    images = {}
+    for entry in os.scandir(directory):
+        if entry.name.split('.')[-1] != "jpg" or not entry.is_file(): continue
+        stat = entry.stat()
+        images[entry.name] = (stat.st_mtime_ns, stat.st_size)
+    return images
+
+
+'''
+DESC:   Adds scan results to a `Scan_Result` json, keeping the results already
+        in it
+
+INPUT:  results:dict
+            - The new results, keyed by photo name
+        resultFile:str
+            - The json to add them to
+
+OUTPUT: The number of photos in the json
+'''
+def appendResults(results:dict, resultFile:str):
+    photos = {}
+    if os.path.exists(resultFile):
+        with open(resultFile) as f:
+            photos = json.load(f)
+    photos.update(results)
+    writeJson(resultFile, photos)
+    return len(photos)
+
+
+'''
+DESC:   Watches a folder and scans every photo that lands in it
+
+INPUT:  trainDir:str = "../Data/Portraits"
+            - The directory of astronaut portraits the model trains on
+        watchDir:str = "../Data/Test_Input"
+            - The directory to watch
+        pickleDir:str = "../Data/Temp/Portrait_Bin"
+            - Where the astronauts' facial data is kept
+        numThreads:int = 4
+            - The number of processes a batch is scanned with
+        dumpDir:str = "../Data/Scan_Result"
+            - Where the results json is kept
+        stateFile:str = "../Data/Temp/Basket_State.dat"
+            - Where the incremental frequency state is persisted
+        rawFreqFileName:str = "../Data/rawFrequencies"
+            - Where the updated raw frequencies are saved
+        pairFileName:str = "../Data/pairs"
+            - Where the updated pairs are saved
+        settle:float = 1.0
+            - How many seconds a photo's size and modification time have to
+            stay the same before it is considered fully written
+        pollInterval:float = 2.0
+            - How often the folder is listed when polling
+        maxBatch:int = 32
+            - The most photos scanned in one batch
+        mergeEvery:int = 20
+            - The number of batches between merges of the image cache's
+            journal into the cache
+        polling:bool = False
+            - Whether to poll even if inotify is available
+        scanExisting:bool = True
+            - Whether photos that were already in the folder but aren't in its
+            results yet are scanned on start up
+        maxBatches:int = None
+            - Stop after this many batches. Defaults to watching forever
+        verbose:bool = True
+            - Whether each batch is reported
+
+OUTPUT: The number of photos scanned
+'''
+def watchFolder(trainDir:str = "../Data/Portraits", watchDir:str = "../Data/Test_Input",
+    pickleDir:str = "../Data/Temp/Portrait_Bin", numThreads:int = 4,
+    dumpDir:str = "../Data/Scan_Result", stateFile:str = "../Data/Temp/Basket_State.dat",
+    rawFreqFileName:str = "../Data/rawFrequencies", pairFileName:str = "../Data/pairs",
+    settle:float = 1.0, pollInterval:float = 2.0, maxBatch:int = 32, mergeEvery:int = 20,
+    polling:bool = False, scanExisting:bool = True, maxBatches:int = None, verbose:bool = True):
+    if trainDir[-1] != "/": trainDir += "/"
+    if pickleDir[-1] != "/": pickleDir += "/"
+    watchDir = watchDir.rstrip('/')
+
+    model = Main_Model.Master_Model(trainDir, pickleDir, numThreads)
+    Main_Model.prepDir(dumpDir)
+    resultFile = '{0}/{1}_result.json'.format(dumpDir, Main_Model.resultKey(watchDir))
+
+    fd = None if polling else openInotify(watchDir)
+    if verbose:
+        print("Watching {0} with {1}".format(watchDir, "inotify" if fd is not None else "polling"))
+
+    # Photos waiting to settle, mapped to [signature, time of last change,
+    # time first seen]
+    pending = {}
+    known = listImages(watchDir)
+    if scanExisting:
+        done = {}
+        if os.path.exists(resultFile):
+            with open(resultFile) as f:
+                done = json.load(f)
+        now = time.time()
+        for name, signature in known.items():
+            if name not in done: pending[name] = [None, now, now]
+
+    scanned = 0
+    batches = 0
+    try:
+        while maxBatches is None or batches < maxBatches:
+            # Sleep until something arrives, or until pending photos are due
+            # for another look
+            timeout = settle if pending else (None if fd is not None else pollInterval)
+            now = time.time()
+            if fd is not None:
+                ready, _, _ = select.select([fd], [], [], timeout)
+                if ready:
+                    names, overflow = readEvents(fd)
+                    # Missed events are made up for by listing the folder
+                    if overflow: names = set(listImages(watchDir)) - set(known)
+                    for name in names:
+                        if name.split('.')[-1] != "jpg": continue
+                        pending.setdefault(name, [None, now, now])
+            else:
+                time.sleep(timeout)
+                current = listImages(watchDir)
+                for name, signature in current.items():
+                    if known.get(name) != signature: pending.setdefault(name, [None, now, now])
+                known = current
+
+            # Photos are written once their signature stops changing
+            now = time.time()
+            settled = []
+            for name, entry in list(pending.items()):
+                try:
+                    stat = os.stat('{0}/{1}'.format(watchDir, name))
+                except FileNotFoundError:
+                    del pending[name]
+                    continue
+                signature = (stat.st_mtime_ns, stat.st_size)
+                if signature != entry[0]:
+                    entry[0], entry[1] = signature, now
+                elif now - entry[1] >= settle:
+                    settled.append(name)
+
+            for start in range(0, len(settled), maxBatch):
+                batch = sorted(settled[start:start + maxBatch])
+                for name in batch:
+                    # A replaced photo has to be detected again
+                    model.img_cache.pop(name, None)
+                    known[name] = pending[name][0]
+
+                model.clearResults()
+                results = model.findFacesFiles(['{0}/{1}'.format(watchDir, n) for n in batch],
+                    merge_cache = False)
+                total = appendResults(results, resultFile)
+                mbd.updateModel(dumpDir, stateFile, True, rawFreqFileName, True, pairFileName)
+
+                if verbose:
+                    latency = time.time() - min(pending[n][2] for n in batch)
+                    print("Scanned {0} new photos into {1} ({2} photos), {3:.1f}s after the "
+                        "first arrived".format(len(batch), resultFile, total, latency))
+                for name in batch: del pending[name]
+                scanned += len(batch)
+                batches += 1
+                if batches % mergeEvery == 0:
+                    model.img_cache.update(Main_Model.mergeCache(model.main_cache, {}))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if fd is not None: os.close(fd)
+        if batches % mergeEvery: Main_Model.mergeCache(model.main_cache, {})
+
+    return scanned
+
+
+
+if __name__ == "__main__":
+    watchFolder()
@@ -0,0 +1,9 @@
+'''
+@desc:      Makes the modules in Core_Code importable from the tests, the same
+            way they import each other when run from Core_Code.
+'''
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
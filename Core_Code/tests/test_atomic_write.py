@@ -0,0 +1,21 @@
+'''
+@desc:      Tests for the atomic file writers in `Atomic_Write`.
+'''
+
+import os
+import json
+import pytest
+import Atomic_Write
+
+
+def test_json_replaces_the_file_and_leaves_no_temporary_file(tmp_path):
+    path = str(tmp_path / "result.json")
+    Atomic_Write.writeJson(path, {"a.jpg": [{}]})
+    Atomic_Write.writeJson(path, {"b.jpg": [{}]})
+    assert json.load(open(path)) == {"b.jpg": [{}]}
+
+    # A failed write keeps the old file
+    with pytest.raises(TypeError):
+        Atomic_Write.writeJson(path, {"c.jpg": object()})
+    assert json.load(open(path)) == {"b.jpg": [{}]}
+    assert os.listdir(tmp_path) == ["result.json"]
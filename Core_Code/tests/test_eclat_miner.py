@@ -0,0 +1,43 @@
+'''
+@desc:      Tests for mining frequent groups with `Eclat_Miner`.
+'''
+
+import random
+import pytest
+from apyori import apriori
+import Eclat_Miner
+
+
+@pytest.fixture
+def transactions():
+    rng = random.Random(4)
+    crews = [["ann", "bob", "cat"], ["dan", "eve"], ["ann", "dan", "fay", "gus"]]
+    astronauts = sorted({a for crew in crews for a in crew} | {"hal", "ivy"})
+    photos = []
+    for _ in range(300):
+        crew = rng.choice(crews)
+        photo = {a for a in crew if rng.random() < 0.8} | {a for a in astronauts if rng.random() < 0.05}
+        if photo: photos.append(sorted(photo))
+    return photos
+
+
+@pytest.mark.parametrize("numProcesses", [1, 2])
+def test_itemsets_match_apriori(transactions, numProcesses):
+    expected = {tuple(sorted(r.items)): r.support for r in apriori(transactions,
+        min_support = 0.05, min_confidence = 0.0, min_lift = 0.0, max_length = 4)}
+    itemsets = Eclat_Miner.mineItemsets(transactions, 0.05, 4, numProcesses)
+
+    assert sorted(itemsets) == sorted(expected)
+    assert any(len(itemset) == 3 for itemset in itemsets)
+    for itemset, count in itemsets.items():
+        assert count / len(transactions) == pytest.approx(expected[itemset])
+
+
+def test_rules_follow_from_the_counts(transactions):
+    itemsets = Eclat_Miner.mineItemsets(transactions, 0.05, 4, 1)
+    rules = Eclat_Miner.findRules(itemsets, len(transactions), 0.5, 1.0)
+    assert rules
+    for rule in rules:
+        group = tuple(sorted(rule["antecedent"] + rule["consequent"]))
+        assert rule["confidence"] == pytest.approx(itemsets[group] / itemsets[tuple(rule["antecedent"])])
+        assert rule["confidence"] >= 0.5 and rule["lift"] >= 1.0
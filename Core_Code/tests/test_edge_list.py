@@ -0,0 +1,70 @@
+'''
+@desc:      Tests for the typed pair artifacts in `Edge_List`.
+'''
+
+import os
+import json
+import numpy as np
+import pytest
+import Edge_List
+
+
+PAIRS = {("o'brien&usa", "ann&usa"): {"count": 3, "lift": 1.5},
+    ("ann&usa", "bob&rus"): {"count": 1, "support": 0.25, "weight": 0.75}}
+
+
+def saved(tmp_path, formats:tuple):
+    fileName = str(tmp_path / "pairs")
+    Edge_List.saveEdges(*Edge_List.fromDict(PAIRS), fileName, formats)
+    return fileName
+
+
+def checkEdges(names:list, edges:np.ndarray):
+    assert Edge_List.toDict(names, edges) == {pair: v["count"] for pair, v in PAIRS.items()}
+    lifts = Edge_List.toDict(names, edges, "lift")
+    assert lifts[("o'brien&usa", "ann&usa")] == 1.5
+    assert np.isnan(lifts[("ann&usa", "bob&rus")])
+    assert Edge_List.toDict(names, edges, "weight")[("ann&usa", "bob&rus")] == 0.75
+
+
+@pytest.mark.parametrize("formats", [("npy", "csv"), ("csv",)])
+def test_saved_edges_round_trip(tmp_path, formats):
+    names, edges = Edge_List.loadEdges(saved(tmp_path, formats))
+    assert isinstance(edges, np.memmap) == ("npy" in formats)
+    checkEdges(names, edges)
+
+
+def test_json_keyed_by_stringified_tuples_is_read(tmp_path):
+    with open(tmp_path / "pairs.json", 'w') as f:
+        json.dump({str(pair): v for pair, v in PAIRS.items()}, f)
+    checkEdges(*Edge_List.loadEdges(str(tmp_path / "pairs.json")))
+
+
+def test_json_written_after_the_last_save_wins(tmp_path):
+    fileName = saved(tmp_path, ("npy",))
+    with open(fileName + ".json", 'w') as f:
+        json.dump({"('ann&usa', 'cat&jpn')": 9}, f)
+    stat = os.stat(fileName + "_names.json")
+    os.utime(fileName + ".json", ns = (stat.st_atime_ns, stat.st_mtime_ns + 1000))
+
+    names, edges = Edge_List.loadEdges(fileName)
+    assert Edge_List.toDict(names, edges) == {("ann&usa", "cat&jpn"): 9}
+
+
+def test_edges_saved_before_the_weight_metric_load(tmp_path):
+    names, edges = Edge_List.fromDict(PAIRS)
+    old = np.dtype([(f, t) for f, t in Edge_List.EDGE_DTYPE.descr if f != "weight"])
+    fileName = str(tmp_path / "pairs")
+    with open(fileName + "_names.json", 'w') as f:
+        json.dump(names, f)
+    np.save(fileName + ".npy", edges[list(old.names)].astype(old))
+
+    names, edges = Edge_List.loadEdges(fileName)
+    assert edges.dtype == Edge_List.EDGE_DTYPE
+    assert Edge_List.toDict(names, edges) == {pair: v["count"] for pair, v in PAIRS.items()}
+    assert np.isnan(edges["weight"]).all()
+
+
+def test_missing_edge_list_is_an_error(tmp_path):
+    with pytest.raises(OSError):
+        Edge_List.loadEdges(str(tmp_path / "pairs"))
@@ -0,0 +1,70 @@
+'''
+@desc:      Tests for bringing scan results up to date with `Gallery_Rematch`.
+'''
+
+import json
+import pickle
+import numpy as np
+import pytest
+import Face_Matcher
+import Gallery_Rematch
+import Main_Model
+
+
+@pytest.mark.parametrize("precision", Face_Matcher.PRECISIONS)
+def test_duplicates_follow_their_representative(tmp_path, precision):
+    rng = np.random.default_rng(0)
+    astronaut = rng.normal(0, 0.1, 128)
+    (tmp_path / "Portrait_Bin").mkdir()
+    with open(tmp_path / "Portrait_Bin" / "ann.dat", 'wb') as f:
+        pickle.dump({"ann&usa": astronaut}, f)
+
+    cacheFile = str(tmp_path / "Input_Cache.dat")
+    entry = {"encodings": [astronaut + 0.001], "locations": [(0, 10, 10, 0)]}
+    Main_Model.mergeCache(cacheFile, {"rep.jpg": Main_Model.packCacheEntry(entry, precision)})
+    groupFile = tmp_path / "Duplicate_Groups.json"
+    groupFile.write_text(json.dumps({"dup.jpg": "rep.jpg"}))
+    (tmp_path / "Scan_Result").mkdir()
+    resultFile = tmp_path / "Scan_Result" / "album_result.json"
+    resultFile.write_text(json.dumps({"rep.jpg": [{}], "dup.jpg": [{}], "lost.jpg": [{}]}))
+
+    summary = Gallery_Rematch.rematchResults(str(tmp_path / "Portrait_Bin"),
+        str(tmp_path / "Scan_Result"), cacheFile, str(tmp_path / "Gallery_State.json"),
+        identities = ["ann&usa"], groupFile = str(groupFile))
+
+    results = json.loads(resultFile.read_text())
+    assert results["rep.jpg"] == [{"ann&usa": [0]}]
+    assert results["dup.jpg"] == results["rep.jpg"]
+    assert results["lost.jpg"] == [{}]
+    assert (summary["photos"], summary["duplicates"], summary["uncached"]) == (2, 1, 1)
+    assert summary["rewritten"] == 2
+
+
+def test_first_run_records_the_gallery_and_later_runs_rematch(tmp_path):
+    rng = np.random.default_rng(1)
+    astronaut = rng.normal(0, 0.1, 128)
+    (tmp_path / "Portrait_Bin").mkdir()
+    portrait = tmp_path / "Portrait_Bin" / "ann.dat"
+    with open(portrait, 'wb') as f:
+        pickle.dump({"ann&usa": astronaut + 0.5}, f)
+
+    cacheFile = str(tmp_path / "Input_Cache.dat")
+    entry = {"encodings": [astronaut], "locations": [(0, 10, 10, 0)]}
+    Main_Model.mergeCache(cacheFile, {"photo.jpg": entry})
+    (tmp_path / "Scan_Result").mkdir()
+    resultFile = tmp_path / "Scan_Result" / "album_result.json"
+    resultFile.write_text(json.dumps({"photo.jpg": [{}]}))
+    stateFile = tmp_path / "Gallery_State.json"
+    args = (str(tmp_path / "Portrait_Bin"), str(tmp_path / "Scan_Result"), cacheFile, str(stateFile))
+
+    summary = Gallery_Rematch.rematchResults(*args, groupFile = str(tmp_path / "none.json"))
+    assert (summary["changed"], summary["removed"], summary["rematched"]) == ([], [], 0)
+    assert json.loads(resultFile.read_text()) == {"photo.jpg": [{}]}
+    assert list(json.loads(stateFile.read_text())) == ["ann&usa"]
+
+    # Retraining ann now re-matches the photo against the new encoding
+    with open(portrait, 'wb') as f:
+        pickle.dump({"ann&usa": astronaut}, f)
+    summary = Gallery_Rematch.rematchResults(*args, groupFile = str(tmp_path / "none.json"))
+    assert summary["changed"] == ["ann&usa"]
+    assert json.loads(resultFile.read_text()) == {"photo.jpg": [{"ann&usa": [0]}]}
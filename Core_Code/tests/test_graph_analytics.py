@@ -0,0 +1,60 @@
+'''
+@desc:      Tests for the sparse graph analytics in `Graph_Analytics`.
+'''
+
+import networkx as nx
+import pytest
+import Edge_List
+import Graph_Analytics
+
+
+# Two crews of three, bridged by a single pair
+PAIRS = {("ann&usa", "bob&usa"): 5, ("ann&usa", "cat&usa"): 4, ("bob&usa", "cat&usa"): 3,
+    ("dan&rus", "eve&rus"): 5, ("dan&rus", "fay&rus"): 2, ("eve&rus", "fay&rus"): 4,
+    ("cat&usa", "dan&rus"): 1}
+
+
+def reference():
+    graph = nx.Graph()
+    for (a, b), count in PAIRS.items():
+        graph.add_edge(a, b, weight = count, length = 1.0 / count)
+    return graph
+
+
+def test_centralities_match_networkx():
+    names, edges = Edge_List.fromDict(PAIRS)
+    matrix = Graph_Analytics.buildMatrix(names, edges)
+    graph = reference()
+
+    between = nx.betweenness_centrality(graph, weight = "length")
+    assert Graph_Analytics.betweennessCentrality(matrix, numProcesses = 2) == \
+        pytest.approx([between[n] for n in names])
+
+    eigen = nx.eigenvector_centrality_numpy(graph, weight = "weight")
+    assert Graph_Analytics.eigenvectorCentrality(matrix) == \
+        pytest.approx([eigen[n] for n in names], abs = 1e-6)
+
+
+def test_crews_are_found_as_communities():
+    result = Graph_Analytics.analyze(*Edge_List.fromDict(PAIRS))
+    assert sorted(result["communities"]) == [["ann&usa", "bob&usa", "cat&usa"],
+        ["dan&rus", "eve&rus", "fay&rus"]]
+    assert result["modularity"] == pytest.approx(nx.community.modularity(reference(),
+        [set(c) for c in result["communities"]]))
+
+    rows = {row["name"]: row for row in result["astronauts"]}
+    assert rows["cat&usa"]["weightedDegree"] == 8
+    assert rows["cat&usa"]["crossCountry"] == pytest.approx(1 / 8)
+    assert rows["ann&usa"]["crossCountry"] == 0
+
+
+def test_analytics_are_reused_while_the_pairs_are_unchanged(tmp_path, monkeypatch):
+    pairFile = str(tmp_path / "pairs")
+    Edge_List.saveEdges(*Edge_List.fromDict(PAIRS), pairFile)
+    result = Graph_Analytics.analyzePairs(pairFile, str(tmp_path / "pairAnalytics"))
+    assert (tmp_path / "pairAnalytics.csv").exists()
+
+    def noAnalysis(*args, **kwargs):
+        raise AssertionError("Unchanged pairs were analyzed again")
+    monkeypatch.setattr(Graph_Analytics, "analyze", noAnalysis)
+    assert Graph_Analytics.analyzePairs(pairFile, str(tmp_path / "pairAnalytics")) == result
@@ -0,0 +1,45 @@
+'''
+@desc:      Tests for exporting the relations graph with `Graph_Export`.
+'''
+
+import json
+import networkx as nx
+import pytest
+import Edge_List
+import Graph_Export
+
+
+RAW_FREQ = {"ann_lee&usa": 4, "bob_ray&canda": 2, "cat_day&rus": 2}
+PAIRS = Edge_List.fromDict({("ann_lee&usa", "bob_ray&canda"): 2, ("bob_ray&canda", "cat_day&rus"): 1})
+
+
+def test_graph_keeps_counts_and_lift():
+    graph = Graph_Export.buildGraph(RAW_FREQ, PAIRS, numPhotos = 8)
+    assert graph.nodes["bob ray"] == {"country": "canada", "frequency": 2}
+    assert graph.edges["ann lee", "bob ray"] == {"weight": 2, "lift": pytest.approx(2.0)}
+    assert graph.edges["bob ray", "cat day"]["lift"] == pytest.approx(2.0)
+
+    kept = Graph_Export.buildGraph(RAW_FREQ, PAIRS, numPhotos = 8, fp = ["ann lee", "bob ray"])
+    assert list(kept.edges) == [("ann lee", "bob ray")]
+
+
+def test_every_format_round_trips(tmp_path):
+    written = Graph_Export.exportGraph(RAW_FREQ, PAIRS, 8, fileName = str(tmp_path / "Relations"))
+    graphml, gexf, stream = written
+    assert [p.rsplit('.', 1)[1] for p in written] == ["graphml", "gexf", "ndjson"]
+
+    for graph in (nx.read_graphml(graphml), nx.read_gexf(gexf)):
+        assert graph.number_of_edges() == 2
+        assert int(graph.edges["ann lee", "bob ray"]["weight"]) == 2
+
+    lines = [json.loads(line) for line in open(stream)]
+    assert lines[0] == {"type": "graph", "nodes": 3, "edges": 2}
+    nodes = {line["id"]: line["name"] for line in lines if line["type"] == "node"}
+    edges = {(nodes[line["source"]], nodes[line["target"]]): line["weight"]
+        for line in lines if line["type"] == "edge"}
+    assert edges == {("ann lee", "bob ray"): 2, ("bob ray", "cat day"): 1}
+
+
+def test_unknown_format_is_an_error(tmp_path):
+    with pytest.raises(ValueError):
+        Graph_Export.writeGraph(nx.Graph(), str(tmp_path / "Relations"), "svg")
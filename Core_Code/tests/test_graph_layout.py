@@ -0,0 +1,46 @@
+'''
+@desc:      Tests for the force-directed layout in `Graph_Layout`.
+'''
+
+import os
+import numpy as np
+import Graph_Layout
+
+
+NODES = ["ann", "bob", "cat", "dan", "eve", "fay"]
+GROUPS = [0, 0, 0, 1, 1, 1]
+EDGES = [(0, 1), (1, 2), (3, 4), (2, 3)]
+WEIGHTS = [5, 3, 4, 1]
+
+
+def test_grid_repulsion_approximates_the_exact_repulsion():
+    pos = np.random.default_rng(0).uniform(size = (400, 2))
+    exact = Graph_Layout.exactRepulsion(pos, 0.05)
+    grid = Graph_Layout.gridRepulsion(pos, 0.05)
+    cosine = np.sum(exact * grid, axis = 1) / (np.linalg.norm(exact, axis = 1) * np.linalg.norm(grid, axis = 1))
+    assert np.median(cosine) > 0.9
+
+
+def test_countries_stay_clustered():
+    pos = Graph_Layout.forceDirected(GROUPS, np.array(EDGES), np.array(WEIGHTS, dtype = float))
+    groups = np.array(GROUPS)
+    centers = [pos[groups == g].mean(axis = 0) for g in (0, 1)]
+    for i, g in enumerate(GROUPS):
+        assert np.linalg.norm(pos[i] - centers[g]) < np.linalg.norm(pos[i] - centers[1 - g])
+
+
+def test_layouts_are_reused_from_the_cache(tmp_path, monkeypatch):
+    cacheDir = str(tmp_path / "Layout_Cache")
+    layout = Graph_Layout.layoutGraph(NODES, GROUPS, EDGES, WEIGHTS, iterations = 20, cacheDir = cacheDir)
+    assert len(os.listdir(cacheDir)) == 1
+
+    def noLayout(*args, **kwargs):
+        raise AssertionError("A cached layout was computed again")
+    monkeypatch.setattr(Graph_Layout, "forceDirected", noLayout)
+    cached = Graph_Layout.layoutGraph(NODES, GROUPS, EDGES, WEIGHTS, iterations = 20, cacheDir = cacheDir)
+    assert {n: xy.tolist() for n, xy in cached.items()} == {n: xy.tolist() for n, xy in layout.items()}
+
+    # Any change to the graph lays it out again
+    monkeypatch.undo()
+    Graph_Layout.layoutGraph(NODES, GROUPS, EDGES, [5, 3, 4, 2], iterations = 20, cacheDir = cacheDir)
+    assert len(os.listdir(cacheDir)) == 2
@@ -0,0 +1,34 @@
+'''
+@desc:      Tests for drawing the relations graph with `Graph_Renderer`.
+'''
+
+import numpy as np
+from PIL import Image
+import Graph_Renderer
+
+
+SCENE = {"nodes": ["ann&usa", "bob&rus"], "pos": [(0.0, 0.0), (1.0, 1.0)],
+    "colors": ["#cc0000", "#0000cc"], "edges": [(0, 1)]}
+
+
+def test_nodes_keep_the_aspect_ratio_inside_the_margin():
+    xy = Graph_Renderer.placeScene({"pos": [(0, 0), (2, 1)]}, 1000)
+    assert xy.tolist() == [[50.0, 950.0], [950.0, 500.0]]
+
+
+def test_render_draws_every_node_and_portrait_on_one_canvas(tmp_path):
+    portrait = np.zeros((40, 40, 3), dtype = np.uint8)
+    portrait[:, :, 1] = 255
+    canvas = Graph_Renderer.renderGraph(SCENE, {"ann&usa": portrait},
+        ofp = str(tmp_path / "Relations"), size = 600)
+
+    assert canvas.size == (600, 600)
+    assert Image.open(tmp_path / "Relations.png").size == (600, 600)
+    xy = Graph_Renderer.placeScene(SCENE) * 600 / Graph_Renderer.BASE_SIZE
+    (ax, ay), (bx, by) = xy.round().astype(int).tolist()
+    # ann is covered by the portrait, bob by the node color blended over white
+    assert canvas.getpixel((ax, ay)) == (0, 255, 0)
+    assert canvas.getpixel((bx, by)) == Graph_Renderer.hexColor("#0000cc", Graph_Renderer.NODE_ALPHA)
+    # The edge runs between them
+    mx, my = (ax + bx) // 2, (ay + by) // 2
+    assert canvas.getpixel((mx, my)) != (255, 255, 255)
@@ -0,0 +1,39 @@
+'''
+@desc:      Tests for grouping near-duplicate photos with `Image_Dedup`.
+'''
+
+import json
+import numpy as np
+import pytest
+from PIL import Image
+import Image_Dedup
+
+
+@pytest.fixture
+def photos(tmp_path):
+    rng = np.random.default_rng(0)
+    scene = rng.integers(0, 255, (64, 64, 3), dtype = np.uint8)
+    other = rng.integers(0, 255, (64, 64, 3), dtype = np.uint8)
+
+    Image.fromarray(scene).resize((256, 256)).save(tmp_path / "large.jpg", quality = 95)
+    Image.fromarray(scene).resize((128, 128)).save(tmp_path / "small.jpg", quality = 70)
+    Image.fromarray(other).resize((256, 256)).save(tmp_path / "other.jpg")
+    (tmp_path / "broken.jpg").write_bytes(b"not an image")
+    return [str(tmp_path / name) for name in ("large.jpg", "small.jpg", "other.jpg", "broken.jpg")]
+
+
+def test_pool_and_serial_hashes_agree(photos, tmp_path):
+    serial = Image_Dedup.hashImages(photos, hashFile = str(tmp_path / "serial.json"), numProcesses = 1)
+    pooled = Image_Dedup.hashImages(photos, hashFile = str(tmp_path / "pooled.json"), numProcesses = 2)
+    assert serial == pooled
+    assert sorted(serial) == sorted(photos[:3])
+    assert len(json.loads((tmp_path / "pooled.json").read_text())) == 3
+
+
+def test_resized_copy_is_grouped_under_the_largest_image(photos, tmp_path):
+    groups = Image_Dedup.findDuplicates(photos, hashFile = str(tmp_path / "hashes.json"), numProcesses = 2)
+    assert groups == {photos[0]: [photos[1]]}
+
+    duplicates = Image_Dedup.saveGroups(groups, str(tmp_path / "groups.json"), photos)
+    assert duplicates == {"small.jpg": "large.jpg"}
+    assert Image_Dedup.loadGroups(str(tmp_path / "groups.json")) == duplicates
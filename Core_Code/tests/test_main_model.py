@@ -0,0 +1,177 @@
+'''
+@desc:      Tests for scanning images with `Main_Model.Master_Model`.
+'''
+
+import os
+import signal
+from PIL import Image
+import numpy as np
+import pytest
+import Main_Model
+
+
+'''
+DESC:   Fails the test instead of hanging it when a scan never finishes
+
+INPUT:  signum, frame
+            - Passed by the signal module
+
+OUTPUT: None
+'''
+def scanTimeout(signum, frame):
+    raise TimeoutError("The scan didn't finish")
+
+
+'''
+DESC:   Scans images, failing the test if the scan hangs
+
+INPUT:  model:Main_Model.Master_Model
+            - The model to scan with
+        paths:list
+            - The images to scan
+        **kwargs
+            - Passed on to `findFacesFiles`
+
+OUTPUT: The faces found
+'''
+def timedScan(model, paths:list, **kwargs):
+    previous = signal.signal(signal.SIGALRM, scanTimeout)
+    signal.alarm(120)
+    try:
+        return model.findFacesFiles(paths, **kwargs)
+    finally:
+        signal.alarm(0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+class AbortAfter:
+    '''
+    Stands in for the event `findFacesFiles` is aborted with, and is set once
+    the model has collected a number of images
+    '''
+    def __init__(self, model, count:int):
+        self.model = model
+        self.count = count
+
+    def is_set(self):
+        return self.model.harvested >= self.count
+
+
+@pytest.fixture
+def model(tmp_path):
+    (tmp_path / "Data" / "Portraits").mkdir(parents = True)
+    return Main_Model.Master_Model(str(tmp_path / "Data" / "Portraits") + "/",
+        str(tmp_path / "Data" / "Temp" / "Portrait_Bin") + "/", 1)
+
+
+def test_corrupt_image_is_reported_and_scan_finishes(model, tmp_path, capsys):
+    images = tmp_path / "Input"
+    images.mkdir()
+    (images / "broken.jpg").write_bytes(b"notajpeg")
+    Image.new("RGB", (64, 64), "white").save(images / "blank.jpg")
+
+    found = timedScan(model, [str(images / "broken.jpg"), str(images / "blank.jpg")])
+
+    assert found["blank.jpg"][0] == {}
+    assert "broken.jpg" not in found
+    errors = [line for line in capsys.readouterr().out.splitlines() if "broken.jpg" in line]
+    assert any("UnidentifiedImageError" in line for line in errors)
+    assert "blank.jpg" in Main_Model.mergeCache(model.main_cache, {})
+
+
+def test_aborted_scan_resumes_where_it_stopped(model, tmp_path, capsys, monkeypatch):
+    images = tmp_path / "Input"
+    images.mkdir()
+    paths = []
+    for i in range(5):
+        Image.new("RGB", (64, 64), "white").save(images / "blank_{0}.jpg".format(i))
+        paths.append(str(images / "blank_{0}.jpg".format(i)))
+
+    # Checkpoints only journal their entries, the cache is written at the end
+    merges = []
+    mergeCache = Main_Model.mergeCache
+    monkeypatch.setattr(Main_Model, "mergeCache", lambda *args: merges.append(args) or mergeCache(*args))
+
+    timedScan(model, paths, checkpoint_every = 1, abort = AbortAfter(model, 1))
+    assert len(merges) == 1
+    assert not os.path.exists(model.main_cache + ".journal")
+    names = sorted(os.path.basename(p) for p in paths)
+    checkpoint = model.loadCheckpoint(names)
+    assert checkpoint is not None and 0 < len(checkpoint["committed"]) < len(names)
+    capsys.readouterr()
+
+    resumed = Main_Model.Master_Model(str(tmp_path / "Data" / "Portraits") + "/",
+        str(tmp_path / "Data" / "Temp" / "Portrait_Bin") + "/", 1)
+    found = timedScan(resumed, paths, resume = True)
+    out = capsys.readouterr().out
+    assert "Resuming scan {0}".format(checkpoint["run_id"]) in out
+    for name in names:
+        assert ("Analyzing image " + name in out) == (name not in checkpoint["committed"])
+    assert sorted(found) == names
+
+    # A finished scan leaves nothing to resume
+    assert resumed.loadCheckpoint(names) is None
+    assert sorted(Main_Model.mergeCache(model.main_cache, {})) == names
+
+
+def test_cache_journal_survives_a_torn_write(tmp_path):
+    cacheFile = str(tmp_path / "Input_Cache.dat")
+    Main_Model.mergeCache(cacheFile, {"a.jpg": ["a"]})
+    Main_Model.journalCache(cacheFile, {"b.jpg": ["b"]})
+    with open(cacheFile + ".journal", "ab") as f:
+        f.write(b"\x40\x00\x00\x00torn")
+    Main_Model.journalCache(cacheFile, {"c.jpg": ["c"]})
+
+    assert Main_Model.loadCache(cacheFile) == {"a.jpg": ["a"], "b.jpg": ["b"], "c.jpg": ["c"]}
+    assert Main_Model.mergeCache(cacheFile, {}) == {"a.jpg": ["a"], "b.jpg": ["b"], "c.jpg": ["c"]}
+    assert not os.path.exists(cacheFile + ".journal")
+
+
+@pytest.fixture
+def detector(monkeypatch):
+    # Every search finds the faces given for its upsample count, and every
+    # face encodes to zeros
+    found = {0: [], 1: [], 2: []}
+    searches = []
+    def face_locations(img, upsample, model):
+        searches.append((upsample, model))
+        return list(found.get(upsample, []))
+    monkeypatch.setattr(Main_Model.face_recognition, "face_locations", face_locations)
+    monkeypatch.setattr(Main_Model.face_recognition, "face_encodings",
+        lambda img, locations: [np.zeros(128) for _ in locations])
+    return found, searches
+
+
+@pytest.mark.parametrize("side, upright, allowCnn, picked, searches", [
+    (400, [], False, (2, "hog", "thumbnail"), []),
+    (400, [], True, (1, "cnn", "thumbnail without faces"), [(0, "hog")]),
+    (400, [(0, 50, 50, 0)], True, (2, "hog", "thumbnail"), [(0, "hog")]),
+    (1000, [(0, 300, 300, 0)], False, (0, "hog", "close-up"), [(0, "hog")]),
+    (1000, [(0, 300, 300, 0), (0, 100, 100, 0)], False, (1, "hog", "default"), [(0, "hog")]),
+    (1000, [], False, (1, "hog", "default"), [(0, "hog")]),
+])
+def test_detector_is_picked_from_the_image(detector, side, upright, allowCnn, picked, searches):
+    found, searched = detector
+    found[0] = upright
+    choice = Main_Model.chooseDetector(np.zeros((side, side, 3), dtype = np.uint8), allowCnn)
+    assert choice[:3] == picked
+    assert searched == searches
+
+
+def test_upright_first_pass_is_reused_for_close_ups(detector):
+    found, searched = detector
+    found[0] = [(0, 300, 300, 0)]
+    entry = Main_Model.detectFaces(np.zeros((1000, 1000, 3), dtype = np.uint8), None)
+
+    # The first pass stands in for the upright search, so only the three
+    # turned images are searched again
+    assert searched == [(0, "hog")] * 4
+    assert entry["rotations"] == [0, 1, 2, 3]
+    assert entry["detector"]["reason"] == "close-up"
+
+
+def test_images_are_upsampled_once_unless_adaptive_detection_is_asked_for(detector, model):
+    found, searched = detector
+    assert model.upsample == 1
+    Main_Model.detectFaces(np.zeros((1000, 1000, 3), dtype = np.uint8), model.upsample)
+    assert searched == [(1, "hog")] * 4
@@ -0,0 +1,130 @@
+'''
+@desc:      Tests for counting astronauts and pairs with `Market_Basket_Driver`.
+'''
+
+import os
+import json
+import math
+import pytest
+import Edge_List
+import Market_Basket_Driver as mbd
+
+
+'''
+DESC:   Writes a scan result file the way `Facial_Detection_Driver` does
+
+INPUT:  sourceDir
+            - The directory the result is written to
+        name:str
+            - The album the result is for
+        photos:dict
+            - Photo names mapped to the astronauts in them
+
+OUTPUT: None
+'''
+def writeResult(sourceDir, name:str, photos:dict):
+    path = sourceDir / "{0}_result.json".format(name)
+    path.write_text(json.dumps({photo: [{astro: [i] for i, astro in enumerate(astros)}]
+        for photo, astros in photos.items()}))
+    # Rewrites within the same clock tick still have to look changed
+    stat = os.stat(path)
+    os.utime(path, ns = (stat.st_atime_ns, stat.st_mtime_ns + 1000 * len(os.listdir(sourceDir))))
+
+
+def fullCount(sourceDir):
+    return mbd.aggregateResult(mbd.countPhotos(mbd.loadPhotos(str(sourceDir))))
+
+
+@pytest.fixture
+def sourceDir(tmp_path):
+    source = tmp_path / "Scan_Result"
+    source.mkdir()
+    writeResult(source, "exp1", {"a.jpg": ["ann&usa", "bob&usa"], "b.jpg": ["ann&usa"],
+        "c.jpg": ["bob&usa", "cat&rus", "dan&jpn"]})
+    writeResult(source, "exp2", {"d.jpg": ["cat&rus", "dan&jpn"], "e.jpg": []})
+    return source
+
+
+def test_incremental_update_matches_a_full_recount(sourceDir, tmp_path):
+    stateFile = str(tmp_path / "Temp" / "Basket_State.dat")
+
+    def update():
+        result = mbd.updateModel(str(sourceDir), stateFile)
+        full = fullCount(sourceDir)
+        assert result["rawFreq"] == full["rawFreq"]
+        assert result["pairs"] == full["pairs"]
+        assert result["transactions"] == full["transactions"]
+        return result
+
+    assert update()["changed"] == ["exp1_result.json", "exp2_result.json"]
+    assert update()["changed"] == []
+
+    # Added, modified, and a photo that moves to a later file
+    writeResult(sourceDir, "exp3", {"f.jpg": ["ann&usa", "dan&jpn"], "a.jpg": ["eve&usa"]})
+    assert update()["changed"] == ["exp3_result.json"]
+    writeResult(sourceDir, "exp2", {"d.jpg": ["cat&rus"], "g.jpg": ["bob&usa", "eve&usa"]})
+    assert update()["changed"] == ["exp2_result.json"]
+
+    # Deleting the later file brings back the earlier copy of a.jpg
+    os.remove(sourceDir / "exp3_result.json")
+    result = update()
+    assert result["changed"] == ["exp3_result.json"]
+    assert result["pairs"]["('ann&usa', 'bob&usa')"] == 1
+
+
+def test_unfinished_update_is_counted_again(sourceDir, tmp_path):
+    stateFile = str(tmp_path / "Temp" / "Basket_State.dat")
+    mbd.updateModel(str(sourceDir), stateFile)
+    writeResult(sourceDir, "exp2", {"d.jpg": ["cat&rus"]})
+    open(stateFile + ".dirty", 'w').close()
+
+    result = mbd.updateModel(str(sourceDir), stateFile)
+    assert result["changed"] == ["exp1_result.json", "exp2_result.json"]
+    assert result["pairs"] == fullCount(sourceDir)["pairs"]
+    assert not os.path.exists(stateFile + ".dirty")
+
+
+def test_partitioned_count_matches_the_serial_count(sourceDir):
+    writeResult(sourceDir, "exp3", {"a.jpg": ["eve&usa", "bob&usa"], "h.jpg": ["ann&usa", "cat&rus"]})
+    serial = mbd.runModel(rawF = True, pairs = True, sourceDir = str(sourceDir))
+    result = mbd.runPartitioned(str(sourceDir), numProcesses = 2)
+
+    assert result["rawFreq"] == serial["rawFreq"]
+    assert result["pairs"] == serial["pairs"]
+    assert result["transactions"] == fullCount(sourceDir)["transactions"]
+    assert sorted(result["partitions"]) == ["exp1", "exp2", "exp3"]
+    assert result["partitions"]["exp2"]["pairs"] == {"('cat&rus', 'dan&jpn')": 1}
+
+
+def test_plain_counts_stay_serial(sourceDir, monkeypatch):
+    def noPool(*args, **kwargs):
+        raise AssertionError("A plain count started a process pool")
+    monkeypatch.setattr(mbd.mp, "Pool", noPool)
+
+    result = mbd.runModel(rawF = True, pairs = True, sourceDir = str(sourceDir))
+    assert result["pairs"] == fullCount(sourceDir)["pairs"]
+
+
+def test_weighted_pairs_use_the_closest_faces():
+    # Faces 0, 1 and 3 were identified; 3 is the second face matched to ann
+    proximity = {"faces": [0, 1, 3], "distances": [2.0, 10.0, 4.0]}
+    photos = {"a.jpg": [{"ann&usa": [0, 3], "bob&usa": [1]}, proximity],
+        "b.jpg": [{"ann&usa": [0], "bob&usa": [1], "cat&rus": [2]}],
+        "c.jpg": [{"ann&usa": [0]}]}
+
+    weighted = mbd.findWeightedPairs(photos, scale = 2.0)
+    assert weighted[("ann&usa", "bob&usa")] == pytest.approx(1 + math.exp(-1))
+    assert weighted[("ann&usa", "cat&rus")] == 1
+    assert ("bob&usa", "cat&rus") in weighted
+
+
+def test_saved_weighted_pairs_load_as_an_edge_list(tmp_path):
+    fileName = str(tmp_path / "weightedPairs")
+    photos = {"a.jpg": [{"ann&usa": [0], "bob&usa": [1]}, {"faces": [0, 1], "distances": [5.0]}],
+        "b.jpg": [{"ann&usa": [0], "bob&usa": [1]}]}
+    weighted = mbd.findWeightedPairs(photos, save = True, fileName = fileName)
+
+    assert json.loads((tmp_path / "weightedPairs.json").read_text()) == mbd.pairsToJson(weighted)
+    names, edges = mbd.loadPairs(fileName)
+    assert Edge_List.toDict(names, edges) == {("ann&usa", "bob&usa"): 2}
+    assert Edge_List.toDict(names, edges, "weight") == pytest.approx(weighted)
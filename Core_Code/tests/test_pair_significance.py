@@ -0,0 +1,54 @@
+'''
+@desc:      Tests for the permutation test in `Pair_Significance`.
+'''
+
+import numpy as np
+import pytest
+import Pair_Significance
+
+
+TRANSACTIONS = [["ann", "bob"]] * 10 + [["cat"], ["ann"], ["bob", "cat"], ["dan", "ann"], ["dan"]]
+
+
+'''
+DESC:   Counts the pairs of a list of transactions with a dense incidence matrix
+
+INPUT:  transactions:list
+            - A list of lists of astronauts in each photo
+
+OUTPUT: A dictionary of sorted name tuples to co-occurrence counts
+'''
+def denseCounts(transactions:list):
+    names = sorted({a for t in transactions for a in t})
+    incidence = np.zeros((len(transactions), len(names)))
+    for photo, transaction in enumerate(transactions):
+        for astro in transaction:
+            incidence[photo, names.index(astro)] = 1
+    counts = incidence.T @ incidence
+    return {(names[i], names[j]): int(counts[i, j]) for i in range(len(names))
+        for j in range(i + 1, len(names)) if counts[i, j]}
+
+
+def test_fixed_seed_gives_the_same_p_values_for_any_process_count():
+    serial = Pair_Significance.pairSignificance(TRANSACTIONS, numPermutations = 100, seed = 7,
+        numProcesses = 1)
+    parallel = Pair_Significance.pairSignificance(TRANSACTIONS, numPermutations = 100, seed = 7,
+        numProcesses = 2)
+    assert serial == parallel
+
+    assert {pair: s["count"] for pair, s in serial.items()} == denseCounts(TRANSACTIONS)
+    # ann and bob are together in every one of bob's photos but one, which a
+    # shuffle never matches
+    assert serial[("ann", "bob")]["pValue"] == pytest.approx(1 / 101)
+    assert serial[("ann", "bob")]["expected"] < 10
+    assert serial[("ann", "dan")]["pValue"] > 0.1
+
+
+def test_a_photo_listing_an_astronaut_twice_counts_them_once():
+    counts = Pair_Significance.cooccurrence(np.array([0, 0, 0]), np.array([0, 1, 1]), (1, 2))
+    assert counts.toarray().tolist() == [[1, 1], [1, 1]]
+
+
+def test_no_permutations_is_an_error():
+    with pytest.raises(ValueError):
+        Pair_Significance.pairSignificance(TRANSACTIONS, numPermutations = 0)
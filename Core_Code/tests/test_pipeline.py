@@ -0,0 +1,103 @@
+'''
+@desc:      Tests for the memoized stage pipeline in `Pipeline`.
+'''
+
+import os
+import pytest
+import Pipeline
+
+
+@pytest.fixture
+def build(tmp_path):
+    source = tmp_path / "photos.txt"
+    source.write_text("a b\nb c\n")
+    calls = []
+
+    def load(path:str):
+        calls.append("load")
+        return open(path).read().split()
+
+    def count(words:list, minimum:int = 1):
+        calls.append("count")
+        return len([w for w in words if len(w) >= minimum])
+
+    def report(total:int):
+        calls.append("report")
+        return "{0} words".format(total)
+
+    def make(minimum:int = 1):
+        pipeline = Pipeline.newPipeline(str(tmp_path / "Cache"))
+        Pipeline.addStage(pipeline, "load", load, params = {"path": str(source)},
+            sources = [str(source)])
+        Pipeline.addStage(pipeline, "count", count, ("load",), {"minimum": minimum})
+        Pipeline.addStage(pipeline, "report", report, ("count",))
+        return pipeline
+
+    return make, calls, source
+
+
+def touch(path):
+    stat = os.stat(path)
+    os.utime(path, ns = (stat.st_atime_ns, stat.st_mtime_ns + 1000))
+
+
+def test_stages_only_run_when_their_key_changes(build):
+    make, calls, source = build
+    assert Pipeline.runPipeline(make(), ["report"]) == {"report": "4 words"}
+    assert calls == ["load", "count", "report"]
+
+    calls.clear()
+    Pipeline.runPipeline(make(), ["report"])
+    assert calls == []
+
+    # New params rerun the stage, and its new result reruns the next one
+    Pipeline.runPipeline(make(minimum = 2), ["report"])
+    assert calls == ["count", "report"]
+
+    # A changed source reruns its stage; a dependency whose result came out
+    # the same leaves the stages after it alone
+    calls.clear()
+    source.write_text("c d\nd e\n")
+    touch(source)
+    assert Pipeline.runPipeline(make(), ["report"]) == {"report": "4 words"}
+    assert calls == ["load", "count"]
+
+
+def test_results_past_keep_results_are_evicted(build, tmp_path):
+    make, calls, source = build
+    for minimum in range(1, Pipeline.KEEP_RESULTS + 2):
+        Pipeline.runPipeline(make(minimum = minimum), ["count"])
+
+    pipeline = make()
+    records = Pipeline.stageRecords(pipeline, "count")
+    assert len(records) == Pipeline.KEEP_RESULTS
+    cached = [f for f in os.listdir(tmp_path / "Cache") if f.startswith("count-")]
+    assert sorted(cached) == sorted("count-{0}.pkl".format(r["key"]) for r in records)
+
+    # The oldest params were evicted, the newer ones are still reused
+    calls.clear()
+    Pipeline.runPipeline(make(minimum = 2), ["count"])
+    assert calls == []
+    Pipeline.runPipeline(make(minimum = 1), ["count"])
+    assert calls == ["count"]
+
+
+def test_cached_results_are_only_read_when_needed(build):
+    make, calls, source = build
+    Pipeline.runPipeline(make(), ["report"])
+
+    pipeline = make()
+    resolved = {}
+    assert Pipeline.stageResult(pipeline, "report", resolved) == "4 words"
+    assert resolved["load"][1] is Pipeline._NOT_LOADED
+    assert resolved["count"][1] is Pipeline._NOT_LOADED
+
+    assert Pipeline.stageResult(pipeline, "load", resolved) == ["a", "b", "b", "c"]
+    assert resolved["load"][1] == ["a", "b", "b", "c"]
+    assert calls == ["load", "count", "report"]
+
+
+def test_unknown_dependency_is_an_error(tmp_path):
+    pipeline = Pipeline.newPipeline(str(tmp_path / "Cache"))
+    with pytest.raises(ValueError):
+        Pipeline.addStage(pipeline, "count", len, ("load",))
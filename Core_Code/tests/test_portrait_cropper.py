@@ -0,0 +1,29 @@
+'''
+@desc:      Tests for cropping portraits with `Portrait_Cropper`.
+'''
+
+import os
+from PIL import Image
+import Main_Model
+import Portrait_Cropper
+
+
+def test_unreadable_portrait_is_reported_and_the_rest_go_on(tmp_path):
+    sourceDir = tmp_path / "Portraits"
+    sourceDir.mkdir()
+    (sourceDir / "broken_one&usa.jpg").write_bytes(b"not an image")
+    Image.new("RGB", (60, 60), (128, 128, 128)).save(sourceDir / "blank_wall&usa.jpg")
+    cacheFile = str(tmp_path / "Input_Cache.dat")
+
+    result = Portrait_Cropper.cropPortraits(str(sourceDir) + '/', str(tmp_path / "Cropped") + '/',
+        None, cacheFile, numProcesses = 2, verbose = False)
+
+    assert result["cropped"] == []
+    assert result["skipped"] == [str(sourceDir) + "/blank_wall&usa.jpg"]
+    [(source, error)] = result["failed"]
+    assert source == str(sourceDir) + "/broken_one&usa.jpg"
+    assert error.split(':')[0] == "UnidentifiedImageError"
+    assert os.listdir(tmp_path / "Cropped") == []
+
+    # Only the portrait that was read is cached, so the broken one is tried again
+    assert list(Main_Model.loadCache(cacheFile)) == ["blank_wall&usa.jpg"]
@@ -0,0 +1,60 @@
+'''
+@desc:      Tests for the requests `Recognition_Service` can't serve.
+'''
+
+import os
+import asyncio
+import threading
+import pytest
+import Main_Model
+import Recognition_Service
+
+
+def answer(request):
+    service = {"stats": {"requests": 0}}
+    sent = []
+    asyncio.run(Recognition_Service.handleRequest(service, request, sent.append))
+    return sent
+
+
+@pytest.mark.parametrize("request_, error", [
+    ({"id": 1, "dir": "/no/such/directory"}, "FileNotFoundError"),
+    ({"id": 2, "data": "not base64!"}, "Error"),
+    ({"id": 3, "image": 42}, "TypeError"),
+])
+def test_bad_request_gets_one_error(request_, error):
+    sent = answer(request_)
+    assert len(sent) == 1
+    assert sent[0]["id"] == request_["id"]
+    assert sent[0]["error"].split(':')[0] == error
+
+
+def test_request_that_is_not_an_object_gets_an_error():
+    assert [r["id"] for r in answer(["image", "a.jpg"])] == [None]
+    assert "error" in answer("a.jpg")[0]
+
+
+def test_cache_saves_run_off_the_event_loop(tmp_path, monkeypatch):
+    cacheFile = str(tmp_path / "Input_Cache.dat")
+    service = {"cacheFile": cacheFile, "cache": {}, "unsaved": {}, "saving": asyncio.Lock()}
+    threads = []
+    journalCache = Main_Model.journalCache
+    def journal(*args):
+        threads.append(threading.current_thread())
+        journalCache(*args)
+    monkeypatch.setattr(Main_Model, "journalCache", journal)
+
+    async def serve():
+        service["unsaved"] = {"a.jpg": {"encodings": [], "locations": []}}
+        await Recognition_Service.saveCache(service)
+        assert service["unsaved"] == {}
+        assert os.path.exists(cacheFile + ".journal") and not os.path.exists(cacheFile)
+
+        service["unsaved"] = {"b.jpg": {"encodings": [], "locations": []}}
+        await Recognition_Service.saveCache(service, final = True)
+
+    asyncio.run(serve())
+    assert threads and threads[0] is not threading.main_thread()
+    assert sorted(service["cache"]) == ["a.jpg", "b.jpg"]
+    assert sorted(Main_Model.loadCache(cacheFile)) == ["a.jpg", "b.jpg"]
+    assert not os.path.exists(cacheFile + ".journal")
@@ -0,0 +1,113 @@
+'''
+@desc:      Tests for the append-only scan result log in `Result_Log`.
+'''
+
+import os
+import pickle
+import Result_Log
+
+
+def record(name:str, value:int):
+    return (name, {"value": value}, None, "run")
+
+
+def test_reopened_log_reads_the_latest_records(tmp_path):
+    log = Result_Log.openLog(str(tmp_path))
+    for i in range(30):
+        Result_Log.appendRecord(log, record("img{0}".format(i % 10), i))
+        if i % 7 == 6: Result_Log.syncLog(log)
+    Result_Log.closeLog(log)
+
+    reopened = Result_Log.openLog(str(tmp_path))
+    assert reopened["records"] == log["records"]
+    assert [r[1]["value"] for r in Result_Log.replayLog(reopened, ["img0", "img9"])] == [20, 29]
+    assert Result_Log.readRecord(reopened, "missing") is None
+
+
+def test_records_after_the_last_sync_are_kept(tmp_path):
+    log = Result_Log.openLog(str(tmp_path))
+    Result_Log.appendRecord(log, record("a", 1))
+    Result_Log.syncLog(log)
+    Result_Log.appendRecord(log, record("b", 2))
+    Result_Log.closeSegment(log)
+
+    reopened = Result_Log.openLog(str(tmp_path))
+    assert Result_Log.readRecord(reopened, "b") == record("b", 2)
+
+
+def test_torn_tail_is_cut_off(tmp_path):
+    log = Result_Log.openLog(str(tmp_path))
+    Result_Log.appendRecord(log, record("a", 1))
+    Result_Log.appendRecord(log, record("b", 2))
+    Result_Log.closeLog(log)
+    path = Result_Log.segmentPath(log, log["active"])
+    size = os.path.getsize(path)
+
+    # The last record loses its end, as if the run died while writing it
+    with open(path, 'r+b') as f:
+        f.truncate(size - 3)
+    reopened = Result_Log.openLog(str(tmp_path))
+    assert Result_Log.readRecord(reopened, "a") == record("a", 1)
+    assert Result_Log.readRecord(reopened, "b") is None
+    assert os.path.getsize(path) == log["records"]["b"][1]
+
+    # Appending after the cut leaves every record readable
+    Result_Log.appendRecord(reopened, record("c", 3))
+    Result_Log.closeLog(reopened)
+    again = Result_Log.openLog(str(tmp_path))
+    assert [r[0] for r in Result_Log.replayLog(again)] == ["a", "c"]
+
+
+def test_torn_index_journal_falls_back_to_the_segments(tmp_path):
+    log = Result_Log.openLog(str(tmp_path))
+    Result_Log.appendRecord(log, record("a", 1))
+    Result_Log.syncLog(log)
+    Result_Log.appendRecord(log, record("b", 2))
+    Result_Log.syncLog(log)
+    with open(Result_Log.journalPath(log), 'a') as f:
+        f.write('{"sizes": {"0"')
+    Result_Log.closeSegment(log)
+
+    reopened = Result_Log.openLog(str(tmp_path))
+    assert reopened["records"] == log["records"]
+    assert not os.path.exists(Result_Log.journalPath(log))
+
+
+def test_compaction_keeps_only_live_records(tmp_path):
+    log = Result_Log.openLog(str(tmp_path), segmentSize = 256)
+    for i in range(40):
+        Result_Log.appendRecord(log, record("img{0}".format(i % 4), i))
+    Result_Log.syncLog(log)
+    assert len(log["sizes"]) > 1
+    assert Result_Log.garbageRatio(log) > 0.5
+
+    before, after = Result_Log.compactLog(log)
+    assert after < before
+    assert Result_Log.garbageRatio(log) == 0
+    segments = sorted(f for f in os.listdir(str(tmp_path)) if f.endswith('.log'))
+    assert segments == [os.path.basename(Result_Log.segmentPath(log, s)) for s in sorted(log["sizes"])]
+
+    Result_Log.closeLog(log)
+    reopened = Result_Log.openLog(str(tmp_path), segmentSize = 256)
+    assert {r[0]: r[1]["value"] for r in Result_Log.replayLog(reopened)} == \
+        {"img0": 36, "img1": 37, "img2": 38, "img3": 39}
+
+
+def test_photo_bin_results_move_into_the_log(tmp_path):
+    photoBin = tmp_path / "Photo_Bin"
+    photoBin.mkdir()
+    for name, result in [("old", ("old.jpg", {"ann": [0]})), ("kept", ("kept.jpg", {"bob": [1]}, None, "run1"))]:
+        with open(photoBin / "{0}.dat".format(name), 'wb') as f:
+            pickle.dump(result, f)
+    (photoBin / "torn.dat").write_bytes(b"\x80")
+
+    log = Result_Log.openLog(str(tmp_path / "Result_Log"))
+    Result_Log.appendRecord(log, ("kept.jpg", {"bob": [0]}, None, "run2"))
+    assert Result_Log.migratePhotoBin(log, str(photoBin)) == 1
+    assert not photoBin.exists()
+    Result_Log.closeLog(log)
+
+    reopened = Result_Log.openLog(str(tmp_path / "Result_Log"))
+    assert Result_Log.readRecord(reopened, "old.jpg") == ("old.jpg", {"ann": [0]}, None, None)
+    assert Result_Log.readRecord(reopened, "kept.jpg")[3] == "run2"
+    assert Result_Log.migratePhotoBin(reopened, str(photoBin)) == 0
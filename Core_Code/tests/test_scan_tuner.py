@@ -0,0 +1,63 @@
+'''
+@desc:      Tests for calibrating the scan engine with `Scan_Tuner`.
+'''
+
+import os
+import pytest
+import Scan_Tuner
+
+
+# Images per second and faces found at each upsample factor with every core
+# scanning, and how much faster other process and thread counts scan
+SPEEDS = {0: 10.0, 1: 4.0, 2: 1.0, None: 6.0}
+FACES = {0: 3, 1: 5, 2: 5, None: 5}
+SCALES = {(4, 1): 1.0, (2, 2): 1.5}
+
+
+@pytest.fixture
+def timings(tmp_path, monkeypatch):
+    for i in range(8):
+        (tmp_path / "photo_{0}.jpg".format(i)).write_bytes(b"")
+    monkeypatch.setattr(os, "cpu_count", lambda: 4)
+
+    timed = []
+    def timeSetting(sample, processes, threads, upsample):
+        timed.append((processes, threads, upsample))
+        speed = SPEEDS[upsample] * SCALES.get((processes, threads), 0.5)
+        return {"processes": processes, "threads": threads, "upsample": upsample,
+            "seconds": len(sample) / speed, "imagesPerSecond": speed, "faces": FACES[upsample]}
+    monkeypatch.setattr(Scan_Tuner, "timeSetting", timeSetting)
+    return tmp_path, timed
+
+
+@pytest.mark.parametrize("minFaces, upsample, best", [(1.0, None, 9.0), (0.5, 0, 15.0)])
+def test_fastest_setting_that_finds_enough_faces_is_saved(timings, minFaces, upsample, best):
+    tmp_path, timed = timings
+    profileFile = str(tmp_path / "Scan_Profile.json")
+    profile = Scan_Tuner.tuneScan(str(tmp_path), minFaces = minFaces, profileFile = profileFile, verbose = False)
+
+    # Every factor is tried on every core first, then every process and
+    # thread count that fits in the cores with the chosen factor
+    assert timed[:4] == [(4, 1, 0), (4, 1, 1), (4, 1, 2), (4, 1, None)]
+    assert sorted(timed[4:]) == [(1, 1, upsample), (1, 2, upsample), (1, 4, upsample),
+        (2, 1, upsample), (2, 2, upsample)]
+    assert (profile["processes"], profile["threads"], profile["upsample"]) == (2, 2, upsample)
+    assert profile["imagesPerSecond"] == best
+    assert (profile["cpus"], profile["sample"], len(profile["trials"])) == (4, 8, 9)
+    assert Scan_Tuner.loadProfile(profileFile) == profile
+
+
+def test_profile_only_applies_on_the_machine_it_was_made_for(timings, monkeypatch):
+    tmp_path, timed = timings
+    profileFile = str(tmp_path / "Scan_Profile.json")
+    Scan_Tuner.tuneScan(str(tmp_path), profileFile = profileFile, verbose = False)
+
+    for var in Scan_Tuner.NATIVE_THREAD_VARS: monkeypatch.delenv(var, raising = False)
+    monkeypatch.setenv("OMP_NUM_THREADS", "3")
+    Scan_Tuner.applyProfile(Scan_Tuner.loadProfile(profileFile))
+    # Variables set from the shell win over the profile
+    assert os.environ["OMP_NUM_THREADS"] == "3"
+    assert os.environ["MKL_NUM_THREADS"] == "2"
+
+    monkeypatch.setattr(os, "cpu_count", lambda: 8)
+    assert Scan_Tuner.loadProfile(profileFile) is None
@@ -0,0 +1,168 @@
+'''
+@desc:      Tests for scanning with several nodes through `Shard_Scanner`. Face
+            detection is replaced by a stub that records every image it is
+            given, so the tests only exercise leasing, heartbeats and merging.
+'''
+
+import os
+import json
+import time
+import pickle
+import multiprocessing as mp
+import pytest
+import Main_Model
+import Shard_Scanner
+
+
+@pytest.fixture
+def layout(tmp_path):
+    dirs = {"train": tmp_path / "Data" / "Portraits", "pickle": tmp_path / "Data" / "Temp" / "Portrait_Bin",
+        "data": tmp_path / "Input", "work": tmp_path / "Work", "dump": tmp_path / "Scan_Result",
+        "log": tmp_path / "scanned.txt"}
+    dirs["train"].mkdir(parents = True)
+    for sub, count in (("album_a", 5), ("album_b", 3)):
+        (dirs["data"] / sub).mkdir(parents = True)
+        for i in range(count):
+            (dirs["data"] / sub / "{0}_{1}.jpg".format(sub, i)).write_bytes(b"")
+
+    # The shared cache already knows one image from an earlier scan
+    dirs["cache"] = tmp_path / "Data" / "Temp" / "Input_Cache.dat"
+    Main_Model.mergeCache(str(dirs["cache"]), {"earlier.jpg": ["earlier"]})
+    return {k: str(v) for k, v in dirs.items()}
+
+
+'''
+DESC:   Replaces detection with a stub that logs every image it scans, adds a
+        cache entry for it, and gives every image the same astronaut
+
+INPUT:  monkeypatch
+            - The pytest fixture
+        log:str
+            - The file every scanned image name is appended to
+        stall:bool = False
+            - Whether the stub never finishes an image, and only returns once
+            the scan is aborted
+
+OUTPUT: None
+'''
+def stubScan(monkeypatch, log:str, stall:bool = False):
+    def findFacesFiles(self, img_paths, cache_search = True, resume = False,
+        checkpoint_every = 100, abort = None):
+        if stall:
+            abort.wait(30)
+            return {}
+        for path in img_paths:
+            name = Main_Model.getFileName(path)
+            with open(log, 'a') as f:
+                f.write(name + '\n')
+            self.new_entries[name] = [name]
+            self.found_faces[name] = [{"some_one&usa": [0]}, None]
+            self.harvested += 1
+            time.sleep(0.02)
+        self.img_cache.update(Main_Model.mergeCache(self.main_cache, self.new_entries))
+        self.new_entries = {}
+        return self.found_faces
+
+    monkeypatch.setattr(Main_Model.Master_Model, "findFacesFiles", findFacesFiles)
+
+
+def runNodes(layout:dict, count:int, leaseTime:float = 30):
+    context = mp.get_context("fork")
+    nodes = [context.Process(target = Shard_Scanner.runNode, args = (layout["train"],
+        layout["pickle"], layout["work"], 1, leaseTime, "node{0}".format(i))) for i in range(count)]
+    for node in nodes: node.start()
+    for node in nodes: node.join(120)
+    assert all(node.exitcode == 0 for node in nodes)
+
+
+def test_every_shard_is_finished_exactly_once(layout, monkeypatch):
+    stubScan(monkeypatch, layout["log"])
+    manifest = Shard_Scanner.planShards(layout["data"], layout["work"], shardSize = 2)
+    assert len(manifest) == 5
+
+    runNodes(layout, 3)
+
+    with open(layout["log"]) as f:
+        scanned = f.read().split()
+    images = [Main_Model.getFileName(p) for shard in manifest.values() for p in shard["images"]]
+    assert sorted(scanned) == sorted(images)
+    assert Shard_Scanner.pendingShards(manifest, layout["work"]) == []
+    assert os.listdir(layout["work"] + "/leases") == []
+
+
+def test_merge_writes_results_and_node_caches(layout, monkeypatch):
+    stubScan(monkeypatch, layout["log"])
+    manifest = Shard_Scanner.planShards(layout["data"], layout["work"], shardSize = 2)
+    runNodes(layout, 2)
+
+    # Nodes only save the entries they detected themselves
+    for node in os.listdir(layout["work"] + "/nodes"):
+        with open("{0}/nodes/{1}/Input_Cache.dat".format(layout["work"], node), 'rb') as f:
+            assert "earlier.jpg" not in pickle.load(f)
+
+    written = Shard_Scanner.mergeShards(layout["work"], layout["dump"], layout["cache"])
+    assert sorted(os.path.basename(p) for p in written) == ["album_a_result.json", "album_b_result.json"]
+    with open(layout["dump"] + "/album_a_result.json") as f:
+        assert sorted(json.load(f)) == ["album_a_{0}.jpg".format(i) for i in range(5)]
+
+    cache = Main_Model.mergeCache(layout["cache"], {})
+    images = [Main_Model.getFileName(p) for shard in manifest.values() for p in shard["images"]]
+    assert sorted(cache) == sorted(images + ["earlier.jpg"])
+
+
+def test_merge_refuses_unfinished_shards(layout):
+    Shard_Scanner.planShards(layout["data"], layout["work"], shardSize = 2)
+    with pytest.raises(RuntimeError):
+        Shard_Scanner.mergeShards(layout["work"], layout["dump"])
+
+
+def test_expired_lease_is_taken_over(layout, monkeypatch):
+    stubScan(monkeypatch, layout["log"])
+    manifest = Shard_Scanner.planShards(layout["data"], layout["work"], shardSize = 10)
+    shard = sorted(manifest)[0]
+    lease = "{0}/leases/{1}".format(layout["work"], shard)
+    with open(lease, 'w') as f:
+        f.write("dead:0")
+    os.utime(lease, (time.time() - 100, time.time() - 100))
+
+    # A live lease is left alone
+    assert not Shard_Scanner.claimLease(layout["work"], shard, "other:0", leaseTime = 1000)
+
+    finished = Shard_Scanner.runNode(layout["train"], layout["pickle"], layout["work"], 1,
+        leaseTime = 10, nodeId = "rescuer")
+    assert shard in finished
+    with open("{0}/done/{1}.json".format(layout["work"], shard)) as f:
+        assert json.load(f)["node"] == "rescuer"
+
+
+def test_lease_renewed_while_claiming_is_put_back(layout, monkeypatch):
+    Shard_Scanner.planShards(layout["data"], layout["work"], shardSize = 10)
+    lease = layout["work"] + "/leases/shard_00000"
+    with open(lease, 'w') as f:
+        f.write("owner:0")
+    os.utime(lease, (time.time() - 100, time.time() - 100))
+
+    # The owner's heartbeat lands between the expiry check and the rename
+    rename = os.rename
+    def renewThenRename(src, dst):
+        os.utime(src)
+        rename(src, dst)
+    monkeypatch.setattr(os, "rename", renewThenRename)
+
+    assert not Shard_Scanner.claimLease(layout["work"], "shard_00000", "thief:0", leaseTime = 10)
+    with open(lease) as f:
+        assert f.read() == "owner:0"
+    assert os.listdir(layout["work"] + "/leases") == ["shard_00000"]
+
+
+def test_stalled_shard_is_given_up(layout, monkeypatch):
+    stubScan(monkeypatch, layout["log"], stall = True)
+    manifest = Shard_Scanner.planShards(layout["data"], layout["work"], shardSize = 10)
+
+    start = time.time()
+    finished = Shard_Scanner.runNode(layout["train"], layout["pickle"], layout["work"], 1,
+        leaseTime = 0.6, nodeId = "stuck")
+    assert finished == []
+    assert time.time() - start < 20
+    assert Shard_Scanner.pendingShards(manifest, layout["work"]) == sorted(manifest)
+    assert os.listdir(layout["work"] + "/leases") == []
@@ -0,0 +1,60 @@
+'''
+@desc:      Tests for the portrait thumbnail cache in `Thumbnail_Cache`.
+'''
+
+import os
+import pytest
+from PIL import Image
+import Thumbnail_Cache
+
+
+def writePortrait(photoDir, name:str, color:tuple, size:tuple = (64, 96)):
+    path = photoDir / "cropped_{0}.jpg".format(name)
+    existed = path.exists()
+    Image.new("RGB", size, color).save(path)
+    # A rewrite within the same clock tick still has to look changed
+    if existed:
+        stat = os.stat(path)
+        os.utime(path, ns = (stat.st_atime_ns, stat.st_mtime_ns + 1000))
+
+
+@pytest.fixture
+def photoDir(tmp_path):
+    photos = tmp_path / "Portraits_Cropped"
+    photos.mkdir()
+    writePortrait(photos, "ann_lee&usa", (255, 0, 0))
+    writePortrait(photos, "bob_ray&rus", (0, 0, 255), (32, 32))
+    return photos
+
+
+def buildAtlas(photoDir, tmp_path):
+    return Thumbnail_Cache.buildAtlas(str(photoDir) + '/', baseWidth = 16,
+        cacheDir = str(tmp_path / "Cache"), atlasFile = str(tmp_path / "Atlas.png"),
+        numProcesses = 1)
+
+
+def test_atlas_holds_every_thumbnail(photoDir, tmp_path):
+    thumbs = Thumbnail_Cache.loadAtlas(buildAtlas(photoDir, tmp_path))
+    assert sorted(thumbs) == ["ann lee", "bob ray"]
+    assert thumbs["ann lee"].size == (16, 24)
+    assert thumbs["bob ray"].size == (16, 16)
+    assert thumbs["bob ray"].getpixel((8, 8))[2] > 200
+
+
+def test_only_changed_portraits_are_resized(photoDir, tmp_path, monkeypatch):
+    buildAtlas(photoDir, tmp_path)
+    before = set(os.listdir(tmp_path / "Cache"))
+    atlasTime = os.stat(tmp_path / "Atlas.png").st_mtime_ns
+
+    def noPool(*args, **kwargs):
+        raise AssertionError("Unchanged portraits were resized")
+    with monkeypatch.context() as m:
+        m.setattr(Thumbnail_Cache.mp, "Pool", noPool)
+        buildAtlas(photoDir, tmp_path)
+    assert os.stat(tmp_path / "Atlas.png").st_mtime_ns == atlasTime
+
+    writePortrait(photoDir, "bob_ray&rus", (0, 255, 0), (32, 32))
+    thumbs = Thumbnail_Cache.loadAtlas(buildAtlas(photoDir, tmp_path))
+    added = set(os.listdir(tmp_path / "Cache")) - before
+    assert len(added) == 1 and added.pop().endswith("_16.png")
+    assert thumbs["bob ray"].getpixel((8, 8))[1] > 200
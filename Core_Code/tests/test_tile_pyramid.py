@@ -0,0 +1,55 @@
+'''
+@desc:      Tests for the deep zoom output of `Tile_Pyramid`.
+'''
+
+import os
+import pytest
+from PIL import Image
+import Tile_Pyramid
+
+
+def scene(last:tuple = (1.0, 1.0)):
+    return {"nodes": ["ann", "bob", "cat"], "pos": [(0.0, 0.0), (0.0, 1.0), last],
+        "colors": ["#cc0000", "#0000cc", "#00cc00"], "edges": [(0, 1)]}
+
+
+@pytest.fixture
+def rendered(monkeypatch):
+    drawn = []
+    renderTile = Tile_Pyramid.renderTile
+    def countTile(task):
+        drawn.append(task[0])
+        return renderTile(task)
+    monkeypatch.setattr(Tile_Pyramid, "renderTile", countTile)
+    return drawn
+
+
+def build(tmp_path, graph:dict):
+    return Tile_Pyramid.buildPyramid(graph, {}, ofp = str(tmp_path / "Relations"),
+        size = 600, numProcesses = 1)
+
+
+def test_level_sizes_halve_down_to_one_pixel():
+    assert Tile_Pyramid.levelSizes(600) == [1, 2, 3, 5, 10, 19, 38, 75, 150, 300, 600]
+
+
+def test_every_tile_is_drawn_once(tmp_path, rendered):
+    assert build(tmp_path, scene()) == str(tmp_path / "Relations.dzi")
+    # 1 tile on each of the 9 small levels, then 2x2 and 3x3
+    assert len(rendered) == 9 + 4 + 9
+    assert Image.open(tmp_path / "Relations_files" / "10" / "2_2.png").size == (600 - 512, 600 - 512)
+
+    rendered.clear()
+    build(tmp_path, scene())
+    assert rendered == []
+
+
+def test_only_tiles_a_moved_node_reaches_are_drawn_again(tmp_path, rendered):
+    build(tmp_path, scene())
+    rendered.clear()
+
+    build(tmp_path, scene((1.0, 0.9)))
+    deepest = sorted(os.path.relpath(p, str(tmp_path / "Relations_files"))
+        for p in rendered if "/10/" in p)
+    assert 0 < len(deepest) < 9
+    assert "10/0_0.png" not in deepest
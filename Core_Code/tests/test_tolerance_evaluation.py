@@ -0,0 +1,55 @@
+'''
+@desc:      Tests for sweeping match tolerances with `Tolerance_Evaluation`.
+'''
+
+import json
+import pickle
+import numpy as np
+import pytest
+import Main_Model
+import Tolerance_Evaluation
+
+
+@pytest.fixture
+def archive(tmp_path):
+    ann, bob, offset = np.eye(128)[:3]
+    (tmp_path / "Portrait_Bin").mkdir()
+    with open(tmp_path / "Portrait_Bin" / "crew.dat", 'wb') as f:
+        pickle.dump({"ann&usa": ann, "bob&usa": bob}, f)
+
+    # Each photo holds one face at a known distance from its nearest astronaut
+    faces = {"one.jpg": ann + 0.35 * offset, "two.jpg": bob + 0.55 * offset, "three.jpg": ann + 0.45 * offset}
+    cacheFile = str(tmp_path / "Input_Cache.dat")
+    Main_Model.mergeCache(cacheFile, {photo: {"encodings": [face], "locations": [(0, 10, 10, 0)]}
+        for photo, face in faces.items()})
+    return tmp_path, cacheFile
+
+
+def sweep(archive, truth, **kwargs):
+    tmp_path, cacheFile = archive
+    truthFile = tmp_path / "Ground_Truth.json"
+    truthFile.write_text(json.dumps(truth))
+    return Tolerance_Evaluation.evaluateTolerances(str(truthFile), str(tmp_path / "Portrait_Bin"),
+        cacheFile, [0.4, 0.5, 0.6], verbose = False, **kwargs)
+
+
+@pytest.mark.parametrize("exact", [False, True])
+def test_photo_level_sweep(archive, exact):
+    truth = {"one.jpg": ["ann&usa"], "two.jpg": ["bob&usa"], "three.jpg": ["bob&usa"], "gone.jpg": ["ann&usa"]}
+    summary = sweep(archive, truth, exact = exact)
+
+    assert (summary["level"], summary["photos"], summary["faces"], summary["missing"]) == ("photo", 3, 3, 1)
+    assert [(row["tp"], row["fp"], row["fn"]) for row in summary["results"]] == [(1, 0, 2), (1, 1, 2), (2, 1, 1)]
+    assert summary["results"][0]["precision"] == 1.0
+    assert summary["best"]["tolerance"] == 0.6
+    assert summary["best"]["f1"] == pytest.approx(2 / 3, abs = 1e-4)
+
+
+def test_scan_results_are_scored_per_face(archive):
+    # A hand-checked `Scan_Result` json can be used as the ground truth
+    truth = {"one.jpg": [{"ann&usa": [0]}], "two.jpg": [{"bob&usa": [0]}], "three.jpg": [{}]}
+    summary = sweep(archive, truth)
+
+    assert summary["level"] == "face"
+    assert [(row["tp"], row["fp"], row["fn"]) for row in summary["results"]] == [(1, 0, 1), (1, 1, 1), (2, 1, 0)]
+    assert summary["best"]["recall"] == 1.0
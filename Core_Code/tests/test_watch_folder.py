@@ -0,0 +1,36 @@
+'''
+@desc:      Tests for scanning photos as they land with `Watch_Folder`.
+'''
+
+import json
+import os
+from PIL import Image
+import Main_Model
+import Watch_Folder
+
+
+def test_batches_journal_the_cache_and_merge_every_few(tmp_path, monkeypatch):
+    data = tmp_path / "Data"
+    (data / "Portraits").mkdir(parents = True)
+    (data / "Input").mkdir()
+    for i in range(3):
+        Image.new("RGB", (64, 64), "white").save(data / "Input" / "blank_{0}.jpg".format(i))
+
+    merges = []
+    mergeCache = Main_Model.mergeCache
+    monkeypatch.setattr(Main_Model, "mergeCache", lambda *args: merges.append(args) or mergeCache(*args))
+
+    scanned = Watch_Folder.watchFolder(str(data / "Portraits"), str(data / "Input"),
+        str(data / "Temp" / "Portrait_Bin"), 1, str(data / "Scan_Result"),
+        str(data / "Temp" / "Basket_State.dat"), str(data / "rawFrequencies"), str(data / "pairs"),
+        settle = 0, maxBatch = 1, mergeEvery = 2, polling = True, maxBatches = 3, verbose = False)
+
+    assert scanned == 3
+    # Once after the second batch and once when watching stops
+    assert len(merges) == 2
+    cacheFile = str(data / "Temp" / "Input_Cache.dat")
+    assert not os.path.exists(cacheFile + ".journal")
+    assert sorted(Main_Model.loadCache(cacheFile)) == ["blank_0.jpg", "blank_1.jpg", "blank_2.jpg"]
+
+    with open(data / "Scan_Result" / "Input_result.json") as f:
+        assert sorted(json.load(f)) == ["blank_0.jpg", "blank_1.jpg", "blank_2.jpg"]